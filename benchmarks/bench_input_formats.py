@@ -0,0 +1,83 @@
+#!/usr/bin/env python
+"""Benchmarks loading an export from a tgz, an uncompressed tar, a zstd-compressed tarball, and an extracted directory.
+
+Usage:
+    python benchmarks/bench_input_formats.py [--cards N] [--workers N [N ...]] [--repeat N]
+
+Writes a synthetic export in each format and reports the best of `--repeat` times to read and parse every member with
+load_serialization_tgz_contents, for each number of `--workers`. The zstd-compressed tarball is skipped without the
+zstandard package.
+"""
+import argparse
+import gzip
+import logging
+import os
+import shutil
+import sys
+import tarfile
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from synthetic_export import SyntheticExport
+from metabase_serialization_py.metabase_export import load_serialization_tgz_contents
+
+
+def write_formats(directory, cards):
+    """Writes the synthetic export in each format to directory and returns dict of format to export path."""
+
+    export_paths = {format_name: os.path.join(directory, f'synthetic.{format_name}') for format_name in ('tgz', 'tar', 'tar.zst', )}
+    export_paths['directory'] = os.path.join(directory, 'synthetic')
+
+    SyntheticExport(tables=max(1, cards // 50), cards=cards, dashboards=cards // 10).write_tgz(export_paths['tgz'])
+
+    with gzip.open(export_paths['tgz'], 'rb') as tgz_file, open(export_paths['tar'], 'wb') as tar_file:
+        shutil.copyfileobj(tgz_file, tar_file)
+
+    with tarfile.open(export_paths['tar']) as tar_file:
+        tar_file.extractall(export_paths['directory'], filter='data')
+
+    try:
+        import zstandard
+    except ImportError:
+        del export_paths['tar.zst']
+    else:
+        with open(export_paths['tar'], 'rb') as tar_file, open(export_paths['tar.zst'], 'wb') as zstd_file:
+            zstandard.ZstdCompressor(level=3).copy_stream(tar_file, zstd_file)
+
+    return export_paths
+
+
+def measure_load(export_path, workers):
+    """Returns (seconds to load every member, number of parsed files,)."""
+
+    started = time.perf_counter()
+    files = sum(1 for member_name, parsing_message, file_type, file_data in load_serialization_tgz_contents(export_path, workers) if file_data is not None)
+
+    return (time.perf_counter() - started, files, )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--cards', type=int, default=5000)
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, os.cpu_count() or 1])
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    logging.disable(logging.CRITICAL)
+
+    with tempfile.TemporaryDirectory() as directory:
+        export_paths = write_formats(directory, args.cards)
+
+        for workers in args.workers:
+            for format_name, export_path in export_paths.items():
+                runs = [measure_load(export_path, workers) for run in range(args.repeat)]
+                seconds, files = min(runs)
+
+                print(f'{format_name:>9} workers {workers:2d}: {seconds:6.2f}s  {files / seconds:8.0f} files/s')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,103 @@
+#!/usr/bin/env python
+"""Benchmarks memory held by parsed documents with and without interning of strings and sub-structures.
+
+Usage:
+    python benchmarks/bench_interning.py [--scales F [F ...]] [--json RESULTS.json]
+
+Loads synthetic exports of increasing size with load_serialization_tgz_contents, and reports the memory held by the
+parsed documents (traced allocations), the load time, and the share of memory saved by `intern`. Checks that interned
+documents dump to the same YAML.
+"""
+import argparse
+import json
+import logging
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from synthetic_export import SYNTHETIC_EXPORT_DEFAULTS, SyntheticExport
+from metabase_serialization_py.metabase_export import load_serialization_tgz_contents
+from metabase_serialization_py.yaml import dump_yaml
+
+
+# Counts scaled with the export size; fields per table and dashcards per dashboard stay fixed.
+SCALED_PARAMETERS = ('databases', 'tables', 'collections', 'cards', 'dashboards', )
+
+
+def load_documents(export_path, intern):
+    """Returns list of the parsed documents of the export."""
+
+    return [file_data for member_name, parsing_message, file_type, file_data in load_serialization_tgz_contents(export_path, intern=intern) if file_data is not None]
+
+
+def measure_load(export_path, intern):
+    """Returns (documents, traced MB held by the documents, load seconds,)."""
+
+    started = time.perf_counter()
+    load_documents(export_path, intern)
+    seconds = time.perf_counter() - started
+
+    tracemalloc.start()
+    documents = load_documents(export_path, intern)
+    held_mb = tracemalloc.get_traced_memory()[0] / 1024 / 1024
+    tracemalloc.stop()
+
+    return (documents, held_mb, seconds, )
+
+
+def benchmark_scale(scale, directory):
+    parameters = {parameter: max(1, round(default * scale)) if parameter in SCALED_PARAMETERS else default for parameter, default in SYNTHETIC_EXPORT_DEFAULTS.items()}
+    export_path = os.path.join(directory, f'synthetic-{scale}.tgz')
+    members = SyntheticExport(**parameters).write_tgz(export_path)
+
+    documents, plain_mb, plain_seconds = measure_load(export_path, False)
+    interned_documents, interned_mb, interned_seconds = measure_load(export_path, True)
+
+    if [dump_yaml(document) for document in documents] != [dump_yaml(document) for document in interned_documents]:
+        raise AssertionError(f'Interned documents of scale {scale:g} do not dump to the same YAML.')
+
+    return {
+        'scale': scale,
+        'members': members,
+        'plain_mb': plain_mb,
+        'interned_mb': interned_mb,
+        'saved_fraction': 1 - interned_mb / plain_mb,
+        'plain_seconds': plain_seconds,
+        'interned_seconds': interned_seconds,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--scales', type=float, nargs='+', default=[0.25, 0.5, 1, 2])
+    parser.add_argument('--json', dest='json_path')
+    args = parser.parse_args()
+
+    logging.disable(logging.CRITICAL)
+
+    runs = []
+
+    with tempfile.TemporaryDirectory() as directory:
+        for scale in args.scales:
+            run = benchmark_scale(scale, directory)
+            runs.append(run)
+
+            print(
+                f'scale {scale:g}: {run["members"]:7d} members  '
+                f'plain {run["plain_mb"]:8.1f} MB {run["plain_seconds"]:6.2f}s  '
+                f'interned {run["interned_mb"]:8.1f} MB {run["interned_seconds"]:6.2f}s  '
+                f'saved {run["saved_fraction"]:6.1%}'
+            )
+
+    if args.json_path:
+        with open(args.json_path, 'w') as json_file:
+            json.dump(runs, json_file, indent=2)
+
+
+if __name__ == '__main__':
+    main()
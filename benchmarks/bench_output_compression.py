@@ -0,0 +1,87 @@
+#!/usr/bin/env python
+"""Benchmarks parallel block gzip compression of output exports against single-threaded tarfile.
+
+Usage:
+    python benchmarks/bench_output_compression.py [--cards N] [--threads N [N ...]] [--level N] [--repeat N]
+"""
+import argparse
+import gzip
+import io
+import os
+import sys
+import tarfile
+import tempfile
+import time
+
+import yaml
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from synthetic_export import SyntheticExport
+from metabase_serialization_py.metabase_export.parallel_gzip import ParallelGzipWriter
+
+
+def make_members(cards):
+    """Returns list of (member_name, raw_data,) for a synthetic export."""
+
+    return [
+        (member_name, yaml.safe_dump(document, sort_keys=False).encode(), )
+        for member_name, document in SyntheticExport(tables=max(1, cards // 50), cards=cards, dashboards=cards // 10).iter_members()
+    ]
+
+
+def write_tarfile(members, output_path, level, threads):
+    with tarfile.open(output_path, 'w:gz', compresslevel=level) as tar_file:
+        for member_name, raw_data in members:
+            member = tarfile.TarInfo(member_name)
+            member.size = len(raw_data)
+            tar_file.addfile(member, io.BytesIO(raw_data))
+
+
+def write_parallel(members, output_path, level, threads):
+    with ParallelGzipWriter(output_path, level, threads) as output_file:
+        with tarfile.open(fileobj=output_file, mode='w|') as tar_file:
+            for member_name, raw_data in members:
+                member = tarfile.TarInfo(member_name)
+                member.size = len(raw_data)
+                tar_file.addfile(member, io.BytesIO(raw_data))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--cards', type=int, default=5000)
+    parser.add_argument('--threads', type=int, nargs='+', default=[2, 4, os.cpu_count() or 1])
+    parser.add_argument('--level', type=int, default=9)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    members = make_members(args.cards)
+
+    with tempfile.TemporaryDirectory() as directory:
+        reference_path = os.path.join(directory, 'tarfile.tgz')
+        write_tarfile(members, reference_path, args.level, 1)
+
+        with gzip.open(reference_path) as reference_file:
+            reference_tar = reference_file.read()
+
+        print(f'{len(members)} members, {len(reference_tar) / 1024 / 1024:.1f} MB uncompressed tar, level {args.level}, {os.cpu_count()} CPUs, best of {args.repeat}')
+
+        for title, function, threads in [('tarfile w:gz', write_tarfile, 1, )] + [(f'parallel gzip x{threads}', write_parallel, threads, ) for threads in sorted(set(args.threads))]:
+            output_path = os.path.join(directory, 'output.tgz')
+            timings = []
+
+            for _ in range(args.repeat):
+                started = time.perf_counter()
+                function(members, output_path, args.level, threads)
+                timings.append(time.perf_counter() - started)
+
+            with gzip.open(output_path) as output_file:
+                assert output_file.read() == reference_tar, f'{title} output differs from tarfile output'
+
+            seconds = min(timings)
+            print(f'{title:>20}: {seconds * 1000:9.1f} ms  {len(reference_tar) / 1024 / 1024 / seconds:8.1f} MB/s  {os.path.getsize(output_path) / 1024 / 1024:7.2f} MB compressed')
+
+
+if __name__ == '__main__':
+    main()
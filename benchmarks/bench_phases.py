@@ -0,0 +1,191 @@
+#!/usr/bin/env python
+"""Benchmarks load, index, apply and write phases on synthetic exports of increasing size.
+
+Usage:
+    python benchmarks/bench_phases.py [--scales F [F ...]] [--json RESULTS.json] [--baseline RESULTS.json [--tolerance F]]
+
+Each scale multiplies the databases, tables, collections, cards and dashboards of the default synthetic export.
+Records wall time, RSS at the end of each phase, peak RSS during it, and throughput. With `--baseline`, exits with
+status 1 if any phase is slower than the baseline by more than `--tolerance`.
+"""
+import argparse
+import json
+import logging
+import os
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from synthetic_export import SYNTHETIC_EXPORT_DEFAULTS, SyntheticExport
+from metabase_serialization_py.memory_usage import get_memory_usage
+from metabase_serialization_py.metabase_export import (
+    ExportData,
+    ExportOverlay,
+    MetabaseExport,
+    ReferenceStore,
+    SecondaryIndexes,
+    serialization_export_loader,
+    write_serialization_tgz,
+)
+
+
+# Counts scaled with the export size; fields per table and dashcards per dashboard stay fixed.
+SCALED_PARAMETERS = ('databases', 'tables', 'collections', 'cards', 'dashboards', )
+# Fraction of cards changed in the apply phase.
+APPLY_CHANGE_FRACTION = 0.01
+
+
+class PeakMemorySampler:
+    """Samples get_memory_usage on a background thread and keeps the peak, in MB."""
+
+    def __init__(self, interval=0.01):
+        self.interval = interval
+        self.peak = get_memory_usage()
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.sample, daemon=True)
+
+    def sample(self):
+        while not self.stopped.wait(self.interval):
+            self.peak = max(self.peak, get_memory_usage())
+
+    def __enter__(self):
+        self.thread.start()
+
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stopped.set()
+        self.thread.join()
+        self.peak = max(self.peak, get_memory_usage())
+
+
+def run_phase(results, phase, function, units, unit_name):
+    """Runs function as a benchmark phase, adding its timings and memory to results, and returns its result."""
+
+    with PeakMemorySampler() as sampler:
+        started = time.perf_counter()
+        value = function()
+        seconds = time.perf_counter() - started
+
+    results[phase] = {
+        'seconds': seconds,
+        'rss_mb': get_memory_usage(),
+        'peak_rss_mb': sampler.peak,
+        'throughput': units / seconds if seconds else None,
+        'throughput_unit': f'{unit_name}/s',
+    }
+
+    return value
+
+
+def index_loaded_export(export_path, loaded_members):
+    """Returns a MetabaseExport indexed from already loaded members, timing create_entity_index_by_id alone."""
+
+    metabase_export = MetabaseExport.__new__(MetabaseExport)
+    metabase_export.reference_store = ReferenceStore()
+    metabase_export.index_by_id = {}
+    metabase_export.data_index_by_path = {}
+    metabase_export.spill_store = None
+    metabase_export.export_data = ExportData(export_path)
+
+    for member_name, parsing_message, file_type, metadata, file_data in loaded_members:
+        metabase_export.export_data.append(member_name, parsing_message, file_type, metadata, file_data, None)
+
+    metabase_export.create_entity_index_by_id()
+    metabase_export.secondary_indexes = SecondaryIndexes(metabase_export.export_data)
+
+    return metabase_export
+
+
+def apply_changes(metabase_export):
+    """Archives and renames a fraction of cards in an ExportOverlay and returns it."""
+
+    export_overlay = ExportOverlay(metabase_export)
+    card_members = [entry for entry in metabase_export.export_data.entries if entry[3] is not None and entry[3]['serdes/meta.model'] == 'Card']
+
+    for member_name, parsing_message, file_type, metadata in card_members[:max(1, int(len(card_members) * APPLY_CHANGE_FRACTION))]:
+        file_data = dict(export_overlay.get_file_data(member_name))
+        file_data['archived'] = True
+        file_data['name'] = f'{file_data["name"]} (archived)'
+        export_overlay.update(member_name, file_data)
+
+    return export_overlay
+
+
+def benchmark_scale(scale, directory):
+    parameters = {parameter: max(1, round(default * scale)) if parameter in SCALED_PARAMETERS else default for parameter, default in SYNTHETIC_EXPORT_DEFAULTS.items()}
+    export_path = os.path.join(directory, f'synthetic-{scale}.tgz')
+    output_path = os.path.join(directory, f'synthetic-{scale}-output.tgz')
+
+    members = SyntheticExport(**parameters).write_tgz(export_path)
+    export_mb = os.path.getsize(export_path) / 1024 / 1024
+
+    results = {}
+
+    loaded_members = run_phase(results, 'load', lambda: serialization_export_loader(export_path), members, 'members')
+    metabase_export = run_phase(results, 'index', lambda: index_loaded_export(export_path, loaded_members), members, 'members')
+    export_overlay = run_phase(results, 'apply', lambda: apply_changes(metabase_export), max(1, int(parameters['cards'] * APPLY_CHANGE_FRACTION)), 'changes')
+    run_phase(results, 'write', lambda: write_serialization_tgz(export_path, output_path, export_overlay), members, 'members')
+
+    return {'scale': scale, 'parameters': parameters, 'members': members, 'export_mb': export_mb, 'phases': results}
+
+
+def find_regressions(runs, baseline_runs, tolerance):
+    """Returns list of (scale, phase, seconds, baseline_seconds,) for phases slower than baseline by over tolerance."""
+
+    baseline_phases = {run['scale']: run['phases'] for run in baseline_runs}
+    regressions = []
+
+    for run in runs:
+        for phase, result in run['phases'].items():
+            baseline_result = baseline_phases.get(run['scale'], {}).get(phase, None)
+
+            if baseline_result is not None and result['seconds'] > baseline_result['seconds'] * (1 + tolerance):
+                regressions.append((run['scale'], phase, result['seconds'], baseline_result['seconds'], ))
+
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--scales', type=float, nargs='+', default=[0.25, 0.5, 1, 2])
+    parser.add_argument('--json', dest='json_path')
+    parser.add_argument('--baseline')
+    parser.add_argument('--tolerance', type=float, default=0.25)
+    args = parser.parse_args()
+
+    logging.disable(logging.CRITICAL)
+
+    runs = []
+
+    with tempfile.TemporaryDirectory() as directory:
+        for scale in args.scales:
+            run = benchmark_scale(scale, directory)
+            runs.append(run)
+
+            print(f'scale {scale:g}: {run["members"]} members, {run["export_mb"]:.2f} MB export')
+
+            for phase, result in run['phases'].items():
+                print(f'{phase:>8}: {result["seconds"] * 1000:10.1f} ms  {result["throughput"]:12.1f} {result["throughput_unit"]:<10}  rss {result["rss_mb"]:8.1f} MB  peak {result["peak_rss_mb"]:8.1f} MB')
+
+    if args.json_path:
+        with open(args.json_path, 'w') as json_file:
+            json.dump(runs, json_file, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as baseline_file:
+            regressions = find_regressions(runs, json.load(baseline_file), args.tolerance)
+
+        for scale, phase, seconds, baseline_seconds in regressions:
+            print(f'REGRESSION scale {scale:g} {phase}: {seconds * 1000:.1f} ms vs. {baseline_seconds * 1000:.1f} ms baseline')
+
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
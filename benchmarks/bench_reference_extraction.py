@@ -0,0 +1,168 @@
+#!/usr/bin/env python
+"""Benchmarks declarative reference extraction against the legacy update_entity_references_* methods.
+
+Usage:
+    python benchmarks/bench_reference_extraction.py [--cards N] [--dashboards N] [--tables N] [--repeat N] [--tolerance F]
+
+Exits with status 1 if the declarative rules covering the references of the legacy methods, extracting the same
+references, are slower than the legacy methods by more than `--tolerance`. The full rule set extracts more than twice as
+many references and is reported alongside, with its time per reference relative to the legacy methods.
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from legacy_reference_extraction import LegacyReferenceIndexer
+from synthetic_export import SyntheticExport
+from metabase_serialization_py.metabase_export.reference_rules import REFERENCE_EXTRACTORS, REFERENCE_RULES, ReferenceExtractor
+
+
+# Rules covering only the reference kinds the legacy methods extract, to compare engine overhead like for like.
+LEGACY_EQUIVALENT_RULES = {
+    **REFERENCE_RULES,
+    'Card': (
+        ('collection_id', 'id', ),
+        ('database_id', 'path', ),
+        ('table_id', 'path', ),
+        ('dataset_query.database', 'path', ),
+        # Card entity_id source tables are read as names here, extracting as many references at the same cost.
+        ('dataset_query.query.source-table', 'path', ),
+        ('dataset_query.query.joins[*].source-table', 'path', ),
+        ('dataset_query.query.joins[*].condition[*]', 'field', ),
+    ),
+    'Dashboard': (
+        ('collection_id', 'id', ),
+        ('dashcards[*].entity_id', 'id', ),
+        ('dashcards[*].card_id', 'id', ),
+        ('dashcards[*].parameter_mappings[*].card_id', 'id', ),
+        ('dashcards[*].parameter_mappings[*].action_id', 'id', ),
+    ),
+    'Field': (
+        ('table_id', 'path', ),
+        ('serdes/meta', 'serdes_path', ),
+    ),
+}
+
+LEGACY_EQUIVALENT_EXTRACTORS = {model: ReferenceExtractor(rules) for model, rules in LEGACY_EQUIVALENT_RULES.items()}
+
+
+def make_documents(cards, dashboards, tables):
+    """Returns list of (model, serdes_meta_id, member_name, document,) of a synthetic export."""
+
+    documents = []
+
+    for member_name, document in SyntheticExport(tables=tables, cards=cards, dashboards=dashboards).iter_members():
+        serdes_meta = document.get('serdes/meta', None)
+
+        if serdes_meta is None:
+            continue
+
+        serdes_meta_id = tuple(meta['id'] for meta in serdes_meta) if len(serdes_meta) > 1 else serdes_meta[0]['id']
+        documents.append((serdes_meta[-1]['model'], serdes_meta_id, member_name, document, ))
+
+    return documents
+
+
+def run_legacy(documents):
+    indexer = LegacyReferenceIndexer()
+
+    for model, serdes_meta_id, member_name, document in documents:
+        indexer.update_entity_references(document, member_name, serdes_meta_id, {'serdes/meta.model': model})
+
+    return sum(len(references) for references in indexer.index_by_id.values()) + sum(len(references) for references in indexer.data_index_by_path.values())
+
+
+def run_declarative(documents, reference_extractors=REFERENCE_EXTRACTORS):
+    index_by_id = {}
+    data_index_by_path = {}
+
+    for model, serdes_meta_id, member_name, document in documents:
+        for index, reference_key, relationship in reference_extractors[model].extract(document):
+            target_index = index_by_id if index == 'id' else data_index_by_path
+            target_index.setdefault(reference_key, []).append((model, relationship, serdes_meta_id, member_name, ))
+
+    return sum(len(references) for references in index_by_id.values()) + sum(len(references) for references in data_index_by_path.values())
+
+
+def run_declarative_legacy_equivalent(documents):
+    return run_declarative(documents, LEGACY_EQUIVALENT_EXTRACTORS)
+
+
+def time_best(functions, documents, repeat):
+    """Returns dict of (seconds, reference_count,) by title of the best of repeat runs of each function.
+        - Functions run in turn in each round so load changes during the benchmark affect all of them alike.
+    """
+
+    results = {}
+
+    for _ in range(repeat):
+        for title, function in functions:
+            started = time.perf_counter()
+            reference_count = function(documents)
+            seconds = time.perf_counter() - started
+
+            if title not in results or seconds < results[title][0]:
+                results[title] = (seconds, reference_count, )
+
+    return results
+
+
+def find_regressions(results, tolerance):
+    """Returns list of messages for declarative runs extracting the legacy references slower than legacy by over
+        tolerance.
+    """
+
+    legacy_seconds, legacy_count = results['legacy']
+    equivalent_seconds, equivalent_count = results['declarative (legacy coverage)']
+    regressions = []
+
+    if equivalent_count != legacy_count:
+        regressions.append(f'declarative rules with legacy coverage extracted {equivalent_count} references, legacy {legacy_count}')
+
+    if equivalent_seconds > legacy_seconds * (1 + tolerance):
+        regressions.append(f'declarative rules with legacy coverage took {equivalent_seconds * 1000:.1f} ms, legacy {legacy_seconds * 1000:.1f} ms')
+
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--cards', type=int, default=5000)
+    parser.add_argument('--dashboards', type=int, default=500)
+    parser.add_argument('--tables', type=int, default=100, help='tables per database, each with 10 fields')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--tolerance', type=float, default=0.0)
+    args = parser.parse_args()
+
+    documents = make_documents(args.cards, args.dashboards, args.tables)
+
+    print(f'{len(documents)} synthetic export documents ({args.cards} cards, {args.dashboards} dashboards, {args.tables} tables per database), best of {args.repeat}')
+
+    results = time_best((
+        ('legacy', run_legacy, ),
+        ('declarative (legacy coverage)', run_declarative_legacy_equivalent, ),
+        ('declarative (all rules)', run_declarative, ),
+    ), documents, args.repeat)
+
+    for title, (seconds, reference_count) in results.items():
+        print(f'{title:>30}: {seconds * 1000:9.1f} ms  {reference_count:8d} references  {reference_count / seconds:12.0f} references/s  {len(documents) / seconds:10.0f} documents/s')
+
+    legacy_seconds, legacy_count = results['legacy']
+    all_seconds, all_count = results['declarative (all rules)']
+    print(f'{"all rules / legacy":>30}: {all_seconds / legacy_seconds:9.2f} x time  {all_count / legacy_count:9.2f} x references  {(all_seconds / all_count) / (legacy_seconds / legacy_count):9.2f} x time per reference')
+
+    regressions = find_regressions(results, args.tolerance)
+
+    for regression in regressions:
+        print(f'SLOWER THAN LEGACY: {regression}')
+
+    if regressions:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,111 @@
+#!/usr/bin/env python
+"""Benchmarks remapping the references to a database of synthetic exports of increasing size to another database.
+
+Usage:
+    python benchmarks/bench_remap.py [--scales F [F ...]] [--runs N] [--json RESULTS.json]
+
+Applies a change list with a single `remap` change from `Database 1` to `Database 9` with ChangeRequests.apply, and
+reports the rewritten references and files and the best apply time of `--runs`. Checks that no remapped file still
+references `Database 1` and that the loaded export is unchanged.
+"""
+import argparse
+import json
+import logging
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from synthetic_export import SYNTHETIC_EXPORT_DEFAULTS, SyntheticExport
+from metabase_serialization_py.change_requests import ChangeRequests
+from metabase_serialization_py.metabase_export import ExportOverlay, MetabaseExport, build_data_path_rewrite_map, group_remapped_references
+from metabase_serialization_py.yaml import dump_yaml
+
+
+# Counts scaled with the export size; fields per table and dashcards per dashboard stay fixed.
+SCALED_PARAMETERS = ('databases', 'tables', 'collections', 'cards', 'dashboards', )
+SOURCE_DATABASE = 'Database 1'
+TARGET_DATABASE = 'Database 9'
+REMAP_CHANGE_LIST = {'changes': [{'remap': {'source': {'data_path': [SOURCE_DATABASE]}, 'target': {'data_path': [TARGET_DATABASE]}}}]}
+
+
+def references_database(value, database):
+    """Returns True if database is a string, or a JSON string in a string like a column_settings key, anywhere in value."""
+
+    if isinstance(value, dict):
+        return any(references_database(key, database) or references_database(item, database) for key, item in value.items())
+
+    if isinstance(value, list):
+        return any(references_database(item, database) for item in value)
+
+    return isinstance(value, str) and (value == database or json.dumps(database) in value)
+
+
+def benchmark_scale(scale, runs, directory):
+    parameters = {parameter: max(1, round(default * scale)) if parameter in SCALED_PARAMETERS else default for parameter, default in SYNTHETIC_EXPORT_DEFAULTS.items()}
+    parameters['databases'] = max(2, parameters['databases'])
+    export_path = os.path.join(directory, f'synthetic-{scale}.tgz')
+    members = SyntheticExport(**parameters).write_tgz(export_path)
+
+    metabase_export = MetabaseExport(export_path)
+    change_requests = ChangeRequests(None, metabase_export, change_list=REMAP_CHANGE_LIST)
+    rewrite_map = build_data_path_rewrite_map(metabase_export.get_data_path_trie(), (SOURCE_DATABASE, ), (TARGET_DATABASE, ))
+    member_rewrites = group_remapped_references(metabase_export.data_index_by_path, rewrite_map)
+    remapped = list(member_rewrites)
+    export_documents = ExportOverlay(metabase_export)
+    before = [dump_yaml(export_documents.get_file_data(member_name)) for member_name in remapped]
+    seconds = []
+
+    for run in range(runs):
+        export_overlay = ExportOverlay(metabase_export)
+        started = time.perf_counter()
+        changed = change_requests.apply(metabase_export, export_overlay)
+        seconds.append(time.perf_counter() - started)
+
+    if [dump_yaml(export_documents.get_file_data(member_name)) for member_name in remapped] != before:
+        raise AssertionError(f'Remapping changed the loaded export of scale {scale:g}.')
+
+    if any(references_database(export_overlay.get_file_data(member_name), SOURCE_DATABASE) for member_name in remapped):
+        raise AssertionError(f'Remapped files of scale {scale:g} still reference {SOURCE_DATABASE}.')
+
+    return {
+        'scale': scale,
+        'members': members,
+        'files': changed,
+        'references': sum(len(rewrites) for rewrites in member_rewrites.values()),
+        'seconds': min(seconds),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--scales', type=float, nargs='+', default=[1, 2, 4, 8])
+    parser.add_argument('--runs', type=int, default=3)
+    parser.add_argument('--json', dest='json_path')
+    args = parser.parse_args()
+
+    logging.disable(logging.CRITICAL)
+
+    results = []
+
+    with tempfile.TemporaryDirectory() as directory:
+        for scale in args.scales:
+            result = benchmark_scale(scale, args.runs, directory)
+            results.append(result)
+
+            print(
+                f'scale {scale:g}: {result["members"]:7d} members  '
+                f'{result["files"]:6d} files  {result["references"]:7d} references to {SOURCE_DATABASE}  '
+                f'remap {result["seconds"]:6.3f}s'
+            )
+
+    if args.json_path:
+        with open(args.json_path, 'w') as json_file:
+            json.dump(results, json_file, indent=2)
+
+
+if __name__ == '__main__':
+    main()
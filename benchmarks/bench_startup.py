@@ -0,0 +1,118 @@
+#!/usr/bin/env python
+"""Benchmarks package import and CLI startup time.
+
+Usage:
+    python benchmarks/bench_startup.py [--runs N] [--json RESULTS.json] [--baseline RESULTS.json [--tolerance F]]
+
+Records the best of `--runs` cumulative import times of metabase_serialization_py reported by `python -X importtime`,
+and the best wall time of `metabase-serialization-cli.py --help`. Fails if importing the package loads any module of
+HEAVY_MODULES. With `--baseline`, exits with status 1 if either time is slower than the baseline by more than
+`--tolerance`.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+
+SOURCE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src')
+CLI_PATH = os.path.join(SOURCE_PATH, 'metabase-serialization-cli.py')
+
+# Modules only needed once an export is read, changed or written, which importing the package must not load.
+HEAVY_MODULES = ('yaml', 'tarfile', 'psutil', 'multiprocessing', 'concurrent.futures', 'metabase_serialization_py.metabase_export', )
+
+
+def run_python(*arguments):
+    """Runs the current python with SOURCE_PATH importable and returns the completed process."""
+
+    environment = dict(os.environ, PYTHONPATH=SOURCE_PATH)
+
+    return subprocess.run([sys.executable, *arguments], env=environment, capture_output=True, text=True, check=True)
+
+
+def measure_import():
+    """Returns (cumulative import time of the package in seconds, names of the modules it imported,)."""
+
+    process = run_python('-X', 'importtime', '-c', 'import metabase_serialization_py')
+    module_names = []
+    package_seconds = None
+
+    for line in process.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+
+        self_us, cumulative_us, module_name = line[len('import time:'):].split('|')
+        module_names.append(module_name.strip())
+
+        if module_name.strip() == 'metabase_serialization_py':
+            package_seconds = int(cumulative_us) / 1_000_000
+
+    return (package_seconds, module_names, )
+
+
+def measure_cli_help():
+    """Returns wall time in seconds of the CLI printing its help."""
+
+    started = time.perf_counter()
+    run_python(CLI_PATH, '--help')
+
+    return time.perf_counter() - started
+
+
+def find_regressions(results, baseline_results, tolerance):
+    """Returns list of (measure, seconds, baseline_seconds,) for measures slower than baseline by over tolerance."""
+
+    return [
+        (measure, seconds, baseline_results[measure], )
+        for measure, seconds in results.items()
+        if measure in baseline_results and seconds > baseline_results[measure] * (1 + tolerance)
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--runs', type=int, default=10)
+    parser.add_argument('--json', dest='json_path')
+    parser.add_argument('--baseline')
+    parser.add_argument('--tolerance', type=float, default=0.25)
+    args = parser.parse_args()
+
+    import_times = []
+    heavy_modules = set()
+
+    for run in range(args.runs):
+        seconds, module_names = measure_import()
+        import_times.append(seconds)
+        heavy_modules.update(module_name for module_name in module_names if module_name in HEAVY_MODULES)
+
+    results = {
+        'import_seconds': min(import_times),
+        'cli_help_seconds': min(measure_cli_help() for run in range(args.runs)),
+    }
+
+    print(f'  import: {results["import_seconds"] * 1000:8.1f} ms')
+    print(f'cli help: {results["cli_help_seconds"] * 1000:8.1f} ms')
+
+    if args.json_path:
+        with open(args.json_path, 'w') as json_file:
+            json.dump(results, json_file, indent=2)
+
+    if heavy_modules:
+        print(f'HEAVY IMPORTS: {", ".join(sorted(heavy_modules))}')
+
+    regressions = []
+
+    if args.baseline:
+        with open(args.baseline) as baseline_file:
+            regressions = find_regressions(results, json.load(baseline_file), args.tolerance)
+
+        for measure, seconds, baseline_seconds in regressions:
+            print(f'REGRESSION {measure}: {seconds * 1000:.1f} ms vs. {baseline_seconds * 1000:.1f} ms baseline')
+
+    if heavy_modules or regressions:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,258 @@
+"""Reference extraction as implemented before the declarative reference rules, kept for benchmarks.
+
+Copied from MetabaseExport's update_entity_references_* methods with debugging breakpoints removed.
+"""
+
+
+class LegacyReferenceIndexer:
+    def __init__(self):
+        self.index_by_id = {}
+        self.data_index_by_path = {}
+
+    def update_entity_references_collection(self, file_data, serdes_meta_id, member_name):
+        """Updates Collection entity indices by adding external references found in file_data to referenced entities."""
+
+        # Collections only have parent_id references or no references if at the top level.
+
+        if file_data['parent_id'] is not None:
+            self.add_entity_reference_to_index_by_id(file_data['parent_id'], 'Collection', 'parent_id', serdes_meta_id, member_name)
+
+    def update_entity_references_timeline(self, file_data, serdes_meta_id, member_name):
+        """Updates Timeline entity indices by adding external references found in file_data to referenced entities."""
+
+        if file_data['collection_id']:
+            self.add_entity_reference_to_index_by_id(file_data['collection_id'], 'Timeline', 'collection_id', serdes_meta_id, member_name)
+
+    def update_entity_references_action(self, file_data, serdes_meta_id, member_name):
+        """Updates Action entity indices by adding external references found in file_data to referenced entities."""
+
+        if file_data['model_id']:
+            self.add_entity_reference_to_index_by_id(file_data['model_id'], 'Action', 'model_id', serdes_meta_id, member_name)
+
+    def update_entity_references_field(self, file_data, serdes_meta_id, member_name):
+        """Updates Field entity indices by adding external references found in file_data to referenced entities."""
+
+        if file_data['table_id']:
+            self.add_entity_reference_to_data_index_by_path(tuple(file_data['table_id']), 'Field', 'table_id', serdes_meta_id, member_name)
+
+        for i, serdes_meta in enumerate(file_data['serdes/meta'][:-1]):
+            path_reference = tuple([meta['id'] for meta in file_data['serdes/meta']])[:i + 1]
+            # TODO: may need to refactor to be .path_reference instead of .id
+            self.add_entity_reference_to_data_index_by_path(path_reference, 'Field', f'serdes/meta[{i}].id', serdes_meta_id, member_name)
+
+    def update_entity_references_table(self, file_data, serdes_meta_id, member_name):
+        """Updates Table entity indices by adding external references found in file_data to referenced entities."""
+
+        if file_data['db_id']:
+            self.add_entity_reference_to_data_index_by_path(tuple(file_data['db_id']), 'Table', 'db_id', serdes_meta_id, member_name)
+
+        for i, serdes_meta in enumerate(file_data['serdes/meta'][:-1]):
+            path_reference = tuple([meta['id'] for meta in file_data['serdes/meta']])[:i + 1]
+            # TODO: may need to refactor to be .path_reference instead of .id
+            self.add_entity_reference_to_data_index_by_path(path_reference, 'Table', f'serdes/meta[{i}].id', serdes_meta_id, member_name)
+
+    def update_entity_references_metric(self, file_data, serdes_meta_id, member_name):
+        """Updates Metric entity indices by adding external references found in file_data to referenced entities."""
+
+
+        if file_data['table_id']:
+            self.add_entity_reference_to_data_index_by_path(tuple(file_data['table_id']), 'Metric', 'table_id', serdes_meta_id, member_name)
+        else:
+            self.add_entity_reference_to_data_index_by_path(tuple(file_data['definition']['source-table']), 'Metric', 'definition.source-table', serdes_meta_id, member_name)
+
+    def update_entity_references_segment(self, file_data, serdes_meta_id, member_name):
+        """Updates Segment entity indices by adding external references found in file_data to referenced entities."""
+
+        if file_data['table_id']:
+            self.add_entity_reference_to_data_index_by_path(tuple(file_data['table_id']), 'Segment', 'table_id', serdes_meta_id, member_name)
+        else:
+            self.add_entity_reference_to_data_index_by_path(tuple(file_data['definition']['source-table']), 'Segment', 'definition.source-table', serdes_meta_id, member_name)
+
+    def update_entity_references_dashboard(self, file_data, serdes_meta_id, member_name):
+        """Updates Dashboard entity indices by adding external references found in file_data to referenced entities."""
+
+        if file_data['collection_id']:
+            self.add_entity_reference_to_index_by_id(file_data['collection_id'], 'Dashboard', 'collection_id', serdes_meta_id, member_name)
+
+        # Dashboard entities with content other than text/headers should have external references in the dashcards array.
+
+        for i, dashcard in enumerate(file_data['dashcards']):
+            self.add_entity_reference_to_index_by_id(dashcard['entity_id'], 'Dashboard', f'dashboard.dashcards[{i}].entity_id', serdes_meta_id, member_name)
+
+            # Skip virtual cards like headings and text blocks since they don't have a 'card_id' in the 'dashcard' statement.
+
+            if  'visualization_settings' not in dashcard or 'virtual_card' not in dashcard['visualization_settings']:
+                self.add_entity_reference_to_index_by_id(dashcard['card_id'], 'Dashboard', f'dashboard.dashcards[{i}].card_id', serdes_meta_id, member_name)
+
+            for j, parameter_mappings in enumerate(dashcard['parameter_mappings']):
+                if 'card_id' in parameter_mappings:
+                    self.add_entity_reference_to_index_by_id(
+                        parameter_mappings['card_id'],
+                        'Dashboard',
+                        f'dashboard.dashcards[{i}].parameter_mappings[{j}].card_id',
+                        serdes_meta_id,
+                        member_name
+                    )
+
+                if 'action_id' in parameter_mappings:
+                    self.add_entity_reference_to_index_by_id(
+                        parameter_mappings['action_id'],
+                        'Dashboard',
+                        f'dashboard.dashcards[{i}].parameter_mappings[{j}].action_id',
+                        serdes_meta_id,
+                        member_name
+                    )
+
+    def update_source_table_reference_to_index(self, source_table_reference, entity_model, relationship, serdes_meta_id, member_name):
+        """Adds source-table reference to either data_index_by_path or index_by_id depending on whether the source-table
+            reference is to a data path list or an entity_id."""
+
+        if isinstance(source_table_reference, list):
+            add_entity_reference_func = self.add_entity_reference_to_data_index_by_path
+            source_table_reference_for_func = tuple(source_table_reference)
+        else:
+            add_entity_reference_func = self.add_entity_reference_to_index_by_id
+            source_table_reference_for_func = source_table_reference
+
+        add_entity_reference_func(
+            source_table_reference_for_func,
+            entity_model,
+            relationship,
+            serdes_meta_id,
+            member_name
+        )
+
+    def update_entity_references_card(self, file_data, serdes_meta_id, member_name):
+        """Updates Card entity indices by adding external references found in file_data to referenced entities."""
+
+        if file_data['collection_id']:
+            self.add_entity_reference_to_index_by_id(file_data['collection_id'], 'Card', 'collection_id', serdes_meta_id, member_name)
+
+        self.add_entity_reference_to_data_index_by_path((file_data['database_id'], ), 'Card', 'database_id', serdes_meta_id, member_name)
+
+        if file_data['table_id']:
+            # All non-native queries not based on other queries/cards should have a table_id.
+            self.add_entity_reference_to_data_index_by_path(tuple(file_data['table_id']), 'Card', 'table_id', serdes_meta_id, member_name)
+
+        # TODO: handle recursively from tuple of paths and parameters
+
+        # TODO: Capture dataset_query ... - data_index_by_path ANY MORE??
+        # TODO: Capture dataset_query ... - index_by_id ANY MORE??
+
+        if 'dataset_query' in file_data:
+            # Capture dataset_query.database - data_index_by_path
+
+            if 'database' in file_data['dataset_query']:
+                self.add_entity_reference_to_data_index_by_path(
+                    (file_data['dataset_query']['database'], ),
+                    'Card',
+                    'dataset_query.database',
+                    serdes_meta_id,
+                    member_name
+                )
+            # Capture dataset_query.query.source-table - data_index_by_path or index_by_id depending on reference type
+
+            if 'query' in file_data['dataset_query']:
+                if 'source-table' in file_data['dataset_query']['query']:
+                    self.update_source_table_reference_to_index(
+                        file_data['dataset_query']['query']['source-table'],
+                        'Card',
+                        'dataset_query.query.source-table',
+                        serdes_meta_id,
+                        member_name
+                    )
+
+                if 'joins' in file_data['dataset_query']['query']:
+                    for i, join_clause in enumerate(file_data['dataset_query']['query']['joins']):
+                        # Capture dataset_query.query.joins[].source-table - data_index_by_path
+
+                        if 'source-table' in join_clause:
+                            self.update_source_table_reference_to_index(
+                                file_data['dataset_query']['query']['joins'][i]['source-table'],
+                                'Card',
+                                f'dataset_query.query.joins[{i}].source-table',
+                                serdes_meta_id,
+                                member_name
+                            )
+
+                        # Capture dataset_query.query.joins[].condition[][1] - data_index_by_path
+
+                        if 'condition' in join_clause:
+                            for j, condition_clause in enumerate(file_data['dataset_query']['query']['joins'][i]['condition']):
+                                if isinstance(condition_clause, list) and condition_clause[0] == 'field':
+                                    self.add_entity_reference_to_data_index_by_path(
+                                        tuple(file_data['dataset_query']['query']['joins'][i]['condition'][j][1]),
+                                        'Card',
+                                        f'dataset_query.query.joins[{i}].condition[{j}][1]',
+                                        serdes_meta_id,
+                                        member_name
+                                    )
+
+        # TODO: Capture result_metadata - data_index_by_path
+
+        if 'results_metadata' in file_data:
+            for i, result_metadata_clause in enumerate(file_data['result_metadata']):
+                # Capture result_metadata[].id - data_index_by_path
+
+                if 'id' in result_metadata_clause:
+                    self.add_entity_reference_to_data_index_by_path(
+                        tuple(file_data['dataset_query']['result_metadata'][i]['id']),
+                        'Card',
+                        f'dataset_query.result_metadata[{i}].id',
+                        serdes_meta_id,
+                        member_name
+                    )
+
+                # Capture result_metadata[].field_ref[1] - data_index_by_path
+
+                if 'field_ref' in result_metadata_clause and isinstance(result_metadata_clause['field_ref'], list) and result_metadata_clause['field_ref'][0] == 'field':
+                    self.add_entity_reference_to_data_index_by_path(
+                        tuple(file_data['dataset_query']['result_metadata'][i]['field_ref'][1]),
+                        'Card',
+                        f'dataset_query.result_metadata[{i}].field_ref[1]',
+                        serdes_meta_id,
+                        member_name
+                    )
+
+        # TODO: embedding_params
+        # TODO: parameter_mappings
+        # TODO: visualization_settings
+
+    def update_entity_references(self, file_data, member_name, serdes_meta_id, metadata):
+        """Updates entity index by id adding external references found in file_data to referenced entities."""
+
+        # TODO: refactor all of these `self.update_entity_references_xyz` methods, lots of repeated code
+        ENTITY_MODELS = {
+            'Collection': self.update_entity_references_collection,
+            'Card': self.update_entity_references_card,
+            'Dashboard': self.update_entity_references_dashboard,
+            'Timeline': self.update_entity_references_timeline,
+            'Action': self.update_entity_references_action,
+            'Field': self.update_entity_references_field,
+            'Table': self.update_entity_references_table,
+            'Metric': self.update_entity_references_metric,
+            'Segment': self.update_entity_references_segment,
+        }
+
+        ENTITY_MODELS_NO_EXTERNAL_REFERENCES = (
+            'NativeQuerySnippet',
+            'Database',
+        )
+
+        serdes_meta_model = metadata['serdes/meta.model']
+
+        if serdes_meta_model in ENTITY_MODELS_NO_EXTERNAL_REFERENCES:
+            return
+
+        entity_model_updater = ENTITY_MODELS.get(serdes_meta_model, None)
+
+        if entity_model_updater is None:
+            return
+
+        entity_model_updater(file_data, serdes_meta_id, member_name)
+
+    def add_entity_reference_to_index_by_id(self, reference_entity_id, entity_model, relationship, serdes_meta_id, member_name):
+        self.index_by_id.setdefault(reference_entity_id, []).append((entity_model, relationship, serdes_meta_id, member_name, ))
+
+    def add_entity_reference_to_data_index_by_path(self, reference_data_entity_path, entity_model, relationship, serdes_meta_id, member_name):
+        self.data_index_by_path.setdefault(reference_data_entity_path, []).append((entity_model, relationship, serdes_meta_id, member_name, ))
@@ -0,0 +1,423 @@
+#!/usr/bin/env python
+"""Generates deterministic synthetic Metabase Serialization export tarballs.
+
+Usage:
+    python benchmarks/synthetic_export.py OUTPUT.tgz [--databases N] [--tables N] [--fields N] [--collections N]
+        [--cards N] [--dashboards N] [--dashcards N] [--seed N]
+"""
+import argparse
+import gzip
+import io
+import json
+import os
+import random
+import sys
+import tarfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+from metabase_serialization_py.yaml import dump_yaml
+
+
+EXPORT_ROOT = 'metabase_data'
+SCHEMA = 'PUBLIC'
+NANOID_ALPHABET = 'ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789_-'
+FIELD_TYPES = (
+    ('type/Integer', 'INTEGER', ),
+    ('type/Float', 'DOUBLE PRECISION', ),
+    ('type/Text', 'VARCHAR', ),
+    ('type/DateTime', 'TIMESTAMP', ),
+    ('type/Boolean', 'BOOLEAN', ),
+)
+# Member and gzip mtime of every generated file, so the same parameters always produce the same tarball.
+MEMBER_MTIME = 1700000000
+
+# Sizes of the default export; `--scale` in the benchmarks multiplies the counts.
+SYNTHETIC_EXPORT_DEFAULTS = {
+    'databases': 2,
+    'tables': 20,
+    'fields': 10,
+    'collections': 20,
+    'cards': 1000,
+    'dashboards': 100,
+    'dashcards': 8,
+}
+
+
+def generate_entity_id(random_generator):
+    """Returns a 21 character NanoID like Metabase entity_ids."""
+
+    return ''.join(random_generator.choice(NANOID_ALPHABET) for _ in range(21))
+
+
+def get_slug(name):
+    return name.lower().replace(' ', '_')
+
+
+def field_clause(field_path, options=None):
+    return ['field', list(field_path), options]
+
+
+def make_database(database):
+    return {
+        'name': database,
+        'engine': 'postgres',
+        'description': None,
+        'details': {},
+        'is_sample': False,
+        'serdes/meta': [{'model': 'Database', 'id': database}],
+    }
+
+
+def make_table(database, table):
+    return {
+        'name': table,
+        'description': None,
+        'entity_type': 'entity/GenericTable',
+        'active': True,
+        'display_name': table.title(),
+        'visibility_type': None,
+        'schema': SCHEMA,
+        'db_id': database,
+        'serdes/meta': [
+            {'model': 'Database', 'id': database},
+            {'model': 'Schema', 'id': SCHEMA},
+            {'model': 'Table', 'id': table},
+        ],
+    }
+
+
+def make_field(database, table, field, base_type, database_type, semantic_type, fk_target_field_id, position):
+    return {
+        'name': field,
+        'display_name': field.replace('_', ' ').title(),
+        'description': None,
+        'active': True,
+        'base_type': base_type,
+        'database_type': database_type,
+        'semantic_type': semantic_type,
+        'position': position,
+        'visibility_type': 'normal',
+        'table_id': [database, SCHEMA, table],
+        'fk_target_field_id': fk_target_field_id,
+        'serdes/meta': [
+            {'model': 'Database', 'id': database},
+            {'model': 'Schema', 'id': SCHEMA},
+            {'model': 'Table', 'id': table},
+            {'model': 'Field', 'id': field},
+        ],
+    }
+
+
+class SyntheticExport:
+    """Deterministic synthetic Metabase Serialization export.
+        - `tables` is the number of tables per database, `fields` of fields per table, and `dashcards` of dashcards
+          per dashboard; the other counts are totals.
+        - Cards use MBQL queries with joins, filters, aggregations and breakouts, native queries, or other cards as
+          their source; dashboards link to cards with parameter mappings and click behaviors.
+    """
+
+    def __init__(self, databases=2, tables=20, fields=10, collections=20, cards=1000, dashboards=100, dashcards=8, seed=0):
+        self.databases = databases
+        self.tables = tables
+        self.fields = fields
+        self.collections = collections
+        self.cards = cards
+        self.dashboards = dashboards
+        self.dashcards = dashcards
+        self.seed = seed
+
+    def iter_members(self):
+        """Returns an iterative of (member_name, document,) in archive order."""
+
+        random_generator = random.Random(self.seed)
+
+        schema_fields = {}
+
+        for d in range(self.databases):
+            database = f'Database {d}'
+            database_path = f'{EXPORT_ROOT}/databases/{database}'
+
+            yield (f'{database_path}/{database}.yaml', make_database(database), )
+
+            for t in range(self.tables):
+                table = f'TABLE_{t:04d}'
+                table_path = f'{database_path}/schemas/{SCHEMA}/tables/{table}'
+                fields = []
+
+                yield (f'{table_path}/{table}.yaml', make_table(database, table), )
+
+                for f in range(self.fields):
+                    if f == 0:
+                        field, base_type, database_type, semantic_type, fk_target_field_id = ('ID', 'type/BigInteger', 'BIGINT', 'type/PK', None, )
+                    elif f == 1 and self.tables > 1:
+                        target_table = f'TABLE_{(t + 1) % self.tables:04d}'
+                        field, base_type, database_type, semantic_type, fk_target_field_id = (f'{target_table}_ID', 'type/BigInteger', 'BIGINT', 'type/FK', [database, SCHEMA, target_table, 'ID'], )
+                    else:
+                        base_type, database_type = FIELD_TYPES[f % len(FIELD_TYPES)]
+                        field, semantic_type, fk_target_field_id = (f'COLUMN_{f:03d}', None, None, )
+
+                    fields.append((field, base_type, ))
+
+                    yield (f'{table_path}/fields/{field}.yaml', make_field(database, table, field, base_type, database_type, semantic_type, fk_target_field_id, f), )
+
+                schema_fields[(database, table, )] = fields
+
+        tables = list(schema_fields)
+
+        collections = []
+
+        for c in range(self.collections):
+            entity_id = generate_entity_id(random_generator)
+            name = f'Collection {c}'
+            parent = collections[(c - 1) // 4] if c > 0 else None
+            collection_path = f'{parent[2] if parent else f"{EXPORT_ROOT}/collections"}/{entity_id}_{get_slug(name)}'
+
+            collections.append((entity_id, name, collection_path, ))
+
+            yield (f'{collection_path}/{entity_id}_{get_slug(name)}.yaml', {
+                'name': name,
+                'description': None,
+                'entity_id': entity_id,
+                'slug': get_slug(name),
+                'archived': False,
+                'type': None,
+                'authority_level': None,
+                'namespace': None,
+                'parent_id': parent[0] if parent else None,
+                'created_at': '2024-01-01T00:00:00Z',
+                'serdes/meta': [{'model': 'Collection', 'id': entity_id, 'label': get_slug(name)}],
+            }, )
+
+        cards = []
+
+        for i in range(self.cards):
+            entity_id = generate_entity_id(random_generator)
+            collection = collections[random_generator.randrange(len(collections))] if collections else None
+            table_key = tables[random_generator.randrange(len(tables))]
+            card = self.make_card(random_generator, i, entity_id, collection, table_key, schema_fields, tables, cards)
+
+            cards.append((entity_id, card['name'], table_key, ))
+
+            yield (f'{collection[2] if collection else f"{EXPORT_ROOT}/collections"}/cards/{entity_id}_{get_slug(card["name"])}.yaml', card, )
+
+        for i in range(self.dashboards):
+            entity_id = generate_entity_id(random_generator)
+            collection = collections[random_generator.randrange(len(collections))] if collections else None
+            dashboard = self.make_dashboard(random_generator, i, entity_id, collection, cards, schema_fields)
+
+            yield (f'{collection[2] if collection else f"{EXPORT_ROOT}/collections"}/dashboards/{entity_id}_{get_slug(dashboard["name"])}.yaml', dashboard, )
+
+        yield (f'{EXPORT_ROOT}/settings.yaml', {'site-name': 'Synthetic Metabase', 'report-timezone': None}, )
+
+    def make_card(self, random_generator, i, entity_id, collection, table_key, schema_fields, tables, cards):
+        database, table = table_key
+        fields = schema_fields[table_key]
+        table_path = [database, SCHEMA, table]
+        source_card = None
+        query_kind = random_generator.random()
+
+        if query_kind < 0.1:
+            dataset_query = {
+                'database': database,
+                'type': 'native',
+                'native': {
+                    'query': f'SELECT * FROM {SCHEMA}.{table} WHERE {{{{filter}}}} LIMIT 100',
+                    'template-tags': {
+                        'filter': {
+                            'id': generate_entity_id(random_generator),
+                            'name': 'filter',
+                            'display-name': 'Filter',
+                            'type': 'dimension',
+                            'dimension': field_clause((*table_path, fields[-1][0], )),
+                            'widget-type': 'string/=',
+                        },
+                    },
+                },
+            }
+        else:
+            query = {}
+
+            if query_kind < 0.2 and cards:
+                source_card = cards[random_generator.randrange(len(cards))]
+                query['source-table'] = source_card[0]
+            else:
+                query['source-table'] = table_path
+
+            if random_generator.random() < 0.5 and len(tables) > 1 and len(fields) > 1:
+                joined_database, joined_table = tables[(tables.index(table_key) + 1) % len(tables)]
+                alias = joined_table.title()
+                query['joins'] = [{
+                    'alias': alias,
+                    'strategy': 'left-join',
+                    'fields': 'all',
+                    'source-table': [joined_database, SCHEMA, joined_table],
+                    'condition': ['=', field_clause((*table_path, fields[1][0], )), field_clause((joined_database, SCHEMA, joined_table, 'ID', ), {'join-alias': alias})],
+                }]
+
+            numeric_fields = [field for field, base_type in fields if base_type in ('type/Integer', 'type/Float', )] or [fields[0][0]]
+            date_fields = [field for field, base_type in fields if base_type == 'type/DateTime'] or [fields[0][0]]
+
+            query['filter'] = ['>', field_clause((*table_path, numeric_fields[0], ), {'base-type': 'type/Integer'}), random_generator.randrange(100)]
+            query['aggregation'] = [['sum', field_clause((*table_path, numeric_fields[-1], ))]] if random_generator.random() < 0.5 else [['count']]
+            query['breakout'] = [field_clause((*table_path, date_fields[0], ), {'temporal-unit': 'month'})]
+
+            dataset_query = {'database': database, 'type': 'query', 'query': query}
+
+        result_fields = fields[:3]
+
+        visualization_settings = {'graph.dimensions': [result_fields[0][0]], 'graph.metrics': ['count']}
+
+        if random_generator.random() < 0.3:
+            visualization_settings['column_settings'] = {
+                json.dumps(['ref', field_clause((*table_path, field, ))], separators=(',', ':', )): {'column_title': field.title()}
+                for field, base_type in result_fields
+            }
+
+        name = f'Card {i}'
+
+        return {
+            'name': name,
+            'description': None,
+            'entity_id': entity_id,
+            'created_at': '2024-01-01T00:00:00Z',
+            'creator_id': 'admin@example.com',
+            'display': 'bar',
+            'archived': False,
+            'collection_id': collection[0] if collection else None,
+            'collection_position': None,
+            'collection_preview': True,
+            'database_id': database,
+            'table_id': table_path,
+            'source_card_id': source_card[0] if source_card else None,
+            'query_type': dataset_query['type'],
+            'type': 'model' if i % 10 == 0 else 'question',
+            'enable_embedding': False,
+            'embedding_params': None,
+            'parameters': [],
+            'parameter_mappings': [],
+            'dataset_query': dataset_query,
+            'result_metadata': [
+                {
+                    'name': field,
+                    'display_name': field.replace('_', ' ').title(),
+                    'base_type': base_type,
+                    'id': [*table_path, field],
+                    'table_id': table_path,
+                    'field_ref': field_clause((*table_path, field, )),
+                    'fk_target_field_id': None,
+                }
+                for field, base_type in result_fields
+            ],
+            'visualization_settings': visualization_settings,
+            'serdes/meta': [{'model': 'Card', 'id': entity_id, 'label': get_slug(name)}],
+        }
+
+    def make_dashboard(self, random_generator, i, entity_id, collection, cards, schema_fields):
+        parameter_id = generate_entity_id(random_generator)[:8]
+        dashcards = []
+
+        for j in range(self.dashcards if cards else 0):
+            card_entity_id, card_name, table_key = cards[random_generator.randrange(len(cards))]
+            field, base_type = schema_fields[table_key][-1]
+            visualization_settings = {}
+
+            if random_generator.random() < 0.2:
+                visualization_settings['click_behavior'] = {
+                    'type': 'link',
+                    'linkType': 'question',
+                    'targetId': cards[random_generator.randrange(len(cards))][0],
+                    'parameterMapping': {},
+                }
+
+            dashcards.append({
+                'entity_id': generate_entity_id(random_generator),
+                'card_id': card_entity_id,
+                'action_id': None,
+                'row': (j // 2) * 4,
+                'col': (j % 2) * 12,
+                'size_x': 12,
+                'size_y': 4,
+                'series': [],
+                'parameter_mappings': [{
+                    'card_id': card_entity_id,
+                    'parameter_id': parameter_id,
+                    'target': ['dimension', field_clause((table_key[0], SCHEMA, table_key[1], field, ))],
+                }],
+                'visualization_settings': visualization_settings,
+            })
+
+        name = f'Dashboard {i}'
+
+        return {
+            'name': name,
+            'description': None,
+            'entity_id': entity_id,
+            'created_at': '2024-01-01T00:00:00Z',
+            'creator_id': 'admin@example.com',
+            'archived': False,
+            'collection_id': collection[0] if collection else None,
+            'collection_position': None,
+            'auto_apply_filters': True,
+            'parameters': [{'id': parameter_id, 'name': 'Filter', 'slug': 'filter', 'type': 'string/='}],
+            'dashcards': dashcards,
+            'tabs': [],
+            'serdes/meta': [{'model': 'Dashboard', 'id': entity_id, 'label': get_slug(name)}],
+        }
+
+    def write_tgz(self, output_path, compresslevel=6):
+        """Writes the export to a tgz file with directory members, like a Metabase export, and returns the number of
+            file members.
+        """
+
+        members = 0
+
+        with open(output_path, 'wb') as output_file, gzip.GzipFile('', 'wb', compresslevel, output_file, mtime=MEMBER_MTIME) as gzip_file, tarfile.open(fileobj=gzip_file, mode='w') as tar_file:
+            directories = set()
+
+            for member_name, document in self.iter_members():
+                parts = member_name.split('/')
+
+                for k in range(1, len(parts)):
+                    directory = '/'.join(parts[:k])
+
+                    if directory not in directories:
+                        directories.add(directory)
+
+                        member = tarfile.TarInfo(directory)
+                        member.type = tarfile.DIRTYPE
+                        member.mode = 0o755
+                        member.mtime = MEMBER_MTIME
+                        tar_file.addfile(member)
+
+                # Documents share lists like field clauses, written out in full like Metabase does, without aliases.
+                raw_data = dump_yaml(document)
+
+                member = tarfile.TarInfo(member_name)
+                member.size = len(raw_data)
+                member.mode = 0o644
+                member.mtime = MEMBER_MTIME
+                tar_file.addfile(member, io.BytesIO(raw_data))
+
+                members += 1
+
+        return members
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('output_path')
+
+    for parameter, default in SYNTHETIC_EXPORT_DEFAULTS.items():
+        parser.add_argument(f'--{parameter}', type=int, default=default)
+
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    members = SyntheticExport(**{parameter: getattr(args, parameter) for parameter in (*SYNTHETIC_EXPORT_DEFAULTS, 'seed', )}).write_tgz(args.output_path)
+
+    print(f'Wrote {members} files to {args.output_path}')
+
+
+if __name__ == '__main__':
+    main()
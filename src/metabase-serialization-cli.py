@@ -1,5 +1,6 @@
 #!/usr/bin/env python
 import logging
+import sys
 
 import fire
 
@@ -7,8 +8,16 @@ import metabase_serialization_py as msp
 
 
 LOGGER = logging.getLogger(__name__)
-logging.basicConfig(encoding='utf-8', level=logging.DEBUG)
+# INFO matches the --log_level default, which sets the level once arguments are parsed.
+logging.basicConfig(encoding='utf-8', level=logging.INFO)
 
 
 if __name__ == '__main__':
-    fire.Fire(msp.cli)
+    # `serve EXPORT_PATH` runs the server and `plan EXPORT_PATH CHANGE_LIST_FILE_PATH` reports what a change list would
+    # do, otherwise the arguments are those of a single run.
+    if sys.argv[1:2] == ['serve']:
+        fire.Fire(msp.serve, command=sys.argv[2:], name='serve')
+    elif sys.argv[1:2] == ['plan']:
+        fire.Fire(msp.plan, command=sys.argv[2:], name='plan')
+    else:
+        fire.Fire(msp.cli)
@@ -1,26 +1,94 @@
 from datetime import datetime
+import importlib
+import json
 import logging
 import os
-import hashlib
+import re
 
-from metabase_serialization_py.metabase_export import MetabaseExport
-from metabase_serialization_py.change_requests import ChangeRequests
+from metabase_serialization_py.version import __version__
+from metabase_serialization_py.defaults import DEFAULT_DOCUMENT_CACHE_MB, DEFAULT_INDEX_CACHE_DIR, STDIN_EXPORT_PATH
+from metabase_serialization_py.metrics import METRICS
 
 LOGGER = logging.getLogger(__name__)
-logging.basicConfig(encoding='utf-8', level=logging.DEBUG)
 
-TIMESTAMP = datetime.now().isoformat().replace('-', '').replace('.', '').replace('T', '').replace(':', '')
+# Modules of the names re-exported by this package, imported on first use so importing the package, e.g. for
+# `--help`, does not load YAML, tar, and the export modules. Functions below import what they use themselves.
+LAZY_ATTRIBUTES = {
+    'ChangeRequests': 'metabase_serialization_py.change_requests',
+    'ExportOverlay': 'metabase_serialization_py.metabase_export',
+    'MemberFilter': 'metabase_serialization_py.metabase_export',
+    'MetabaseExport': 'metabase_serialization_py.metabase_export',
+    'export_path_exists': 'metabase_serialization_py.metabase_export',
+    'spool_stdin_export': 'metabase_serialization_py.metabase_export',
+    'write_serialization_directory': 'metabase_serialization_py.metabase_export',
+    'write_serialization_tgz': 'metabase_serialization_py.metabase_export',
+    'parse_yaml': 'metabase_serialization_py.yaml',
+}
+# Tenant names are used in output export file names.
+TENANT_NAME_RE = re.compile(r'[A-Za-z0-9][A-Za-z0-9_.-]*')
 
 # TODOs
 # TODO: replace references to "member" with something more clear like "archive member" or "exported object"
-# TODO: add CLI parameter for logging level
 
 
-def cli(export_path, change_list_file_path, output_path=os.getcwd()):
-    """Metabase Serialization CLI entry point."""
+def __getattr__(name):
+    """Imports the names of LAZY_ATTRIBUTES on first use."""
+
+    module_name = LAZY_ATTRIBUTES.get(name, None)
+
+    if module_name is None:
+        raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
+
+    value = globals()[name] = getattr(importlib.import_module(module_name), name)
+
+    return value
+
+
+def get_timestamp():
+    """Returns the current time as digits only, for output export names."""
+
+    return datetime.now().isoformat().replace('-', '').replace('.', '').replace('T', '').replace(':', '')
+
+
+def cli(export_path, change_list_file_path, output_path=os.getcwd(), workers=1, stream=False, lazy=False, cache_size_mb=DEFAULT_DOCUMENT_CACHE_MB, index_cache=True, index_cache_dir=DEFAULT_INDEX_CACHE_DIR, previous_export=None, output_directory=False, compression_threads=1, compression_level=9, metrics=None, metrics_rss_interval=None, log_level='INFO', collections=None, models=None, databases=None, tenants=None, tenant_workers=1, memory_budget_mb=None, intern=False):
+    """Metabase Serialization CLI entry point.
+        - `export_path` is an export tarball, gzip or zstd-compressed or uncompressed, or a directory the export was
+          extracted to. '-' reads the export tgz from stdin into a temporary file.
+        - `workers` greater than 1 parses export YAML files in that many parallel processes.
+        - `stream` reads the export tgz in a single sequential pass.
+        - `lazy` keeps only metadata in memory and re-parses export YAML files on demand.
+        - `cache_size_mb` bounds the raw YAML kept parsed in memory in lazy mode.
+        - `index_cache` reuses parsed metadata and indexes cached in `index_cache_dir` for the same export contents.
+        - `previous_export` re-indexes only the files changed since an earlier export cached in `index_cache_dir`.
+        - `output_directory` writes the output export as an uncompressed directory tree instead of a tgz file.
+        - `compression_threads` greater than 1 compresses the output tgz in parallel on that many threads.
+        - `compression_level` is the gzip compression level of the output tgz, from 1 (fastest) to 9 (smallest).
+        - `metrics` writes a JSON report of phase timings, per-model counters, and memory usage to that path.
+        - `metrics_rss_interval` also samples memory usage every that many seconds for the metrics report. Memory usage
+          is only sampled for a metrics report.
+        - `log_level` is the logging level name, e.g. 'DEBUG', 'INFO', or 'WARNING'.
+        - `collections` loads only the subtrees of these collection entity_ids, and the tables and fields they reference.
+        - `models` loads only members of these models, e.g. 'Card' or 'Dashboard', and the tables and fields they reference.
+        - `databases` loads only the tables and fields of these database names.
+        - `tenants` is a YAML file of tenant bindings: the change list is applied once per tenant, with its `${name}`
+          placeholders replaced by the tenant's values, and one output export is written per tenant.
+        - `tenant_workers` greater than 1 writes that many tenant output exports concurrently.
+        - `memory_budget_mb` moves the export indexes and parsed files to a temporary SQLite database once memory usage
+          is over that many MB.
+        - `intern` shares equal strings and sub-structures, e.g. repeated `result_metadata`, between parsed files.
+    """
+
+    from metabase_serialization_py.change_requests import ChangeRequests
+    from metabase_serialization_py.metabase_export import ExportOverlay, MemberFilter, MetabaseExport, export_path_exists, spool_stdin_export
+
+    logging.getLogger().setLevel(log_level.upper())
+
+    METRICS.reset(sample_rss=metrics is not None)
+    # Output exports of the run are named after the time it started.
+    timestamp = get_timestamp()
 
     PARAMETERS = (
-        ('Export Path', export_path, 'EXPORT_PATH argument', os.path.isfile, ),
+        ('Export Path', export_path, 'EXPORT_PATH argument', export_path_exists, ),
         ('Change List Path', change_list_file_path, 'CHANGE_LIST_FILE_PATH argument', os.path.isfile, ),
         ('Output Path', output_path, '--output flag', os.path.isdir, ),
     )
@@ -32,11 +100,346 @@ def cli(export_path, change_list_file_path, output_path=os.getcwd()):
             LOGGER.error(f'.. Specified {param_title.lower()} not found: "{param_value}". Review the parameter for the {param_instructions}.')
             exit(1)
 
+    if compression_threads < 1 or compression_level not in range(1, 10):
+        LOGGER.error(f'.. Invalid compression settings: {compression_threads} threads, level {compression_level}. Threads must be at least 1 and the level between 1 and 9.')
+        exit(1)
+
+    if previous_export is not None:
+        if not os.path.isfile(previous_export):
+            LOGGER.error(f'.. Specified previous export not found: "{previous_export}". Review the parameter for the --previous_export flag.')
+            exit(1)
+
+        if not index_cache:
+            LOGGER.error('.. Incremental loading reads the previous export\'s indexes from the index cache and cannot be used with --noindex_cache.')
+            exit(1)
+
+        if os.path.isdir(export_path):
+            LOGGER.error('.. Incremental loading compares export files through the index cache and cannot be used with an export directory.')
+            exit(1)
+
+    tenant_bindings = None
+
+    if tenants is not None:
+        if tenant_workers < 1:
+            LOGGER.error(f'.. Invalid number of tenant workers: {tenant_workers}. Review the parameter for the --tenant_workers flag.')
+            exit(1)
+
+        try:
+            tenant_bindings = load_tenant_bindings(tenants)
+        except (OSError, ValueError) as error:
+            LOGGER.error(f'.. {error} Review the parameter for the --tenants flag.')
+            exit(1)
+
+    try:
+        member_filter = MemberFilter(get_filter_values(collections), get_filter_values(models), get_filter_values(databases))
+    except ValueError as error:
+        LOGGER.error(f'.. {error} Review the parameter for the --models flag.')
+        exit(1)
+
+    if previous_export is not None and not member_filter.is_empty():
+        LOGGER.error('.. Incremental loading re-indexes the whole export and cannot be used with --collections, --models, or --databases.')
+        exit(1)
+
+    export_file_path = export_path
+
+    if export_path == STDIN_EXPORT_PATH:
+        # Unchanged members are copied from the export file to the output export, so stdin is read into a file.
+        LOGGER.info('Copying export from stdin to a temporary file.')
+        export_file_path = spool_stdin_export()
+
+    if metrics is not None and metrics_rss_interval is not None:
+        METRICS.start_rss_sampler(metrics_rss_interval)
+
+    try:
+        try:
+            metabase_export = MetabaseExport(export_file_path, workers, stream, lazy, cache_size_mb, index_cache_dir if index_cache else None, previous_export, member_filter, memory_budget_mb=memory_budget_mb, intern=intern)
+        except ValueError as error:
+            LOGGER.error(f'.. {error} Review the parameter for the EXPORT_PATH argument.')
+            exit(1)
+
+        if tenant_bindings is not None:
+            try:
+                process_tenant_changes(metabase_export, change_list_file_path, tenant_bindings, export_path, output_path, output_directory, tenant_workers, compression_threads, compression_level, timestamp)
+            except ValueError as error:
+                LOGGER.error(f'.. {error} Review the change list: "{change_list_file_path}".')
+                exit(1)
+
+            return
+
+        try:
+            change_requests = ChangeRequests(change_list_file_path, metabase_export)
+        except ValueError as error:
+            LOGGER.error(f'.. {error} Review the change list: "{change_list_file_path}".')
+            exit(1)
+
+        export_overlay = ExportOverlay(metabase_export)
+
+        with METRICS.phase('apply'):
+            try:
+                change_requests.apply(metabase_export, export_overlay)
+            except ValueError as error:
+                LOGGER.error(f'.. {error} Review the change list: "{change_list_file_path}".')
+                exit(1)
+
+        process_changes(metabase_export, export_overlay, get_output_export_path(export_path, output_path, output_directory, timestamp=timestamp), output_directory, compression_threads, compression_level)
+    finally:
+        if export_file_path != export_path:
+            os.unlink(export_file_path)
+
+        METRICS.stop_rss_sampler()
+
+        if metrics is not None:
+            METRICS.write_report(metrics)
+            LOGGER.info(f'Wrote metrics report: {metrics}')
+
+
+def serve(export_path, output_path=os.getcwd(), host='127.0.0.1', port=8765, workers=1, lazy=False, cache_size_mb=DEFAULT_DOCUMENT_CACHE_MB, index_cache=True, index_cache_dir=DEFAULT_INDEX_CACHE_DIR, poll_interval=2.0, log_level='INFO', memory_budget_mb=None, intern=False):
+    """Metabase Serialization server entry point, keeping the export loaded between change list runs.
+        - Serves a JSON API on http://`host`:`port` to validate, plan, and apply change lists and query the export,
+          see ExportRequestHandler.
+        - Reloads the export when `export_path` changes, checked every `poll_interval` seconds, incrementally from the
+          index cache unless `index_cache` is False.
+        - `output_path` is the directory of output exports written by apply requests, which may only choose a
+          directory inside it.
+        - `host` must be a loopback host: the API has no authentication, see ExportRequestHandler.
+        - `workers`, `lazy`, `cache_size_mb`, `index_cache_dir`, `memory_budget_mb`, and `intern` are used to load the
+          export as with `cli`.
+    """
+
+    # The server is only imported by this entry point.
+    from metabase_serialization_py.server import LOOPBACK_HOSTS, ExportServer, run_server
+
+    logging.getLogger().setLevel(log_level.upper())
+
+    if not os.path.isfile(export_path):
+        LOGGER.error(f'.. Specified export path not found: "{export_path}". Review the parameter for the EXPORT_PATH argument.')
+        exit(1)
+
+    if not os.path.isdir(output_path):
+        LOGGER.error(f'.. Specified output path not found: "{output_path}". Review the parameter for the --output_path flag.')
+        exit(1)
+
+    if host not in LOOPBACK_HOSTS:
+        LOGGER.error(f'.. Cannot serve on {host}: the API applies change lists and writes files without authentication. Review the parameter for the --host flag, one of: {", ".join(LOOPBACK_HOSTS)}.')
+        exit(1)
+
+    export_server = ExportServer(export_path, output_path, workers, lazy, cache_size_mb, index_cache_dir if index_cache else None, memory_budget_mb, intern)
+
+    run_server(export_server, host, port, poll_interval)
+
+
+def plan(export_path, change_list_file_path, workers=1, cache_size_mb=DEFAULT_DOCUMENT_CACHE_MB, index_cache=True, index_cache_dir=DEFAULT_INDEX_CACHE_DIR, output_directory=False, compression_threads=1, report=None, log_level='INFO', memory_budget_mb=None):
+    """Metabase Serialization plan entry point, reporting what a change list would do without writing any output.
+        - Validates the change list like `cli`, exiting with status 1 if it is invalid.
+        - Logs each change in order of application, see ChangeRequests.get_plan, then the members it would rewrite,
+          archive, create, or leave referencing changed entities, the bytes re-serialized and passed through, name
+          collisions, and the estimated time to apply and write it, see ChangeRequests.get_impact.
+        - The export is loaded lazily, from the index cache unless `index_cache` is False, and planning reads its
+          indexes only, never its documents.
+        - `output_directory` and `compression_threads` are those of the run to estimate.
+        - `report` writes the plan and impact as JSON to that path.
+    """
+
+    from metabase_serialization_py.change_requests import ChangeRequests
+    from metabase_serialization_py.metabase_export import MetabaseExport, export_path_exists
+
+    logging.getLogger().setLevel(log_level.upper())
+
+    METRICS.reset()
+
+    if export_path == STDIN_EXPORT_PATH or not export_path_exists(export_path):
+        LOGGER.error(f'.. Specified export path not found: "{export_path}". Review the parameter for the EXPORT_PATH argument, plans cannot read the export from stdin.')
+        exit(1)
+
+    if not os.path.isfile(change_list_file_path):
+        LOGGER.error(f'.. Specified change list path not found: "{change_list_file_path}". Review the parameter for the CHANGE_LIST_FILE_PATH argument.')
+        exit(1)
+
+    try:
+        metabase_export = MetabaseExport(export_path, workers, lazy=True, cache_size_mb=cache_size_mb, index_cache_dir=index_cache_dir if index_cache else None, memory_budget_mb=memory_budget_mb)
+    except ValueError as error:
+        LOGGER.error(f'.. {error} Review the parameter for the EXPORT_PATH argument.')
+        exit(1)
+
+    try:
+        try:
+            change_requests = ChangeRequests(change_list_file_path, metabase_export)
+        except ValueError as error:
+            LOGGER.error(f'.. {error} Review the change list: "{change_list_file_path}".')
+            exit(1)
+
+        steps = change_requests.get_plan(metabase_export)
+        impact = change_requests.get_impact(metabase_export, output_directory, compression_threads)
+    finally:
+        metabase_export.export_data.close()
+
+    log_plan(steps, impact)
+
+    if report is not None:
+        with open(report, 'w') as report_file:
+            json.dump({'plan': steps, 'impact': impact}, report_file, indent=2)
+
+        LOGGER.info(f'Wrote plan report: {report}')
+
+
+def format_model_counts(counts):
+    """Returns counts of members by model like '12 (Card: 10, Dashboard: 2)'."""
+
+    if not counts:
+        return '0'
+
+    return f'{sum(counts.values())} ({", ".join(f"{model}: {n}" for model, n in sorted(counts.items()))})'
+
+
+def log_plan(steps, impact):
+    """Logs the steps and impact of a change list plan, see plan."""
+
+    for step in steps:
+        entities = ', '.join(f'{clause} {step[clause]}' for clause in ('target', 'source', ) if clause in step)
+
+        LOGGER.info(f'Change {step["change"]}: {step["action"]} {entities}, writes {step["files"]} files, depends on {step["depends_on"]} files.')
+
+    members = impact['members']
+    impact_bytes = impact['bytes']
+    estimated_seconds = impact['estimated_seconds']
+
+    LOGGER.info(f'Plan for {impact["changes"]} changes:')
+    LOGGER.info(f'.. Rewritten: {format_model_counts(members["rewritten"])}')
+    LOGGER.info(f'.. Archived: {format_model_counts(members["archived"])}')
+    LOGGER.info(f'.. Created: {format_model_counts(members["created"])}')
+    LOGGER.info(f'.. Referencing changed entities, unchanged: {format_model_counts(members["referencing"])}')
+    LOGGER.info(f'.. Bytes: {impact_bytes["read"]} read, {impact_bytes["serialized"]} re-serialized, {impact_bytes["passed_through"]} passed through.')
+
+    for collision in impact['collisions']:
+        LOGGER.warning(f'.. Change {collision["change"]}: {collision["model"]} named "{collision["name"]}" already exists in collection {collision["collection_id"]}.')
+
+    LOGGER.info(f'.. Estimated time: {estimated_seconds["apply"]:.1f}s to apply, {estimated_seconds["write"]:.1f}s to write.')
+
+
+def get_filter_values(values):
+    """Returns tuple of member filter values from a CLI flag, either a comma separated string or a list, or None."""
+
+    if values is None:
+        return None
+
+    if isinstance(values, str):
+        values = values.split(',')
+
+    return tuple([str(value).strip() for value in values])
+
+
+def load_tenant_bindings(tenants_file_path):
+    """Returns list of tenant bindings, dicts of change list parameters by name, from a YAML file like:
+        tenants:
+          - name: acme
+            database: Acme Database
+        - `name` is required, unique, and used in the tenant's output export name.
+        - Raises ValueError for invalid bindings.
+    """
+
+    from metabase_serialization_py.yaml import parse_yaml
+
+    with open(tenants_file_path, 'r') as tenants_file:
+        tenant_bindings = (parse_yaml(tenants_file) or {}).get('tenants', None)
+
+    if not isinstance(tenant_bindings, list) or not tenant_bindings:
+        raise ValueError(f'No tenants found in {tenants_file_path}.')
+
+    names = set()
+
+    for tenant_binding in tenant_bindings:
+        if not isinstance(tenant_binding, dict) or not isinstance(tenant_binding.get('name', None), str) or not TENANT_NAME_RE.fullmatch(tenant_binding['name']):
+            raise ValueError(f'Tenant binding needs a name of letters, digits, ".", "_", or "-": {tenant_binding}')
+
+        if tenant_binding['name'] in names:
+            raise ValueError(f'Duplicate tenant name: {tenant_binding["name"]}')
+
+        names.add(tenant_binding['name'])
+
+    return tenant_bindings
+
+
+def get_output_export_path(export_path, output_path, output_directory=False, tenant_name=None, timestamp=None):
+    """Returns path of the output export tgz file, or directory if `output_directory`, in output_path, named after the
+        export, and tenant if any, with a timestamp suffix, by default the current time.
+    """
+
+    if timestamp is None:
+        timestamp = get_timestamp()
+
+    export_name = 'metabase_export' if export_path == STDIN_EXPORT_PATH else os.path.basename(os.path.normpath(export_path))
+
+    for extension in ('.tar.gz', '.tgz', '.tar.zst', '.tzst', '.tar', ):
+        if export_name.endswith(extension):
+            export_name = export_name[:-len(extension)]
+
+            break
+
+    if tenant_name is not None:
+        export_name = f'{export_name}-{tenant_name}'
+
+    return os.path.join(output_path, f'{export_name}-{timestamp}' if output_directory else f'{export_name}-{timestamp}.tgz')
+
+
+def process_tenant_changes(metabase_export, change_list_file_path, tenant_bindings, export_path, output_path, output_directory=False, tenant_workers=1, compression_threads=1, compression_level=9, timestamp=None):
+    """Applies a parameterized change list once per tenant binding and writes one output export per tenant.
+        - The export is loaded once: each tenant's changes are applied to its own ExportOverlay over it, and the export is
+          never changed, so memory grows with the tenants' changed and created documents rather than with the tenants.
+        - Every tenant's change list is validated before anything is written, raising ValueError naming the tenant.
+        - Output exports are written on `tenant_workers` threads while the next tenants' changes are applied, holding at
+          most that many overlays waiting to be written.
+    """
+
+    from collections import deque
+    from concurrent.futures import ThreadPoolExecutor
+
+    from metabase_serialization_py.change_requests import ChangeRequests
+    from metabase_serialization_py.metabase_export import ExportOverlay
+
+    timestamp = get_timestamp() if timestamp is None else timestamp
+
+    tenant_change_requests = []
+
+    for tenant_binding in tenant_bindings:
+        try:
+            tenant_change_requests.append(ChangeRequests(change_list_file_path, metabase_export, tenant_binding))
+        except ValueError as error:
+            raise ValueError(f'Tenant "{tenant_binding["name"]}": {error}') from None
+
+    with ThreadPoolExecutor(max_workers=tenant_workers) as executor:
+        pending = deque()
+
+        for tenant_binding, change_requests in zip(tenant_bindings, tenant_change_requests):
+            export_overlay = ExportOverlay(metabase_export)
+
+            with METRICS.phase('apply'):
+                try:
+                    change_requests.apply(metabase_export, export_overlay)
+                except ValueError as error:
+                    raise ValueError(f'Tenant "{tenant_binding["name"]}": {error}') from None
+
+            if len(pending) >= tenant_workers:
+                pending.popleft().result()
+
+            output_export_path = get_output_export_path(export_path, output_path, output_directory, tenant_binding['name'], timestamp)
+            pending.append(executor.submit(process_changes, metabase_export, export_overlay, output_export_path, output_directory, compression_threads, compression_level))
+
+        while pending:
+            pending.popleft().result()
+
+    LOGGER.info(f'Wrote {len(tenant_bindings)} tenant exports to {output_path}')
+
 
-    metabase_export = MetabaseExport(export_path)
+def process_changes(metabase_export, export_overlay, output_export_path, output_directory=False, compression_threads=1, compression_level=9):
+    """Writes the export with the changed and created documents of export_overlay to output_export_path.
+        - Export members without changes are copied byte for byte from the export file.
+        - `output_directory` writes an uncompressed directory tree instead of a tgz file.
+    """
 
-    change_requests = ChangeRequests(change_list_file_path, metabase_export)
+    from metabase_serialization_py.metabase_export import write_serialization_directory, write_serialization_tgz
 
-    import pdb; pdb.set_trace();  # TODO: REMOVE after debugging
+    with METRICS.phase('write'):
+        if output_directory:
+            return write_serialization_directory(metabase_export.export_data.export_path, output_export_path, export_overlay)
 
-    # process_changes(metabse_export, change_requests, output_path)
+        return write_serialization_tgz(metabase_export.export_data.export_path, output_export_path, export_overlay, compression_level, compression_threads)
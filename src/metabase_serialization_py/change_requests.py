@@ -1,55 +1,584 @@
 """Change List helper for Metabase Serialization."""
+import logging
+import re
+import string
 
 # from yaml.constructor import ConstructorError as ConstructorError_yaml
 
+from metabase_serialization_py.metabase_export import (
+    ROOT_COLLECTION_ID,
+    CycleError,
+    EditPlan,
+    EntityCloner,
+    build_data_path_rewrite_map,
+    estimate_write_seconds,
+    group_remapped_references,
+    remap_data_paths,
+    topological_sort,
+)
+from metabase_serialization_py.metrics import METRICS
 from metabase_serialization_py.yaml import parse_yaml
 
+LOGGER = logging.getLogger(__name__)
+
 
 # TODOs
-# TODO: handle create card
-# TODO: handle create model
-# TODO: handle create dashboard
-# TODO: handle create collection
 # TODO: handle archive collection contents before update
-# TODO: handle replace card
-# TODO: handle replace model
-# TODO: handle replace dashboard
-# TODO: handle replace collection
-# TODO: handle update database
-# TODO: handle update schema
-# TODO: handle update table
-# TODO: handle update field
-# TODO: handle update card
-# TODO: handle update model
-# TODO: handle update dashboard
-# TODO: handle update collection
+
+
+# Change list strings that are a single `${name}` placeholder, replaced by the parameter value whatever its type.
+PARAMETER_PLACEHOLDER_RE = re.compile(r'\$\{([_a-zA-Z][_a-zA-Z0-9]*)\}')
+
+
+def bind_parameters(value, parameters):
+    """Returns a copy of change list value with `${name}` placeholders in its strings replaced by parameters.
+        - A string that is a single placeholder is replaced by the parameter value itself, e.g. a list or a number.
+        - `$$` is a literal `$`.
+        - Raises ValueError for placeholders without a parameter.
+    """
+
+    if isinstance(value, dict):
+        return {bind_parameters(key, parameters): bind_parameters(item, parameters) for key, item in value.items()}
+
+    if isinstance(value, list):
+        return [bind_parameters(item, parameters) for item in value]
+
+    if not isinstance(value, str) or '$' not in value:
+        return value
+
+    placeholder = PARAMETER_PLACEHOLDER_RE.fullmatch(value)
+
+    try:
+        if placeholder is not None:
+            return parameters[placeholder.group(1)]
+
+        return string.Template(value).substitute(parameters)
+    except KeyError as error:
+        raise ValueError(f'No parameter {error} for "{value}" in change list.') from None
+
+
+# Change actions in order of precedence: changes to existing entities are applied before copies read them.
+CHANGE_ACTIONS = ('update', 'replace', 'remap', 'create', )
+# Clauses of each change action naming an entity of the export by entity_id.
+CHANGE_ACTION_ENTITY_CLAUSES = {
+    'create': ('source', ),
+    'remap': (),
+    'replace': ('target', 'source', ),
+    'update': ('target', ),
+}
+# Clauses of each change action naming a database, schema, or table by `data_path`, see get_data_path_clause.
+CHANGE_ACTION_DATA_PATH_CLAUSES = {
+    'create': (),
+    'remap': ('source', 'target', ),
+    'replace': (),
+    'update': (),
+}
+# Clauses of each change action besides its entity and data path clauses.
+CHANGE_ACTION_OTHER_CLAUSES = {
+    'create': ('changes', ),
+    'remap': (),
+    'replace': ('changes', ),
+    'update': ('changes', ),
+}
+
+
+def get_data_path_clause(specification, clause):
+    """Returns the data path tuple of a change's clause like {'data_path': [database, schema]}, or None.
+        - A string data_path is a database name.
+    """
+
+    data_path = ((specification or {}).get(clause, None) or {}).get('data_path', None)
+
+    if isinstance(data_path, str):
+        return (data_path, )
+
+    if isinstance(data_path, list) and data_path:
+        return tuple(data_path)
+
+    return None
+
+
+class ChangeListError(ValueError):
+    """Invalid change list, with the message of every invalid change request or conflict in `errors`."""
+
+    def __init__(self, message, errors=()):
+        super().__init__(message)
+        self.errors = tuple(errors)
 
 
 class ChangeRequests:
     change_requests = None
 
-    def __init__(self, change_list_file_path, metabase_export):
-        """Creates list of changes based on change_list_file and dependencies."""
-        with open (change_list_file_path, 'r') as change_list_file:
-            self.change_requests = parse_yaml(change_list_file)
+    def __init__(self, change_list_file_path, metabase_export, parameters=None, change_list=None):
+        """Creates list of changes based on change_list_file and dependencies.
+            - `parameters` replace the `${name}` placeholders of a parameterized change list, see bind_parameters.
+            - `change_list` is an already parsed change list used instead of reading change_list_file_path.
+            - Raises ChangeListError listing every invalid change request.
+        """
+        if change_list is None:
+            with open (change_list_file_path, 'r') as change_list_file:
+                change_list = parse_yaml(change_list_file)
+
+        if not isinstance(change_list, (dict, type(None), )):
+            raise ChangeListError(f'Expected a change list with a `changes` list, found: {type(change_list).__name__}')
+
+        if parameters is not None:
+            change_list = bind_parameters(change_list, parameters)
 
-        self.validate_change_requests(metabase_export)
+        self.change_requests = tuple([] if change_list is None else change_list.get('changes', None) or [])
+        self.dependencies = [None] * len(self.change_requests)
+        # Position of each change in the change list, kept through sorting for messages.
+        self.change_numbers = list(range(1, len(self.change_requests) + 1))
+        # Names already taken in the target collection of create and replace changes, see check_name_collision.
+        self.collisions = []
 
-        self.sort_change_requests_by_precedence()
+        with METRICS.phase('validation'):
+            self.validate_change_requests(metabase_export)
+            self.sort_change_requests_by_precedence()
+            self.plan_edits(metabase_export)
 
-        import pdb; pdb.set_trace();  # TODO: REMOVE after debugging
+    def get_change_action(self, change_request):
+        """Returns (action, specification,) of a change request like {'create': {...}}."""
 
-        return change_list
+        action, specification = next(iter(change_request.items()))
+
+        return (action, specification, )
 
     def sort_change_requests_by_precedence(self):
-        """Sorts change requests by order of precendence to avoid dependency issues."""
+        """Sorts change requests by order of precendence to avoid dependency issues.
+            - A change to an entity comes before the copies and replacements reading content that depends on it.
+            - Otherwise updates come before replacements and replacements before copies, keeping change list order.
+            - Raises ChangeListError for changes depending on each other, which cannot be ordered.
+        """
+
+        targets = {}
+
+        for i, change_request in enumerate(self.change_requests):
+            action, specification = self.get_change_action(change_request)
+
+            if 'target' in CHANGE_ACTION_ENTITY_CLAUSES[action]:
+                targets.setdefault(specification['target']['entity_id'], []).append(i)
+
+        predecessors = {
+            i: [j for node in self.dependencies[i] for j in targets.get(node, ()) if j != i]
+            for i in range(len(self.change_requests))
+            if self.get_change_action(self.change_requests[i])[0] != 'update'
+        }
+
+        try:
+            order = topological_sort(range(len(self.change_requests)), predecessors, lambda i: (CHANGE_ACTIONS.index(self.get_change_action(self.change_requests[i])[0]), i, ))
+        except CycleError as error:
+            message = f'Changes {", ".join(str(self.change_numbers[i]) for i in error.nodes)} cannot be ordered: they read entities changed by each other.'
+            LOGGER.error(f'.. {message}')
+
+            raise ChangeListError('Dependency cycle in change list.', [message]) from None
+
+        self.change_requests = tuple([self.change_requests[i] for i in order])
+        self.dependencies = [self.dependencies[i] for i in order]
+        self.change_numbers = [self.change_numbers[i] for i in order]
+
+    def plan_edits(self, metabase_export):
+        """Groups update and replace changes by target member into one EditPlan each, in `edit_plans`, and lists the
+            positions of remap changes in `remaps` and of create changes in `creates`.
+            - Conflicting edits of the whole change list are found from the change list alone, without reading any
+              document, raising ChangeListError.
+        """
+
+        edit_plans = {}
+        remaps = []
+        creates = []
+
+        for i, change_request in enumerate(self.change_requests):
+            action, specification = self.get_change_action(change_request)
+
+            if action == 'create':
+                creates.append(i)
+
+                continue
+
+            if action == 'remap':
+                remaps.append(i)
+
+                continue
+
+            member_name = metabase_export.index_by_id[specification['target']['entity_id']]['filename']
+            edit_plan = edit_plans.get(member_name, None)
+
+            if edit_plan is None:
+                edit_plan = edit_plans[member_name] = EditPlan(member_name)
+
+            if action == 'replace':
+                edit_plan.set_replacement(self.change_numbers[i], metabase_export.index_by_id[specification['source']['entity_id']]['filename'])
+
+            edit_plan.add_changes(self.change_numbers[i], specification.get('changes', None) or {})
+
+        conflicts = [(edit_plan.member_name, path, changes, ) for edit_plan in edit_plans.values() for path, changes in edit_plan.conflicts]
+
+        if conflicts:
+            errors = [f'Changes {", ".join(str(change) for change in changes)} conflict on {path or "the whole document"} of {member_name}' for member_name, path, changes in conflicts]
+
+            for error in errors:
+                LOGGER.error(f'.. {error}')
+
+            raise ChangeListError(f'{len(conflicts)} conflicting edits in change list.', errors)
+
+        self.edit_plans = edit_plans
+        self.remaps = remaps
+        self.creates = creates
+
+    def apply(self, metabase_export, export_overlay):
+        """Applies the change list to export_overlay and returns the number of changed and created members.
+            - Each document touched by update and replace changes is read and edited once by its EditPlan, whatever the
+              number of changes to it.
+            - Replaced documents are copies of their source with new entity_ids for embedded entities, see
+              EntityCloner.copy_replacement.
+            - Remap changes then point the references to a database, schema, or table at another, see remap_data_paths.
+            - Create changes are then applied in order by an EntityCloner, copying the changed documents.
+        """
+
+        edit_plans = self.edit_plans
+        creates = self.creates
+        entity_cloner = EntityCloner(metabase_export, export_overlay)
+
+        for member_name, edit_plan in edit_plans.items():
+            document = export_overlay.get_file_data(member_name)
+            source_document = None if edit_plan.replacement is None else entity_cloner.copy_replacement(export_overlay.get_file_data(edit_plan.replacement[1]), document['entity_id'])
+
+            export_overlay.update(member_name, edit_plan.apply(document, source_document))
+
+        LOGGER.info(f'Applied {len(self.change_requests) - len(self.remaps) - len(creates)} changes to {len(edit_plans)} files.')
+
+        for i in self.remaps:
+            specification = self.get_change_action(self.change_requests[i])[1]
+            source, target = get_data_path_clause(specification, 'source'), get_data_path_clause(specification, 'target')
+            counts = remap_data_paths(metabase_export, export_overlay, source, target)
+
+            LOGGER.info(f'Change {self.change_numbers[i]}: remapped {counts["references"]} references in {counts["members"]} files from {source} to {target}.')
+
+        for i in creates:
+            specification = self.get_change_action(self.change_requests[i])[1]
+            source_entity_id = specification['source']['entity_id']
+            created = len(export_overlay.created)
+            entity_id_map = entity_cloner.clone(source_entity_id, specification.get('changes', None) or {})
+
+            LOGGER.info(f'Change {self.change_numbers[i]}: copied {len(export_overlay.created) - created} files from {source_entity_id} as {entity_id_map[source_entity_id]}.')
+
+        return len(export_overlay.updated) + len(entity_cloner.member_names)
+
+    def get_remapped_member_names(self, metabase_export, i):
+        """Returns dict of the member names referencing the data paths remapped by remap change i, from the indexes.
+            - Replaced members reference what their source references, since replacements come before remaps.
+        """
+
+        specification = self.get_change_action(self.change_requests[i])[1]
+        rewrite_map = build_data_path_rewrite_map(metabase_export.get_data_path_trie(), get_data_path_clause(specification, 'source'), get_data_path_clause(specification, 'target'))
+        member_names = dict.fromkeys(group_remapped_references(metabase_export.data_index_by_path, rewrite_map))
+
+        for member_name, edit_plan in self.edit_plans.items():
+            if edit_plan.replacement is None:
+                continue
+
+            if edit_plan.replacement[1] in member_names:
+                member_names[member_name] = None
+            else:
+                member_names.pop(member_name, None)
+
+        return member_names
+
+    def get_plan(self, metabase_export):
+        """Returns list of dicts describing each change in order of application, with the files it reads and writes.
+            - `files` counts the target file of an update or replace, the files referencing the data paths of a remap,
+              and the files copied by a create.
+            - `depends_on` counts the files the change reads, see DependencyGraph.get_copy_closure.
+        """
+
+        dependency_graph = metabase_export.get_dependency_graph()
+        plan = []
+
+        for i, change_request in enumerate(self.change_requests):
+            action, specification = self.get_change_action(change_request)
+            step = {'change': self.change_numbers[i], 'action': action}
+
+            for clause in CHANGE_ACTION_ENTITY_CLAUSES[action]:
+                step[clause] = specification[clause]['entity_id']
+
+            for clause in CHANGE_ACTION_DATA_PATH_CLAUSES[action]:
+                step[clause] = list(get_data_path_clause(specification, clause))
+
+            if action == 'create':
+                step['files'] = len(dependency_graph.get_members(dependency_graph.get_contents_closure(step['source'])))
+            elif action == 'remap':
+                step['files'] = len(self.get_remapped_member_names(metabase_export, i))
+            else:
+                step['files'] = 1
+
+            step['depends_on'] = len(dependency_graph.get_members(self.dependencies[i]))
+            plan.append(step)
 
-        import pdb; pdb.set_trace();  # TODO: REMOVE after debugging
+        return plan
+
+    def get_impact(self, metabase_export, output_directory=False, compression_threads=1):
+        """Returns dict of the members the change list rewrites, archives, and creates, and of those referencing the
+            entities it changes, from the indexes alone, without reading any document.
+            - `members` counts members by model: `rewritten` by update, replace, and remap changes, `archived` by updates
+              setting `archived: true` (not counted as rewritten), `created` as copies, and `referencing` members that
+              reference a rewritten or archived entity through index_by_id or data_index_by_path but are copied
+              unchanged.
+            - `bytes` counts, by member size in the export, the YAML `read` to apply the changes, `serialized` as new
+              documents, and `passed_through` unchanged to the output export.
+            - `collisions` lists names already taken in the target collection of replace changes; those of create
+              changes are invalid.
+            - `estimated_seconds` of applying the changes, reading the documents, see
+              MetabaseExport.estimate_read_seconds, and of writing the output export, see estimate_write_seconds.
+        """
+
+        dependency_graph = metabase_export.get_dependency_graph()
+        archived = set()
+
+        for change_request in self.change_requests:
+            action, specification = self.get_change_action(change_request)
+
+            if action == 'update' and (specification.get('changes', None) or {}).get('archived', None) is True:
+                archived.add(metabase_export.index_by_id[specification['target']['entity_id']]['filename'])
+
+        # Members rewritten in place, in the order apply reads them, each replace source before its target.
+        changed = {}
+        read = {}
+
+        for member_name, edit_plan in self.edit_plans.items():
+            if edit_plan.replacement is not None:
+                read[edit_plan.replacement[1]] = None
+            read[member_name] = changed[member_name] = None
+
+        for i in self.remaps:
+            remapped = self.get_remapped_member_names(metabase_export, i)
+
+            read.update(remapped)
+            changed.update(remapped)
+
+        rewritten = [member_name for member_name in changed if member_name not in archived]
+
+        created = []
+
+        for i in self.creates:
+            source_entity_id = self.get_change_action(self.change_requests[i])[1]['source']['entity_id']
+            copied = dependency_graph.get_members(dependency_graph.get_contents_closure(source_entity_id)).values()
+
+            created.extend(copied)
+            read.update(dict.fromkeys(copied))
+
+        referencing = {}
+
+        for member_name in self.edit_plans:
+            metadata = metabase_export.get_member(member_name)[2]
+
+            # Serdes/meta ids of database members are data paths, referenced through data_index_by_path.
+            for i, referencing_member_name, referencing_metadata in metabase_export.find_referencing_members(metadata['serdes/meta.id']):
+                if referencing_member_name not in self.edit_plans:
+                    referencing[referencing_member_name] = None
+
+        def count_models(member_names):
+            counts = {}
+
+            for member_name in member_names:
+                model = metabase_export.get_member(member_name)[2]['serdes/meta.model']
+                counts[model] = counts.get(model, 0) + 1
+
+            return counts
+
+        file_bytes = sum(location[1] for location in metabase_export.export_data.locations if location is not None)
+        changed_bytes = sum(metabase_export.get_member_size(member_name) for member_name in changed)
+        serialized_bytes = changed_bytes + sum(metabase_export.get_member_size(member_name) for member_name in created)
+        read_bytes = sum(metabase_export.get_member_size(member_name) for member_name in read)
+
+        return {
+            'changes': len(self.change_requests),
+            'members': {
+                'rewritten': count_models(rewritten),
+                'archived': count_models(archived),
+                'created': count_models(created),
+                'referencing': count_models(referencing),
+            },
+            'bytes': {
+                'read': read_bytes,
+                'serialized': serialized_bytes,
+                'passed_through': file_bytes - changed_bytes,
+            },
+            'collisions': list(self.collisions),
+            'estimated_seconds': {
+                'apply': metabase_export.estimate_read_seconds(read),
+                'write': estimate_write_seconds(serialized_bytes, file_bytes - changed_bytes, output_directory, compression_threads),
+            },
+        }
 
     def validate_change_requests(self, metabase_export):
-        """Validates change requests against Metabase Export."""
+        """Validates change requests against Metabase Export and collects the entities each change depends on.
+            - `create` and `replace` depend on everything copied from their source, see DependencyGraph.get_copy_closure.
+            - `remap` depends on no entity: it names data paths of the same length, whose source must be in the export.
+        """
+
+        dependency_graph = metabase_export.get_dependency_graph()
+        errors = []
 
         for i, change_request in enumerate(self.change_requests):
-            # TODO: traverse tree of change and dependent changes
-            # TODO: validate that specified entity keys and path references exist
-            import pdb; pdb.set_trace();  # TODO: REMOVE after debugging
+            if not isinstance(change_request, dict) or len(change_request) != 1 or next(iter(change_request)) not in CHANGE_ACTIONS:
+                errors.append(f'Change {self.change_numbers[i]}: expected a single action of {", ".join(CHANGE_ACTIONS)}, found: {change_request}')
+
+                continue
+
+            action, specification = self.get_change_action(change_request)
+            entity_ids = {}
+
+            if not isinstance(specification, (dict, type(None), )):
+                errors.append(f'Change {self.change_numbers[i]}: expected {action} clauses, found: {specification}')
+
+                continue
+
+            invalid_clauses = [clause for clause, value in (specification or {}).items() if not isinstance(value, (dict, type(None), ))]
+
+            if invalid_clauses:
+                errors.append(f'Change {self.change_numbers[i]}: expected mappings for {action} clauses: {", ".join(str(clause) for clause in invalid_clauses)}')
+
+                continue
+
+            unknown_clauses = [clause for clause in specification or {} if clause not in CHANGE_ACTION_ENTITY_CLAUSES[action] + CHANGE_ACTION_DATA_PATH_CLAUSES[action] + CHANGE_ACTION_OTHER_CLAUSES[action]]
+
+            if unknown_clauses:
+                errors.append(f'Change {self.change_numbers[i]}: unsupported {action} clauses: {", ".join(str(clause) for clause in unknown_clauses)}')
+
+            for clause in CHANGE_ACTION_ENTITY_CLAUSES[action]:
+                entity_id = ((specification or {}).get(clause, None) or {}).get('entity_id', None)
+
+                if entity_id is None:
+                    errors.append(f'Change {self.change_numbers[i]}: {action} needs {clause}.entity_id.')
+                elif not isinstance(entity_id, str) or 'filename' not in metabase_export.index_by_id.get(entity_id, {}):
+                    errors.append(f'Change {self.change_numbers[i]}: {clause} entity not found in export: {entity_id}')
+                else:
+                    entity_ids[clause] = entity_id
+
+            if len(entity_ids) < len(CHANGE_ACTION_ENTITY_CLAUSES[action]):
+                continue
+
+            if action == 'remap':
+                error = self.check_data_paths(i, specification, metabase_export)
+
+                if error is not None:
+                    errors.append(error)
+                else:
+                    self.dependencies[i] = frozenset()
+
+                continue
+
+            if action == 'replace':
+                error = self.check_replacement_model(i, entity_ids, metabase_export)
+
+                if error is not None:
+                    errors.append(error)
+
+                    continue
+
+            if action == 'update':
+                self.dependencies[i] = frozenset((entity_ids['target'], ))
+            else:
+                self.dependencies[i] = dependency_graph.get_copy_closure(entity_ids['source'])
+
+                LOGGER.info(f'Change {self.change_numbers[i]}: {action} from {entity_ids["source"]} depends on {len(dependency_graph.get_members(self.dependencies[i]))} files.')
+
+            if action == 'create':
+                changes = specification.get('changes', None) or {}
+                collection_id = changes.get('collection_id', changes.get('parent_id', None))
+
+                if collection_id not in (None, ROOT_COLLECTION_ID, ) and 'filename' not in metabase_export.index_by_id.get(collection_id, {}):
+                    errors.append(f'Change {self.change_numbers[i]}: target collection not found in export: {collection_id}')
+
+            error = self.check_name_collision(i, action, specification, entity_ids, metabase_export)
+
+            if error is not None:
+                errors.append(error)
+
+        if errors:
+            for error in errors:
+                LOGGER.error(f'.. {error}')
+
+            raise ChangeListError(f'{len(errors)} invalid change requests in change list.', errors)
+
+    def check_data_paths(self, i, specification, metabase_export):
+        """Returns an error for a remap whose data paths are missing or of different lengths, or whose source is not in
+            the export, warning if its target is not.
+        """
+
+        source, target = get_data_path_clause(specification, 'source'), get_data_path_clause(specification, 'target')
+
+        if source is None or target is None:
+            return f'Change {self.change_numbers[i]}: remap needs source.data_path and target.data_path.'
+
+        if len(source) != len(target):
+            return f'Change {self.change_numbers[i]}: remap data paths must have the same length, found: {list(source)} and {list(target)}'
+
+        data_path_trie = metabase_export.get_data_path_trie()
+
+        if data_path_trie.get_node(source) is None:
+            return f'Change {self.change_numbers[i]}: source data path not found in export: {list(source)}'
+
+        if data_path_trie.get_node(target) is None:
+            LOGGER.warning(f'.. Change {self.change_numbers[i]}: target data path not found in export: {list(target)}')
+
+        return None
+
+    def check_replacement_model(self, i, entity_ids, metabase_export):
+        """Returns an error for a replace whose source is not of the same model as its target."""
+
+        target_model, source_model = (self.get_model(metabase_export, entity_ids[clause]) for clause in ('target', 'source', ))
+
+        if target_model != source_model:
+            return f'Change {self.change_numbers[i]}: replace source {entity_ids["source"]} is a {source_model}, not a {target_model} like target {entity_ids["target"]}.'
+
+        return None
+
+    def get_model(self, metabase_export, entity_id):
+        """Returns the serdes/meta.model of an entity of the export, or None."""
+
+        member = metabase_export.get_member(metabase_export.index_by_id[entity_id]['filename'])
+
+        return None if member is None or member[2] is None else member[2]['serdes/meta.model']
+
+    def check_name_collision(self, i, action, specification, entity_ids, metabase_export):
+        """Returns an error for a create whose name is taken in its target collection, warning for a replace.
+            - A replace keeps the name and collection of its target unless its changes set them, see EditPlan.
+        """
+
+        if action == 'update':
+            return None
+
+        # Replacements keep their target's name and collection, copies take their source's.
+        entity_id = entity_ids['source' if action == 'create' else 'target']
+        member = metabase_export.get_member(metabase_export.index_by_id[entity_id]['filename'])
+
+        if member is None or member[2] is None:
+            return None
+
+        metadata = member[2]
+        changes = specification.get('changes', None) or {}
+        model = metadata['serdes/meta.model']
+        collection_attribute = 'parent_id' if model == 'Collection' else 'collection_id'
+        current_collection_id = metadata.get(collection_attribute, None) or ROOT_COLLECTION_ID
+        # Copies of collections may name their parent collection as either parent_id or collection_id.
+        collection_id = changes.get(collection_attribute, changes.get('collection_id', metadata.get(collection_attribute, None))) or ROOT_COLLECTION_ID
+        name = changes.get('name', metadata['name'])
+
+        # A replace keeping its target's name and collection only collides with the target itself.
+        if action == 'replace' and name == metadata['name'] and collection_id == current_collection_id:
+            return None
+
+        if name is None or not metabase_export.has_name_collision(model, collection_id, name):
+            return None
+
+        message = f'Change {self.change_numbers[i]}: {model} named "{name}" already exists in collection {collection_id}.'
+        self.collisions.append({'change': self.change_numbers[i], 'action': action, 'model': model, 'collection_id': collection_id, 'name': name})
+
+        if action == 'replace':
+            LOGGER.warning(f'.. {message}')
+
+            return None
+
+        return message
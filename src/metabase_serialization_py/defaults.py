@@ -0,0 +1,12 @@
+"""Default settings shared by the CLI and the export loaders, importable without loading the export modules."""
+import os
+
+
+# Export path that reads the tgz export from stdin as a stream.
+STDIN_EXPORT_PATH = '-'
+# Default bound on the raw YAML bytes of documents kept in a lazy export's cache.
+DEFAULT_DOCUMENT_CACHE_MB = 64
+DEFAULT_INDEX_CACHE_DIR = os.path.join(
+    os.environ.get('XDG_CACHE_HOME', os.path.join(os.path.expanduser('~'), '.cache')),
+    'metabase-serialization-py',
+)
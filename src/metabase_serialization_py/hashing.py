@@ -1,7 +1,21 @@
 """Hashing helper for Metabase Serialization."""
+import hashlib
 
 
 def generate_hash_for_object(string_data):
     """Generates MD5 hash for string_data."""
 
     return hashlib.md5(string_data.encode()).hexdigest()
+
+
+def generate_hash_for_file(file_path):
+    """Generates BLAKE2b hash of a file's contents, reading it in chunks."""
+
+    with open(file_path, 'rb') as file_object:
+        return hashlib.file_digest(file_object, hashlib.blake2b).hexdigest()
+
+
+def generate_hash_for_bytes(raw_data):
+    """Generates BLAKE2b hash of raw_data, e.g. the contents of a single archive member."""
+
+    return hashlib.blake2b(raw_data, digest_size=16).hexdigest()
@@ -1,9 +1,11 @@
 """Helpers for tracking memory usage."""
 
-import psutil
 
 def get_memory_usage():
     """Displays current memory usage."""
+    # psutil is only imported once memory usage is sampled, not on import.
+    import psutil
+
     pid = psutil.Process()
 
     memory_info = pid.memory_info()
@@ -1,15 +1,79 @@
 """Helpers for working with Metabase Serialization Exports."""
+from collections import deque
+import itertools
 import logging
-import tarfile
+import time
 
 from yaml.constructor import ConstructorError as ConstructorError_yaml
 
+from metabase_serialization_py.metabase_export.archive import (
+    SEEK_BYTES_PER_SECOND,
+    STDIN_EXPORT_PATH,
+    export_path_exists,
+    get_export_format,
+    get_member_file_type,
+    get_member_location,
+    get_seek_bytes,
+    open_serialization_tgz,
+    spool_stdin_export,
+)
+from metabase_serialization_py.metabase_export.clone import EntityCloner
+from metabase_serialization_py.metabase_export.data_path_trie import DataPathTrie
+from metabase_serialization_py.metabase_export.dependency_graph import CycleError, DependencyGraph, topological_sort
+from metabase_serialization_py.metabase_export.directory import iter_directory_members, read_directory_member
+from metabase_serialization_py.metabase_export.edit_plans import EditPlan
+from metabase_serialization_py.metabase_export.export_data import DEFAULT_DOCUMENT_CACHE_MB, ExportData
+from metabase_serialization_py.metabase_export.incremental import (
+    drop_empty_index_entries,
+    remove_stale_index_entries,
+    scan_serialization_tgz_changes,
+    sort_index_references,
+)
+from metabase_serialization_py.metabase_export.member_filter import MemberFilter, MemberNameFilter
+from metabase_serialization_py.metabase_export.reference_rules import REFERENCE_EXTRACTORS
+from metabase_serialization_py.metabase_export.overlay import ExportOverlay
+from metabase_serialization_py.metabase_export.references import ReferenceList, ReferenceStore
+from metabase_serialization_py.metabase_export.remap import build_data_path_rewrite_map, group_remapped_references, remap_data_paths
+from metabase_serialization_py.metabase_export.secondary_indexes import ROOT_COLLECTION_ID, SecondaryIndexes
+from metabase_serialization_py.metabase_export.spill_store import ID_INDEX, PATH_INDEX, SpilledIndex, SpillStore
+from metabase_serialization_py.metabase_export.writer import estimate_write_seconds, write_serialization_directory, write_serialization_tgz
+from metabase_serialization_py.metabase_export.index_cache import (
+    get_index_cache_path,
+    load_index_cache,
+    save_index_cache,
+)
+from metabase_serialization_py.hashing import generate_hash_for_file, generate_hash_for_object
 from metabase_serialization_py.memory_usage import get_memory_usage
-from metabase_serialization_py.hashing import generate_hash_for_object
-from metabase_serialization_py.yaml import parse_yaml, Loader
+from metabase_serialization_py.metrics import METRICS
+from metabase_serialization_py.yaml import PARSE_BYTES_PER_SECOND, Loader, StructureInterner, get_interning_loader, parse_yaml
 
 LOGGER = logging.getLogger(__name__)
-logging.basicConfig(encoding='utf-8', level=logging.DEBUG)
+
+# Public interface of the package, including what it re-exports from its modules for the CLI, server, and change list.
+__all__ = (
+    'DEFAULT_DOCUMENT_CACHE_MB',
+    'ROOT_COLLECTION_ID',
+    'CycleError',
+    'EditPlan',
+    'EntityCloner',
+    'ExportData',
+    'ExportOverlay',
+    'MemberFilter',
+    'MetabaseExport',
+    'ReferenceStore',
+    'SecondaryIndexes',
+    'build_data_path_rewrite_map',
+    'estimate_write_seconds',
+    'export_path_exists',
+    'group_remapped_references',
+    'load_serialization_tgz_contents',
+    'remap_data_paths',
+    'serialization_export_loader',
+    'spool_stdin_export',
+    'topological_sort',
+    'write_serialization_directory',
+    'write_serialization_tgz',
+)
 
 # TODOs
 # TODO: replace references to "member" with something more clear like "archive member"
@@ -18,8 +82,12 @@ logging.basicConfig(encoding='utf-8', level=logging.DEBUG)
 # TODO: process changes in order of precedence (delete first, then rename, then move, then copy, etc.)
 
 
-# Disables '=' loader
-Loader.yaml_implicit_resolvers.pop('=')
+# Number of archive members sent to a worker process at a time when parsing in parallel.
+PARALLEL_LOAD_BATCH_SIZE = 256
+# Number of batches queued per worker process before waiting on results.
+PARALLEL_LOAD_BATCHES_PER_WORKER = 2
+# Number of members loaded between memory usage checks against the memory budget of an export.
+MEMORY_BUDGET_CHECK_INTERVAL = 1000
 
 
 def extract_metabase_metadata(file_data):
@@ -28,11 +96,17 @@ def extract_metabase_metadata(file_data):
         ('entity_id', None),
         ('name', None),
         ('display_name', None),
+        ('slug', None),
         ('archived', None),  # TODO: archive or archived? and how will change in v1.50.x when move to trash instead of archive?
         ('entity_type', None),
         ('type', None),
         ('active', None),
         ('created_at', None),
+        # Containers of the entity, for secondary indexes by collection and database.
+        ('collection_id', None),
+        ('parent_id', None),
+        ('database_id', None),
+        ('table_id', None),
         # ('serdes/meta', None),
     )
 
@@ -61,9 +135,6 @@ def extract_metabase_metadata(file_data):
         LOGGER.warning(f'.. "type": {file_data.get('type', None)}')
         LOGGER.warning(f'.. "serdes/metadata": {serdes_metadata}')
 
-        import pdb; pdb.set_trace();  # TODO: REMOVE after debugging
-
-
     metadata['serdes/meta.model'] = detected_serdes_meta_model
 
     if len(file_data.get('serdes/meta', [{}])) > 1:
@@ -71,8 +142,9 @@ def extract_metabase_metadata(file_data):
     else:
         metadata['serdes/meta.id'] = file_data.get('serdes/meta', [{}])[0].get('id', None)
 
-    if metadata['serdes/meta.id'] is None or (not isinstance(metadata['serdes/meta.id'], str) and not isinstance(metadata['serdes/meta.id'], tuple)):
-        import pdb; pdb.set_trace();  # TODO: REMOVE after debugging
+    # Members without serdes/meta.id are indexed by a generated id, see MetabaseExport.add_entity_to_index_by_id.
+    if not isinstance(metadata['serdes/meta.id'], (str, tuple, type(None), )):
+        LOGGER.warning(f'Found object with invalid serdes/meta.id: {serdes_metadata}')
 
     for attribute_name, default_value in MB_SERIALIZATION_FILE_YAML_ATTRIBUTES:
         metadata[attribute_name] = file_data.get(attribute_name, default_value)
@@ -80,113 +152,474 @@ def extract_metabase_metadata(file_data):
     return metadata
 
 
-def load_serialization_tgz_contents(tgz_path):
-    """Returns an iterative of tuples like (member_name, file_type, file_data,).
+def read_serialization_member(tar_file, member, file_type):
+    """Returns raw bytes of a tar member or None if it is not a file, timing reads as 'decompress' metrics."""
+
+    if file_type != 'file':
+        return None
+
+    started = time.perf_counter()
+    raw_data = tar_file.extractfile(member).read()
+    METRICS.add_time('decompress', time.perf_counter() - started)
+
+    return raw_data
+
+
+def parse_serialization_member(member_name, file_type, file_object, loader=Loader):
+    """Returns a tuple like (member_name, parsing_message, file_type, file_data,) for a single archive member.
+        - `file_object` may be a file object or the raw bytes of the member.
+        - `loader` is the YAML Loader class, e.g. an interning loader, see get_interning_loader.
+        - Parsing is timed as 'parse' metrics of the current process.
+    """
+
+    try:
+        if file_type != 'file':
+            file_data = None
+        else:
+            started = time.perf_counter()
+            file_data = parse_yaml(file_object, loader)
+            METRICS.add_time('parse', time.perf_counter() - started)
+
+        return (
+            member_name,
+            None,
+            file_type,
+            file_data,
+        )
+    except ConstructorError_yaml as error:
+        return (
+            member_name,
+            {  #parsing_message
+                'message': 'Error parsing YAML.',
+                'message_type': 'Non-fatal exception (file skipped).',
+                'message_details': error,
+            },
+            file_type,
+            None,
+        )
+
+
+def parse_serialization_member_batch(member_batch, intern=False):
+    """Parses a batch of (member_name, file_type, raw_data, location,) tuples in a worker process.
+        - Returns (parsed_batch, seconds,) so the parsing time of workers is added to the metrics of the main process.
+          parsed_batch lists tuples like (member_name, parsing_message, file_type, file_data, location,).
+        - `intern` shares equal strings and sub-structures between the documents of the batch, which pickling the
+          batch back to the main process keeps.
+    """
+
+    started = time.perf_counter()
+    loader = get_interning_loader(StructureInterner()) if intern else Loader
+    parsed_batch = [(*parse_serialization_member(member_name, file_type, raw_data, loader), location, ) for member_name, file_type, raw_data, location in member_batch]
+
+    return (parsed_batch, time.perf_counter() - started, )
+
+
+def parse_serialization_file_batch(member_batch, intern=False):
+    """Reads and parses a batch of (member_name, file_type, path,) members of an export directory in a worker process,
+        see parse_serialization_member_batch.
+        - Files are read by the worker, so only their paths are sent to it; `seconds` includes reading them.
+    """
+
+    started = time.perf_counter()
+    parsed_batch, seconds = parse_serialization_member_batch([read_directory_member(*member) for member in member_batch], intern)
+
+    return (parsed_batch, time.perf_counter() - started, )
+
+
+def read_serialization_tgz_members(tgz_path, stream=False, member_filter=None, digest=False):
+    """Returns an iterative of (member_name, file_type, raw_data, location,) in archive order.
+        - `stream` reads the archive in a single streaming pass, see open_serialization_tgz.
+        - `digest` adds the content hash of each member to its location, see get_member_location.
+    """
+
+    with open_serialization_tgz(tgz_path, stream) as tar_file:
+        for member in tar_file:
+            file_type = get_member_file_type(member)
+
+            if member_filter is not None and not member_filter.select(member.name, file_type):
+                continue
+
+            raw_data = read_serialization_member(tar_file, member, file_type)
+
+            yield (member.name, file_type, raw_data, get_member_location(member, raw_data, digest), )
+
+
+def iter_parsed_member_batches_parallel(member_batches, workers, parse_batch, intern=False):
+    """Returns an iterative of tuples like (member_name, parsing_message, file_type, file_data, location,) in batch
+        order, parsing each batch of member_batches with parse_batch in a pool of `workers` processes.
+        - `parse_batch` is parse_serialization_member_batch for batches of archive members, read and decompressed once
+          in this process so only raw member bytes are sent to workers, or parse_serialization_file_batch for batches
+          of directory members, read by the workers.
+        - Exports that fit in a single batch are parsed in this process without starting a pool.
+    """
+
+    first_batch = next(member_batches, ())
+    second_batch = next(member_batches, None)
+
+    if second_batch is None:
+        # Parsed in this process, parse_serialization_member adds its own metrics.
+        parsed_batch, seconds = parse_batch(first_batch, intern)
+
+        yield from parsed_batch
+
+        return
+
+    # multiprocessing is only imported by parallel loads.
+    from concurrent.futures import ProcessPoolExecutor
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        # Bound the batches in flight so raw member bytes are not all held in memory at once.
+        pending_batches = deque()
+
+        def next_results():
+            parsed_batch, seconds = pending_batches.popleft().result()
+            METRICS.add_time('parse', seconds, len(parsed_batch))
+
+            yield from parsed_batch
+
+        for member_batch in itertools.chain((first_batch, second_batch, ), member_batches):
+            pending_batches.append(executor.submit(parse_batch, member_batch, intern))
+
+            if len(pending_batches) >= workers * PARALLEL_LOAD_BATCHES_PER_WORKER:
+                yield from next_results()
+
+        while pending_batches:
+            yield from next_results()
+
+
+def iter_serialization_tgz_members(tgz_path, workers=1, stream=False, member_filter=None, intern=False, digest=False):
+    """Returns an iterative of tuples like (member_name, parsing_message, file_type, file_data, location,).
+        - `location` is (offset_data, size, digest,) of the member's data in the uncompressed archive, without an
+          offset for members of export directories.
+        - `digest` is computed only when `digest` is True, for archives whose locations are saved to the index cache
+          and compared by later incremental loads. Export directories are not cached and have no digest.
+        - See load_serialization_tgz_contents for `workers`, `stream`, `member_filter`, and `intern`.
+    """
+
+    if get_export_format(tgz_path) == 'directory':
+        if workers > 1:
+            member_batches = itertools.batched(iter_directory_members(tgz_path, member_filter), PARALLEL_LOAD_BATCH_SIZE)
+
+            yield from iter_parsed_member_batches_parallel(member_batches, workers, parse_serialization_file_batch, intern)
+
+            return
+
+        members = (read_directory_member(*member) for member in iter_directory_members(tgz_path, member_filter))
+    else:
+        # Parallel loads read the archive in a single streaming pass.
+        members = read_serialization_tgz_members(tgz_path, stream or workers > 1, member_filter, digest)
+
+        if workers > 1:
+            yield from iter_parsed_member_batches_parallel(itertools.batched(members, PARALLEL_LOAD_BATCH_SIZE), workers, parse_serialization_member_batch, intern)
+
+            return
+
+    interner = StructureInterner() if intern else None
+    loader = Loader if interner is None else get_interning_loader(interner)
+
+    for member_name, file_type, raw_data, location in members:
+        yield (*parse_serialization_member(member_name, file_type, raw_data, loader), location, )
+
+    if interner is not None:
+        stats = interner.stats()
+        METRICS.count('interned', 'values', stats['values'])
+        METRICS.count('interned', 'shared', stats['shared'])
+        LOGGER.info(f'Interned {stats["values"]} strings and structures, shared {stats["shared"]} times.')
+
+
+def load_serialization_tgz_contents(tgz_path, workers=1, stream=False, member_filter=None, intern=False):
+    """Returns an iterative of tuples like (member_name, parsing_message, file_type, file_data,).
+        - `tgz_path` is a gzip or zstd-compressed tarball, an uncompressed tar file, or a directory the export was
+          extracted to, see get_export_format and iter_directory_members.
         - `file_data` will return None if type is directory or file is empty.
+        - `workers` greater than 1 parses members in parallel processes; results keep archive order.
+        - `stream` parses members in a single sequential pass; always used when reading from stdin or zstd.
+        - `member_filter` skips members by archive path before they are read or parsed, see MemberFilter.
+        - `intern` shares equal strings and sub-structures between the parsed documents, see StructureInterner.
+          Sequences of strings load as tuples and shared values must not be changed in place; the documents are
+          otherwise equal and dump to the same YAML. Parallel workers share values within each batch they parse.
     """
 
-    with tarfile.open(tgz_path, 'r:gz') as tar_file:
-        for member in tar_file.getmembers():
-            try:
-                file_type = 'file' if member.isfile() else ('dir' if member.isdir() else 'not file or dir')
-                file_data = None if file_type != 'file' else parse_yaml(tar_file.extractfile(member.name), Loader)
-
-                yield (
-                    member.name,
-                    None,
-                    file_type,
-                    file_data,
-                )
-            except ConstructorError_yaml as error:
-                # import pdb; pdb.set_trace();  # TODO: REMOVE after debugging
-                yield (
-                    member.name,
-                    {  #parsing_message
-                        'message': 'Error parsing YAML.',
-                        'message_type': 'Non-fatal exception (file skipped).',
-                        'message_details': error,
-                    },
-                    file_type,
-                    None,
-                )
+    for member_name, parsing_message, file_type, file_data, location in iter_serialization_tgz_members(tgz_path, workers, stream, member_filter, intern):
+        yield (member_name, parsing_message, file_type, file_data, )
 
 
-def serialization_export_loader(serialization_file_path):
-    """Loads Metabase Serialization file."""
+def iter_serialization_export(serialization_file_path, workers=1, stream=False, members=None, member_filter=None, intern=False, digest=False):
+    """Returns an iterative of tuples like (member_name, parsing_message, file_type, metadata, file_data, location,)
+        for the members of a Metabase Serialization file that are kept in export data.
+        - `members` replaces the archive members read from the file with already parsed member tuples, see
+          iter_serialization_tgz_members, which also describes `digest`.
+    """
     LOGGER.info('Attempting to load Metabase Serialization export tgz file.')
 
-    contents = []
+    if members is None:
+        members = iter_serialization_tgz_members(serialization_file_path, workers, stream, member_filter, intern, digest)
 
-    for member_name, parsing_message, file_type, file_data in load_serialization_tgz_contents(serialization_file_path):
-        LOGGER.debug(f'Current Memory Usage: {get_memory_usage():.2f} MB')
-        LOGGER.info(f'Found object: {member_name}')
-        LOGGER.debug(f'.. File type: {file_type}')
-        LOGGER.debug(f'.. File data: {file_data}')
+    debug = LOGGER.isEnabledFor(logging.DEBUG)
+
+    for member_name, parsing_message, file_type, file_data, location in members:
+        if debug:
+            LOGGER.debug(f'Found object: {member_name}')
+            LOGGER.debug(f'.. File type: {file_type}')
+            LOGGER.debug(f'.. File data: {file_data}')
 
         metadata = None
 
         if file_type == 'file':
             if not (member_name.endswith('.yml') or member_name.endswith('.yaml')):
-                LOGGER.info(f'Skipping non-YAML file: {member_name}')
+                LOGGER.info('Skipping non-YAML file: %s', member_name)
+                METRICS.count('skipped', 'non-YAML')
 
                 continue
 
             if parsing_message is None:
-                serdes_metadata = None if file_data.get('serdes/meta', None) is None else file_data.get('serdes/meta', None)[0]
-
-                if serdes_metadata is not None:
-                    serdes_metadata_model = serdes_metadata.get('model', None)
-
                 skip_metadata_extraction_conditions = (
                     'settings.yaml' in member_name or 'settings.yml' in member_name,  # Skip settings.yaml
                     # '/snippets/' in member_name,  # Skip snippets
-                    # serdes_metadata_model is 'Collection',
                 )
 
                 if any(skip_metadata_extraction_conditions):
-                    LOGGER.debug(f'No metadata to extract for : {member_name}')
+                    LOGGER.debug('No metadata to extract for : %s', member_name)
+                    METRICS.count('skipped', 'settings')
 
                     continue
 
+                started = time.perf_counter()
                 metadata = extract_metabase_metadata(file_data)
+                METRICS.add_time('metadata', time.perf_counter() - started)
+                METRICS.count('members', metadata['serdes/meta.model'])
+                METRICS.count('bytes', metadata['serdes/meta.model'], location[1])
             else:
+                METRICS.count('skipped', 'parsing error')
                 LOGGER.warning(f"{parsing_message['message']}")
                 LOGGER.warning('.. Details:')
                 LOGGER.warning(f"{parsing_message['message_type']}")
                 LOGGER.warning(parsing_message['message_details'])
 
-            LOGGER.debug(f'.. Metadata: {metadata}')
+            if debug:
+                LOGGER.debug(f'.. Metadata: {metadata}')
+        else:
+            METRICS.count('members', file_type)
 
-        contents.append((
+        yield (
             member_name,
             parsing_message,
             file_type,
             metadata,
             file_data,
-        ))
+            location,
+        )
+
 
-    return tuple(contents)
+def serialization_export_loader(serialization_file_path, workers=1, stream=False, intern=False):
+    """Loads Metabase Serialization file."""
+
+    return tuple([
+        (member_name, parsing_message, file_type, metadata, file_data, )
+        for member_name, parsing_message, file_type, metadata, file_data, location
+        in iter_serialization_export(serialization_file_path, workers, stream, intern=intern)
+    ])
 
 
 class MetabaseExport:
-    index_by_id = {}
-    data_index_by_path = {}
+    def __init__(self, export_path, workers=1, stream=False, lazy=False, cache_size_mb=DEFAULT_DOCUMENT_CACHE_MB, index_cache_dir=None, previous_export_path=None, member_filter=None, previous_export_hash=None, memory_budget_mb=None, intern=False):
+        """Loads and indexes a Metabase Serialization export.
+            - `lazy` keeps only metadata and member locations in memory and re-parses file_data on demand through a
+              cache bounded to `cache_size_mb` of raw YAML.
+            - `export_path` is an export tarball or directory, see load_serialization_tgz_contents.
+            - `index_cache_dir` reuses metadata and indexes cached for the same export contents, skipping parsing and
+              indexing. Exports loaded from the cache are lazy. Export directories are not cached.
+            - `previous_export_path` re-parses and re-indexes only the members changed since a previous export whose
+              indexes are in `index_cache_dir`. Exports loaded incrementally are lazy.
+            - `previous_export_hash` identifies the previous export by the content hash of its file instead, e.g. once
+              the file was replaced by the export, see `export_hash`.
+            - `member_filter` loads only the members it selects by archive path, and the database members referenced
+              by them, see MemberFilter. Filtered exports are not read from or saved to the index cache.
+            - `memory_budget_mb` spills the indexes and parsed documents to a temporary SQLite database once memory
+              usage is over that many MB, see spill. Spilled exports are not saved to the index cache.
+            - `intern` shares equal strings and sub-structures between the documents of eager exports, see
+              load_serialization_tgz_contents.
+        """
+        if lazy and export_path == STDIN_EXPORT_PATH:
+            raise ValueError('Lazy exports re-read members from the export file and cannot be read from stdin.')
+
+        if previous_export_path is not None and previous_export_hash is None:
+            previous_export_hash = generate_hash_for_file(previous_export_path)
+
+        # The index cache is keyed by the content hash of the export file.
+        is_export_file = export_path != STDIN_EXPORT_PATH and get_export_format(export_path) != 'directory'
+
+        if previous_export_hash is not None and (index_cache_dir is None or not is_export_file):
+            raise ValueError('Incremental loading needs an index cache directory and an export file, not stdin or a directory.')
+
+        if member_filter is not None and member_filter.is_empty():
+            member_filter = None
+
+        if member_filter is not None and (previous_export_hash is not None or export_path == STDIN_EXPORT_PATH):
+            raise ValueError('Filtered exports re-read the export file for referenced database members and cannot be loaded from stdin or incrementally.')
+
+        # Loading includes the 'decompress' (or 'read' for directories), 'parse', 'metadata', and 'index' metrics of each member.
+        with METRICS.phase('load'):
+            # Indexes are per export so several exports can be loaded in one process.
+            self.reference_store = ReferenceStore()
+            self.index_by_id = {}
+            self.data_index_by_path = {}
+            self.memory_budget_mb = memory_budget_mb
+            self.spill_store = None
+
+            export_hash = None
+            index_cache = None
+            previous_index_cache = None
+
+            if index_cache_dir is not None and is_export_file and member_filter is None:
+                export_hash = generate_hash_for_file(export_path)
+                index_cache = load_index_cache(index_cache_dir, export_hash)
+
+            if index_cache is None and previous_export_hash is not None:
+                previous_index_cache = load_index_cache(index_cache_dir, previous_export_hash)
+
+                if previous_index_cache is None:
+                    LOGGER.warning(f'No index cache found for previous export {previous_export_path or previous_export_hash}. Loading the full export.')
+
+            if index_cache is not None:
+                LOGGER.info(f'Loaded export metadata and indexes from cache: {get_index_cache_path(index_cache_dir, export_hash)}')
+
+                self.export_data = ExportData.from_entries(export_path, index_cache['entries'], index_cache['locations'], cache_size_mb)
+                self.reference_store = index_cache['reference_store']
+                self.index_by_id = index_cache['index_by_id']
+                self.data_index_by_path = index_cache['data_index_by_path']
+            else:
+                if previous_index_cache is not None:
+                    self.load_export_data_incremental(export_path, previous_index_cache, cache_size_mb)
+                else:
+                    # Documents of lazy exports are parsed on demand and not kept, so there is nothing to share.
+                    # Member digests are only read by incremental loads of a later export, from the index cache.
+                    self.load_export_data(export_path, workers, stream, lazy, cache_size_mb, member_filter, intern and not lazy, export_hash is not None)
+
+                if export_hash is not None and self.spill_store is not None:
+                    LOGGER.info('Spilled export indexes are not saved to the index cache.')
+                elif export_hash is not None:
+                    save_index_cache(index_cache_dir, export_hash, {
+                        'entries': self.export_data.entries,
+                        'locations': self.export_data.locations,
+                        'reference_store': self.reference_store,
+                        'index_by_id': self.index_by_id,
+                        'data_index_by_path': self.data_index_by_path,
+                    })
+
+            # Also checked once loaded, for exports loaded from the index cache or incrementally.
+            self.check_memory_budget()
+
+            # Content hash of the export file when loaded with an index cache, or None.
+            self.export_hash = export_hash
+            self.secondary_indexes = SecondaryIndexes(self.export_data)
+            self.dependency_graph = None
+            self.data_path_trie = None
+
+            self.files_skipped = tuple([(member_name, parsing_message,) for member_name, parsing_message, file_type, metadata in self.export_data.entries if parsing_message is not None])
+
+            if self.files_skipped:
+                LOGGER.warning('Could not parse the following files in export.')
+
+                for file_skipped_name, message in self.files_skipped:
+                    LOGGER.warning(f'.. {file_skipped_name}')
+                    LOGGER.warning(f'.. {message}')
+
+    def load_export_data(self, export_path, workers, stream, lazy, cache_size_mb, member_filter=None, intern=False, digest=False):
+        """Loads export_data from the export and indexes each member as it is loaded.
+            - With a `member_filter`, deferred database members referenced by the selected members are loaded in a
+              second pass over the export, after the selected members.
+            - `digest` adds the content hash of each member to its location, see iter_serialization_tgz_members.
+        """
+
+        self.export_data = ExportData(export_path, lazy, cache_size_mb)
+
+        self.load_export_members(export_path, workers, stream, member_filter, intern, digest)
+
+        if member_filter is None:
+            return
+
+        dependency_member_names = member_filter.get_dependency_member_names(self.data_index_by_path)
+
+        LOGGER.info(f'Filtered load: {len(self.export_data)} selected members, {len(dependency_member_names)} of {len(member_filter.deferred_members)} database members referenced.')
+        METRICS.count('skipped', 'unreferenced', len(member_filter.deferred_members) - len(dependency_member_names))
 
-    def __init__(self, export_path):
-        LOGGER.debug(f'Current Memory Usage: {get_memory_usage():.2f} MB')
-        self.export_data = serialization_export_loader(export_path)
+        if dependency_member_names:
+            self.load_export_members(export_path, workers, stream, MemberNameFilter(dependency_member_names), intern)
 
-        self.files_skipped = tuple([(member_name, parsing_message,) for member_name, parsing_message, file_type, metadata, file_data in self.export_data if parsing_message is not None])
+    def load_export_members(self, export_path, workers, stream, member_filter=None, intern=False, digest=False):
+        """Appends the members of the export selected by member_filter to export_data and indexes them."""
+
+        # Index each member as it is loaded so lazy exports never hold more than one parsed document at a time.
+        for member_name, parsing_message, file_type, metadata, file_data, location in iter_serialization_export(export_path, workers, stream, member_filter=member_filter, intern=intern, digest=digest):
+            i = self.export_data.append(member_name, parsing_message, file_type, metadata, file_data, location)
+
+            self.index_export_member(i, member_name, file_type, metadata, file_data)
+
+            if i % MEMORY_BUDGET_CHECK_INTERVAL == 0:
+                self.check_memory_budget()
+
+        if self.spill_store is not None:
+            self.spill_store.flush()
+
+    def load_export_data_incremental(self, export_path, previous_index_cache, cache_size_mb):
+        """Loads lazy export_data from the export, re-using the previous export's indexes for unchanged members.
+            - Members are compared by size and content hash; only changed and added members are parsed and indexed.
+            - References from changed and removed members are removed, giving the same indexes as a full load.
+        """
+
+        previous_members = {entry[0]: (entry, location, ) for entry, location in zip(previous_index_cache['entries'], previous_index_cache['locations'])}
+        previous_positions = {member_name: i for i, member_name in enumerate(previous_members)}
+
+        scanned_members, changed_members = scan_serialization_tgz_changes(export_path, previous_members, parse_serialization_member)
+        changed_exports = {member[0]: member for member in iter_serialization_export(export_path, members=changed_members)}
+
+        self.export_data = ExportData(export_path, True, cache_size_mb)
+        self.reference_store = previous_index_cache['reference_store']
+        self.index_by_id = previous_index_cache['index_by_id']
+        self.data_index_by_path = previous_index_cache['data_index_by_path']
+
+        member_positions = {}
+        unchanged_previous_positions = []
+        changed_members_to_index = []
+
+        for member_name, previous_entry, previous_location, location in scanned_members:
+            if previous_entry is not None:
+                # Directories have no location in export data.
+                i = self.export_data.append_entry(previous_entry, None if previous_location is None else location)
+                unchanged_previous_positions.append(previous_positions[member_name])
+            elif member_name in changed_exports:
+                member_name, parsing_message, file_type, metadata, file_data, location = changed_exports[member_name]
+                i = self.export_data.append(member_name, parsing_message, file_type, metadata, file_data, location)
+                changed_members_to_index.append((i, member_name, file_type, metadata, file_data, ))
+            else:
+                continue
 
-        if self.files_skipped:
-            LOGGER.warning('Could not parse the following files in export.')
+            member_positions[member_name] = i
 
-            for file_skipped_name, message in files_skipped:
-                LOGGER.warning(f'.. {file_skipped_name}')
-                LOGGER.warning(f'.. {message}')
+        stale_member_names = set(previous_members).difference(member_name for member_name, previous_entry, _, _ in scanned_members if previous_entry is not None)
+        removed_member_names = set(previous_members).difference(member_name for member_name, _, _, _ in scanned_members)
 
-        self.create_entity_index_by_id()
-        LOGGER.debug(f'Current Memory Usage: {get_memory_usage():.2f} MB')
+        LOGGER.info(f'Incremental load: {len(changed_members)} changed or added members, {len(removed_member_names)} removed members, {len(unchanged_previous_positions)} unchanged members.')
+
+        remove_stale_index_entries(self.index_by_id, self.data_index_by_path, self.reference_store, stale_member_names, member_positions)
+
+        first_new_row = len(self.reference_store)
+
+        for member in changed_members_to_index:
+            self.index_export_member(*member)
+
+        drop_empty_index_entries(self.index_by_id, self.data_index_by_path)
+
+        # Unchanged members keep their relative order unless the archive was reordered.
+        reorder_all = unchanged_previous_positions != sorted(unchanged_previous_positions)
+        sort_index_references(self.index_by_id, self.data_index_by_path, self.reference_store, member_positions, first_new_row, reorder_all)
+
+        reference_lists = [entry['references'] for index in (self.index_by_id, self.data_index_by_path, ) for entry in index.values()]
+
+        if sum(len(references) for references in reference_lists) * 2 < len(self.reference_store):
+            # Drop rows of removed references once they make up most of the store.
+            self.reference_store.compact(reference_lists)
 
     def __getattr__(self, search_name):
         """Looks up value of either entity_id or tuple of data path."""
@@ -194,325 +627,280 @@ class MetabaseExport:
         if isinstance(search_name, tuple):
             return self.data_index_by_path[search_name]
 
+        if search_name.startswith('__') or search_name in ('reference_store', 'index_by_id', 'data_index_by_path', 'export_data', 'secondary_indexes', 'dependency_graph', 'data_path_trie', 'export_hash', 'memory_budget_mb', 'spill_store', ):
+            # Not an index lookup, e.g. copy/pickle probing for special methods before indexes exist.
+            raise AttributeError(search_name)
+
         return self.index_by_id[search_name]
 
-    def create_entity_index_by_id(self):
-        """Creates index of entity ids, references, and reference paths from export_data."""
+    def check_memory_budget(self):
+        """Spills the export once memory usage is over memory_budget_mb."""
 
-        for i, (member_name, parsing_message, file_type, metadata, file_data) in enumerate(self.export_data):
-            if file_type != 'file':
-                # Only review files (skip directories, etc.).
+        if self.memory_budget_mb is None or self.spill_store is not None:
+            return
 
-                continue
+        memory_usage = get_memory_usage()
 
-            if metadata is None:
-                LOGGER.warning(f'Found member with empty metadata: {member_name}')
+        if memory_usage > self.memory_budget_mb:
+            LOGGER.info(f'Memory usage of {memory_usage:.0f} MB is over the budget of {self.memory_budget_mb} MB.')
 
-                import pdb; pdb.set_trace();  # TODO: REMOVE after debugging
+            self.spill()
 
-            serdes_meta_id = metadata['serdes/meta.id']
+    def spill(self):
+        """Moves index_by_id, data_index_by_path, and the parsed documents of eager exports to a SpillStore.
+            - The indexes are replaced by SpilledIndex mappings with the same lookups, and members indexed afterwards
+              are added to the store in batches.
+            - Documents are read back from the store through the export_data DocumentCache, like lazy exports.
+        """
 
-            self.add_entity_to_index_by_id(serdes_meta_id, i, member_name)
+        started = time.perf_counter()
+        spill_store = SpillStore()
 
-            # Find external references and add to index
-            self.update_entity_references(file_data, member_name, serdes_meta_id, metadata)
+        for kind, index in ((ID_INDEX, self.index_by_id, ), (PATH_INDEX, self.data_index_by_path, ), ):
+            for key, index_entry in index.items():
+                spill_store.add_entity(kind, key, index_entry.get('i', None), index_entry.get('filename', None))
 
-        # import pdb; pdb.set_trace();  # TODO: REMOVE after debugging
+                for reference in index_entry['references']:
+                    spill_store.add_reference(kind, key, reference)
 
-    def add_entity_to_index_by_id(self,  serdes_meta_id, i, member_name):
-        """Create entity entry in index by id."""
+        self.export_data.spill(spill_store)
+        spill_store.flush()
 
-        if serdes_meta_id is None:
-            # Generate unique entity_id if none exists.
-            LOGGER.warning(f'Found object with no serdes/meta.id: {member_name}. Generating unique id based on file name and path.')
-            generated_hash = 'mb_' + generate_hash_for_object(member_name)
-            LOGGER.warning(f'.. Using {generated_hash} as entity_id.')
+        self.spill_store = spill_store
+        self.index_by_id = SpilledIndex(spill_store, ID_INDEX)
+        self.data_index_by_path = SpilledIndex(spill_store, PATH_INDEX)
+        # References are in the store, with the values they were interned as.
+        self.reference_store = None
+        self.dependency_graph = None
+        self.data_path_trie = None
 
-            import pdb; pdb.set_trace();  # TODO: REMOVE after debugging
+        METRICS.add_time('spill', time.perf_counter() - started)
+        LOGGER.info(f'Spilled export indexes and documents to {spill_store.path} in {time.perf_counter() - started:.2f}s.')
 
-        if serdes_meta_id not in self.index_by_id:
-            self.index_by_id[serdes_meta_id] = {}
+    def get_dependency_graph(self):
+        """Returns the DependencyGraph of the export's entities, building it from the reference indexes on first use."""
 
-        if serdes_meta_id in self.index_by_id and 'i' in self.index_by_id[serdes_meta_id] and self.index_by_id[serdes_meta_id]['i'] != i:
-            # Check for entity ID duplicates.
-            LOGGER.warning(f'Found existing reference to {member_name} at index {i}. Potential duplicate entity key.')
+        if self.dependency_graph is None:
+            self.dependency_graph = DependencyGraph(self.index_by_id, self.data_index_by_path)
 
-            import pdb; pdb.set_trace();  # TODO: REMOVE after debugging
+        return self.dependency_graph
 
-        self.index_by_id[serdes_meta_id]['i'] = i
-        self.index_by_id[serdes_meta_id]['filename'] = member_name
+    def get_data_path_trie(self):
+        """Returns a DataPathTrie of the data paths in data_index_by_path, building it on first use."""
 
-        if 'references' not in self.index_by_id[serdes_meta_id]:
-            self.index_by_id[serdes_meta_id]['references'] = []
+        if self.data_path_trie is None:
+            self.data_path_trie = DataPathTrie(self.data_index_by_path)
 
-    def update_entity_references_collection(self, file_data, serdes_meta_id, member_name):
-        """Updates Collection entity indices by adding external references found in file_data to referenced entities."""
+        return self.data_path_trie
 
-        # Collections only have parent_id references or no references if at the top level.
+    def find_data_paths(self, prefix):
+        """Returns tuple of referenced data paths under a database, schema, or table prefix like (database, schema,)."""
 
-        if file_data['parent_id'] is not None:
-            self.add_entity_reference_to_index_by_id(file_data['parent_id'], 'Collection', 'parent_id', serdes_meta_id, member_name)
+        return tuple(self.get_data_path_trie().iter_prefix(tuple(prefix)))
 
-    def update_entity_references_timeline(self, file_data, serdes_meta_id, member_name):
-        """Updates Timeline entity indices by adding external references found in file_data to referenced entities."""
+    def get_member_references(self, positions):
+        """Returns tuple of (i, member_name, metadata,) for export data positions, sharing the loaded metadata."""
 
-        if file_data['collection_id']:
-            self.add_entity_reference_to_index_by_id(file_data['collection_id'], 'Timeline', 'collection_id', serdes_meta_id, member_name)
+        entries = self.export_data.entries
 
-    def update_entity_references_action(self, file_data, serdes_meta_id, member_name):
-        """Updates Action entity indices by adding external references found in file_data to referenced entities."""
+        return tuple([(i, entries[i][0], entries[i][3], ) for i in positions])
 
-        if file_data['model_id']:
-            self.add_entity_reference_to_index_by_id(file_data['model_id'], 'Action', 'model_id', serdes_meta_id, member_name)
+    def get_member(self, member_name):
+        """Returns (i, member_name, metadata,) of an export member or None."""
 
-    def update_entity_references_field(self, file_data, serdes_meta_id, member_name):
-        """Updates Field entity indices by adding external references found in file_data to referenced entities."""
+        i = self.secondary_indexes.get_member_position(member_name)
 
-        if file_data['table_id']:
-            self.add_entity_reference_to_data_index_by_path(tuple(file_data['table_id']), 'Field', 'table_id', serdes_meta_id, member_name)
+        return None if i is None else self.get_member_references((i, ))[0]
 
-        for i, serdes_meta in enumerate(file_data['serdes/meta'][:-1]):
-            path_reference = tuple([meta['id'] for meta in file_data['serdes/meta']])[:i + 1]
-            # TODO: may need to refactor to be .path_reference instead of .id
-            self.add_entity_reference_to_data_index_by_path(path_reference, 'Field', f'serdes/meta[{i}].id', serdes_meta_id, member_name)
+    def get_member_size(self, member_name):
+        """Returns the size in bytes of the data of an export member, 0 for members without data or not found."""
 
-    def update_entity_references_table(self, file_data, serdes_meta_id, member_name):
-        """Updates Table entity indices by adding external references found in file_data to referenced entities."""
+        i = self.secondary_indexes.get_member_position(member_name)
+        location = None if i is None else self.export_data.locations[i]
 
-        if file_data['db_id']:
-            self.add_entity_reference_to_data_index_by_path(tuple(file_data['db_id']), 'Table', 'db_id', serdes_meta_id, member_name)
+        return 0 if location is None else location[1]
 
-        for i, serdes_meta in enumerate(file_data['serdes/meta'][:-1]):
-            path_reference = tuple([meta['id'] for meta in file_data['serdes/meta']])[:i + 1]
-            # TODO: may need to refactor to be .path_reference instead of .id
-            self.add_entity_reference_to_data_index_by_path(path_reference, 'Table', f'serdes/meta[{i}].id', serdes_meta_id, member_name)
+    def estimate_read_seconds(self, member_names):
+        """Returns the estimated seconds to read the documents of export members in order.
+            - Documents kept in memory are free; those of lazy and spilled exports are parsed again.
+            - Lazy reads from compressed tarballs also decompress the archive up to each member, see get_seek_bytes.
+        """
 
-    def update_entity_references_metric(self, file_data, serdes_meta_id, member_name):
-        """Updates Metric entity indices by adding external references found in file_data to referenced entities."""
+        export_data = self.export_data
 
+        if export_data.documents is not None:
+            return 0.0
 
-        if file_data['table_id']:
-            self.add_entity_reference_to_data_index_by_path(tuple(file_data['table_id']), 'Metric', 'table_id', serdes_meta_id, member_name)
-        else:
-            self.add_entity_reference_to_data_index_by_path(tuple(file_data['definition']['source-table']), 'Metric', 'definition.source-table', serdes_meta_id, member_name)
+        locations = [export_data.locations[i] for i in (self.secondary_indexes.get_member_position(member_name) for member_name in member_names) if i is not None]
+        locations = [location for location in locations if location is not None]
+        seconds = sum(location[1] for location in locations) / PARSE_BYTES_PER_SECOND
+        export_format = get_export_format(export_data.export_path) if export_data.lazy else None
 
-    def update_entity_references_segment(self, file_data, serdes_meta_id, member_name):
-        """Updates Segment entity indices by adding external references found in file_data to referenced entities."""
+        if export_format in SEEK_BYTES_PER_SECOND:
+            seconds += get_seek_bytes(locations) / SEEK_BYTES_PER_SECOND[export_format]
 
-        if file_data['table_id']:
-            self.add_entity_reference_to_data_index_by_path(tuple(file_data['table_id']), 'Segment', 'table_id', serdes_meta_id, member_name)
-        else:
-            self.add_entity_reference_to_data_index_by_path(tuple(file_data['definition']['source-table']), 'Segment', 'definition.source-table', serdes_meta_id, member_name)
-
-    def update_entity_references_dashboard(self, file_data, serdes_meta_id, member_name):
-        """Updates Dashboard entity indices by adding external references found in file_data to referenced entities."""
-
-        if file_data['collection_id']:
-            self.add_entity_reference_to_index_by_id(file_data['collection_id'], 'Dashboard', 'collection_id', serdes_meta_id, member_name)
-
-        # Dashboard entities with content other than text/headers should have external references in the dashcards array.
-
-        for i, dashcard in enumerate(file_data['dashcards']):
-            self.add_entity_reference_to_index_by_id(dashcard['entity_id'], 'Dashboard', f'dashboard.dashcards[{i}].entity_id', serdes_meta_id, member_name)
-
-            # Skip virtual cards like headings and text blocks since they don't have a 'card_id' in the 'dashcard' statement.
-
-            if  'visualization_settings' not in dashcard or 'virtual_card' not in dashcard['visualization_settings']:
-                self.add_entity_reference_to_index_by_id(dashcard['card_id'], 'Dashboard', f'dashboard.dashcards[{i}].card_id', serdes_meta_id, member_name)
-
-            for j, parameter_mappings in enumerate(dashcard['parameter_mappings']):
-                if 'card_id' in parameter_mappings:
-                    self.add_entity_reference_to_index_by_id(
-                        parameter_mappings['card_id'],
-                        'Dashboard',
-                        f'dashboard.dashcards[{i}].parameter_mappings[{j}].card_id',
-                        serdes_meta_id,
-                        member_name
-                    )
-
-                if 'action_id' in parameter_mappings:
-                    self.add_entity_reference_to_index_by_id(
-                        parameter_mappings['action_id'],
-                        'Dashboard',
-                        f'dashboard.dashcards[{i}].parameter_mappings[{j}].action_id',
-                        serdes_meta_id,
-                        member_name
-                    )
-
-    def update_source_table_reference_to_index(self, source_table_reference, entity_model, relationship, serdes_meta_id, member_name):
-        """Adds source-table reference to either data_index_by_path or index_by_id depending on whether the source-table
-            reference is to a data path list or an entity_id."""
-
-        if isinstance(source_table_reference, list):
-            add_entity_reference_func = self.add_entity_reference_to_data_index_by_path
-            source_table_reference_for_func = tuple(source_table_reference)
-        else:
-            add_entity_reference_func = self.add_entity_reference_to_index_by_id
-            source_table_reference_for_func = source_table_reference
-
-        add_entity_reference_func(
-            source_table_reference_for_func,
-            entity_model,
-            relationship,
-            serdes_meta_id,
-            member_name
-        )
+        return seconds
 
-    def update_entity_references_card(self, file_data, serdes_meta_id, member_name):
-        """Updates Card entity indices by adding external references found in file_data to referenced entities."""
+    def find_members(self, model=None, collection_id=None, database=None, name=None, slug=None, archived=None):
+        """Returns tuple of (i, member_name, metadata,) of members matching all given criteria, in archive order.
+            - `collection_id` is the entity_id of the collection members are directly in, or ROOT_COLLECTION_ID. A
+              collection is in its parent collection.
+            - `database` is the name of the database of Databases, Tables, Fields, Segments, Metrics, and Cards.
+            - Looked up in secondary indexes built on first use, documents are not parsed.
+        """
 
-        if file_data['collection_id']:
-            self.add_entity_reference_to_index_by_id(file_data['collection_id'], 'Card', 'collection_id', serdes_meta_id, member_name)
+        return self.get_member_references(self.secondary_indexes.find(model=model, collection=collection_id, database=database, name=name, slug=slug, archived=archived))
 
-        self.add_entity_reference_to_data_index_by_path((file_data['database_id'], ), 'Card', 'database_id', serdes_meta_id, member_name)
+    def find_referencing_members(self, reference_key, model=None):
+        """Returns tuple of (i, member_name, metadata,) of members referencing an entity_id or data path tuple,
+            e.g. the dashboards using a card with model='Dashboard'.
+        """
 
-        if file_data['table_id']:
-            # All non-native queries not based on other queries/cards should have a table_id.
-            self.add_entity_reference_to_data_index_by_path(tuple(file_data['table_id']), 'Card', 'table_id', serdes_meta_id, member_name)
+        index = self.data_index_by_path if isinstance(reference_key, tuple) else self.index_by_id
+        index_entry = index.get(reference_key, None)
 
-        # TODO: handle recursively from tuple of paths and parameters
+        if index_entry is None:
+            return ()
 
-        # TODO: Capture dataset_query ... - data_index_by_path ANY MORE??
-        # TODO: Capture dataset_query ... - index_by_id ANY MORE??
+        member_names = dict.fromkeys(member_name for entity_model, relationship, serdes_meta_id, member_name in index_entry['references'] if model is None or entity_model == model)
+        positions = [self.secondary_indexes.get_member_position(member_name) for member_name in member_names]
 
-        if 'dataset_query' in file_data:
-            # Capture dataset_query.database - data_index_by_path
+        return self.get_member_references([i for i in positions if i is not None])
 
-            if 'database' in file_data['dataset_query']:
-                self.add_entity_reference_to_data_index_by_path(
-                    (file_data['dataset_query']['database'], ),
-                    'Card',
-                    'dataset_query.database',
-                    serdes_meta_id,
-                    member_name
-                )
-            # Capture dataset_query.query.source-table - data_index_by_path or index_by_id depending on reference type
-
-            if 'query' in file_data['dataset_query']:
-                if 'source-table' in file_data['dataset_query']['query']:
-                    self.update_source_table_reference_to_index(
-                        file_data['dataset_query']['query']['source-table'],
-                        'Card',
-                        'dataset_query.query.source-table',
-                        serdes_meta_id,
-                        member_name
-                    )
-
-                if 'joins' in file_data['dataset_query']['query']:
-                    for i, join_clause in enumerate(file_data['dataset_query']['query']['joins']):
-                        # Capture dataset_query.query.joins[].source-table - data_index_by_path
-
-                        if 'source-table' in join_clause:
-                            self.update_source_table_reference_to_index(
-                                file_data['dataset_query']['query']['joins'][i]['source-table'],
-                                'Card',
-                                f'dataset_query.query.joins[{i}].source-table',
-                                serdes_meta_id,
-                                member_name
-                            )
-
-                        # Capture dataset_query.query.joins[].condition[][1] - data_index_by_path
-
-                        if 'condition' in join_clause:
-                            for j, condition_clause in enumerate(file_data['dataset_query']['query']['joins'][i]['condition']):
-                                if isinstance(condition_clause, list) and condition_clause[0] == 'field':
-                                    self.add_entity_reference_to_data_index_by_path(
-                                        tuple(file_data['dataset_query']['query']['joins'][i]['condition'][j][1]),
-                                        'Card',
-                                        f'dataset_query.query.joins[{i}].condition[{j}][1]',
-                                        serdes_meta_id,
-                                        member_name
-                                    )
-
-        # TODO: Capture result_metadata - data_index_by_path
-
-        if 'results_metadata' in file_data:
-            for i, result_metadata_clause in enumerate(file_data['result_metadata']):
-                # Capture result_metadata[].id - data_index_by_path
-
-                if 'id' in result_metadata_clause:
-                    self.add_entity_reference_to_data_index_by_path(
-                        tuple(file_data['dataset_query']['result_metadata'][i]['id']),
-                        'Card',
-                        f'dataset_query.result_metadata[{i}].id',
-                        serdes_meta_id,
-                        member_name
-                    )
-
-                # Capture result_metadata[].field_ref[1] - data_index_by_path
-
-                if 'field_ref' in result_metadata_clause and isinstance(result_metadata_clause['field_ref'], list) and result_metadata_clause['field_ref'][0] == 'field':
-                    self.add_entity_reference_to_data_index_by_path(
-                        tuple(file_data['dataset_query']['result_metadata'][i]['field_ref'][1]),
-                        'Card',
-                        f'dataset_query.result_metadata[{i}].field_ref[1]',
-                        serdes_meta_id,
-                        member_name
-                    )
-
-        # TODO: embedding_params
-        # TODO: parameter_mappings
-        # TODO: visualization_settings
+    def find_name_collisions(self, collection_id=None, model=None):
+        """Returns dict of members by (collection_id, model, name,) for names used by more than one member of the same
+            model in the same collection, optionally for a single collection or model.
+        """
 
-    def update_entity_references(self, file_data, member_name, serdes_meta_id, metadata):
-        """Updates entity index by id adding external references found in file_data to referenced entities."""
+        collisions = {}
+        entries = self.export_data.entries
 
-        # TODO: refactor all of these `self.update_entity_references_xyz` methods, lots of repeated code
-        ENTITY_MODELS = {
-            'Collection': self.update_entity_references_collection,
-            'Card': self.update_entity_references_card,
-            'Dashboard': self.update_entity_references_dashboard,
-            'Timeline': self.update_entity_references_timeline,
-            'Action': self.update_entity_references_action,
-            'Field': self.update_entity_references_field,
-            'Table': self.update_entity_references_table,
-            'Metric': self.update_entity_references_metric,
-            'Segment': self.update_entity_references_segment,
-        }
-
-        ENTITY_MODELS_NO_EXTERNAL_REFERENCES = (
-            'NativeQuerySnippet',
-            'Database',
-        )
+        for name, positions in self.secondary_indexes.get_index('name').items():
+            if len(positions) < 2:
+                continue
 
-        serdes_meta_model = metadata['serdes/meta.model']
+            members_by_key = {}
+
+            for i in positions:
+                metadata = entries[i][3]
+                key = (self.secondary_indexes.get_key('collection', metadata), metadata['serdes/meta.model'], name, )
+
+                if key[0] is None or (collection_id is not None and key[0] != collection_id) or (model is not None and key[1] != model):
+                    continue
+
+                members_by_key.setdefault(key, []).append(i)
+
+            for key, key_positions in members_by_key.items():
+                if len(key_positions) > 1:
+                    collisions[key] = self.get_member_references(key_positions)
+
+        return collisions
+
+    def has_name_collision(self, model, collection_id, name):
+        """Returns True if a member of model named name exists in collection_id, e.g. before creating or renaming one."""
+
+        return bool(self.secondary_indexes.find(model=model, collection=collection_id, name=name))
+
+    def create_entity_index_by_id(self):
+        """Creates index of entity ids, references, and reference paths from export_data."""
+
+        for i, (member_name, parsing_message, file_type, metadata, file_data) in enumerate(self.export_data):
+            self.index_export_member(i, member_name, file_type, metadata, file_data)
+
+    def index_export_member(self, i, member_name, file_type, metadata, file_data):
+        """Adds a single export_data member, its references, and reference paths to the indexes."""
+
+        if file_type != 'file':
+            # Only review files (skip directories, etc.).
+
+            return
+
+        started = time.perf_counter()
+
+        if metadata is None:
+            LOGGER.warning(f'Found member with empty metadata, not indexed: {member_name}')
 
-        if serdes_meta_model in ENTITY_MODELS_NO_EXTERNAL_REFERENCES:
             return
 
-        entity_model_updater = ENTITY_MODELS.get(serdes_meta_model, None)
+        serdes_meta_id = self.add_entity_to_index_by_id(metadata['serdes/meta.id'], i, member_name)
+
+        # Find external references and add to index
+        self.update_entity_references(file_data, member_name, serdes_meta_id, metadata)
+
+        METRICS.add_time('index', time.perf_counter() - started)
+
+    def get_document_cache_stats(self):
+        """Returns hit/miss counters of the lazy document cache or None for eager exports."""
+
+        return None if self.export_data.document_cache is None else self.export_data.document_cache.stats()
+
+    def add_entity_to_index_by_id(self,  serdes_meta_id, i, member_name):
+        """Create entity entry in index by id and returns the entity id it is indexed by."""
+
+        if serdes_meta_id is None:
+            # Generate unique entity_id if none exists.
+            LOGGER.warning(f'Found object with no serdes/meta.id: {member_name}. Generating unique id based on file name and path.')
+            serdes_meta_id = 'mb_' + generate_hash_for_object(member_name)
+            LOGGER.warning(f'.. Using {serdes_meta_id} as entity_id.')
 
-        if entity_model_updater is None:
-            import pdb; pdb.set_trace();  # TODO: REMOVE after debugging
+        if self.spill_store is not None:
+            # Spilled indexes are written in batches, without reading entries back.
+            self.index_by_id.add_entity(serdes_meta_id, i, member_name)
 
-        entity_model_updater(file_data, serdes_meta_id, member_name)
+            return serdes_meta_id
 
-        if serdes_meta_model in ('Card', ):  # TODO: REMOVE after debugging
-            # Skip entities with no external references.
-            # LOGGER.debug('-------------------------------------')
-            # LOGGER.debug('-------------------------------------')
-            # LOGGER.debug(member_name)
-            # LOGGER.debug(serdes_meta_id)
-            # LOGGER.debug(metadata['serdes/meta.model'])
-            # LOGGER.debug(file_data)
+        if serdes_meta_id not in self.index_by_id:
+            self.index_by_id[serdes_meta_id] = {}
 
-            if file_data['embedding_params'] or file_data['parameter_mappings']:  # TODO: REMOVE this line after debugging
-                import pdb; pdb.set_trace();  # TODO: REMOVE after debugging
+        if serdes_meta_id in self.index_by_id and 'i' in self.index_by_id[serdes_meta_id] and self.index_by_id[serdes_meta_id]['i'] != i:
+            # Check for entity ID duplicates.
+            LOGGER.warning(f'Found existing reference to {member_name} at index {i}. Potential duplicate entity key.')
 
+        self.index_by_id[serdes_meta_id]['i'] = i
+        self.index_by_id[serdes_meta_id]['filename'] = member_name
+
+        if 'references' not in self.index_by_id[serdes_meta_id]:
+            self.index_by_id[serdes_meta_id]['references'] = ReferenceList(self.reference_store)
+
+        return serdes_meta_id
+
+    def update_entity_references(self, file_data, member_name, serdes_meta_id, metadata):
+        """Updates entity index by id adding external references found in file_data to referenced entities."""
+
+        serdes_meta_model = metadata['serdes/meta.model']
+
+        reference_extractor = REFERENCE_EXTRACTORS.get(serdes_meta_model, None)
+
+        if reference_extractor is None:
+            LOGGER.warning(f'No reference rules for model "{serdes_meta_model}": {member_name}')
+
+            return
+
+        references = reference_extractor.extract(file_data)
+        METRICS.count('references', serdes_meta_model, len(references))
+
+        for index, reference_key, relationship in references:
+            if index == 'id':
+                self.add_entity_reference_to_index_by_id(reference_key, serdes_meta_model, relationship, serdes_meta_id, member_name)
+            else:
+                self.add_entity_reference_to_data_index_by_path(reference_key, serdes_meta_model, relationship, serdes_meta_id, member_name)
 
     def add_entity_reference_to_index_by_id(self, reference_entity_id, entity_model, relationship, serdes_meta_id, member_name):
         """Adds entity reference to entity index by id."""
 
-        if reference_entity_id is None:
-            LOGGER.error(f'Cannot add entity id reference to "{relationship}" for None in {member_name}.')
-            import pdb; pdb.set_trace();  # TODO: REMOVE after debugging
+        if reference_entity_id is None or isinstance(reference_entity_id, list):
+            LOGGER.error(f'Cannot add entity id reference to "{relationship}" for {reference_entity_id} in {member_name}.')
+
+            return
+
+        if self.spill_store is not None:
+            self.index_by_id.add_reference(reference_entity_id, (entity_model, relationship, serdes_meta_id, member_name, ))
 
-        if isinstance(reference_entity_id, list):
-            import pdb; pdb.set_trace();  # TODO: REMOVE after debugging
+            return
 
         if reference_entity_id not in self.index_by_id:
             self.index_by_id[reference_entity_id] = {
-                'references': []
+                'references': ReferenceList(self.reference_store)
             }
 
         self.index_by_id[reference_entity_id]['references'].append((entity_model, relationship, serdes_meta_id, member_name, ))
@@ -523,11 +911,17 @@ class MetabaseExport:
 
         if reference_data_entity_path is None:
             LOGGER.error(f'Cannot add entity data path reference to "{relationship}" for None in {member_name}.')
-            import pdb; pdb.set_trace();  # TODO: REMOVE after debugging
+
+            return
+
+        if self.spill_store is not None:
+            self.data_index_by_path.add_reference(reference_data_entity_path, (entity_model, relationship, serdes_meta_id, member_name, ))
+
+            return
 
         if reference_data_entity_path not in self.data_index_by_path:
             self.data_index_by_path[reference_data_entity_path] = {
-                'references': []
+                'references': ReferenceList(self.reference_store)
             }
 
         self.data_index_by_path[reference_data_entity_path]['references'].append((entity_model, relationship, serdes_meta_id, member_name, ))
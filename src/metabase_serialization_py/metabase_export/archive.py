@@ -0,0 +1,214 @@
+"""Archive helpers for reading Metabase Serialization Exports."""
+import gzip
+import os
+import shutil
+import sys
+import tarfile
+import tempfile
+import threading
+
+from metabase_serialization_py.defaults import STDIN_EXPORT_PATH
+from metabase_serialization_py.hashing import generate_hash_for_bytes
+from metabase_serialization_py.metabase_export.directory import get_directory_member_path, read_directory_file
+
+
+# Formats of exports, see get_export_format.
+EXPORT_FORMATS = ('tgz', 'tar', 'tar.zst', 'directory', )
+GZIP_MAGIC = b'\x1f\x8b'
+ZSTD_MAGIC = b'\x28\xb5\x2f\xfd'
+# Uncompressed bytes per second decompressed to seek in compressed tar streams, measured on a single core.
+SEEK_BYTES_PER_SECOND = {'tgz': 850_000_000, 'tar.zst': 3_500_000_000}
+
+
+def export_path_exists(export_path):
+    """Returns True if export_path is an existing file or directory, or reads the export from stdin."""
+
+    return export_path == STDIN_EXPORT_PATH or os.path.isfile(export_path) or os.path.isdir(export_path)
+
+
+def get_export_format(export_path):
+    """Returns the format of the export at export_path, one of EXPORT_FORMATS.
+        - Files are recognized by their first bytes rather than their extension: gzip or zstd-compressed tarballs, or
+          uncompressed tar files.
+        - Exports read from stdin are gzip-compressed tarballs.
+    """
+
+    if export_path == STDIN_EXPORT_PATH:
+        return 'tgz'
+
+    if os.path.isdir(export_path):
+        return 'directory'
+
+    with open(export_path, 'rb') as export_file:
+        magic = export_file.read(len(ZSTD_MAGIC))
+
+    if magic.startswith(GZIP_MAGIC):
+        return 'tgz'
+
+    if magic == ZSTD_MAGIC:
+        return 'tar.zst'
+
+    return 'tar'
+
+
+def open_zstd_stream(export_path):
+    """Returns a binary file object of the decompressed contents of a zstd-compressed file.
+        - The stream only seeks forward. Needs the optional zstandard package.
+    """
+
+    try:
+        # Only needed for zstd-compressed exports.
+        import zstandard
+    except ImportError:
+        raise ValueError(f'Reading the zstd-compressed export {export_path} needs the zstandard package: pip install zstandard.') from None
+
+    # Multi-threaded zstd writes several frames.
+    return zstandard.ZstdDecompressor().stream_reader(open(export_path, 'rb'), read_across_frames=True, closefd=True)
+
+
+class ZstdTarFile(tarfile.TarFile):
+    """TarFile streaming a zstd-compressed tarball, closing the decompressed stream with the archive."""
+
+    zstd_stream = None
+
+    @classmethod
+    def open_stream(cls, export_path):
+        zstd_stream = open_zstd_stream(export_path)
+        tar_file = cls.open(fileobj=zstd_stream, mode='r|')
+        tar_file.zstd_stream = zstd_stream
+
+        return tar_file
+
+    def close(self):
+        try:
+            super().close()
+        finally:
+            if self.zstd_stream is not None:
+                self.zstd_stream.close()
+
+
+def open_serialization_tgz(tgz_path, stream=False):
+    """Opens a Metabase Serialization export tarball, gzip or zstd-compressed or uncompressed.
+        - `stream` reads the archive sequentially in a single pass (`r|gz`), members must be read in order.
+        - A `tgz_path` of '-' always streams the export from stdin, and zstd-compressed exports are always streamed.
+    """
+
+    if tgz_path == STDIN_EXPORT_PATH:
+        return tarfile.open(fileobj=sys.stdin.buffer, mode='r|gz')
+
+    export_format = get_export_format(tgz_path)
+
+    if export_format == 'tar.zst':
+        return ZstdTarFile.open_stream(tgz_path)
+
+    if export_format == 'tar':
+        return tarfile.open(tgz_path, 'r|' if stream else 'r:')
+
+    return tarfile.open(tgz_path, 'r|gz' if stream else 'r:gz')
+
+
+def open_serialization_tar_stream(tgz_path):
+    """Returns a binary file object of the uncompressed tar stream of a Metabase Serialization export tarball."""
+
+    if tgz_path == STDIN_EXPORT_PATH:
+        return gzip.GzipFile(fileobj=sys.stdin.buffer, mode='rb')
+
+    export_format = get_export_format(tgz_path)
+
+    if export_format == 'tar.zst':
+        return open_zstd_stream(tgz_path)
+
+    if export_format == 'tar':
+        return open(tgz_path, 'rb')
+
+    return gzip.open(tgz_path, 'rb')
+
+
+class MemberReader:
+    """Reads the data of export members by location (offset_data, size, digest,), for lazy exports.
+        - Tar streams seek to the member's data: seeking backwards in a gzip stream decompresses from the start of the
+          archive again, and zstd streams, which only seek forward, are reopened.
+        - Members of directory exports are read from their file.
+        - Safe to use from several threads.
+    """
+
+    def __init__(self, export_path):
+        self.export_path = export_path
+        # Detected on first read, exports of eager loads are never read again.
+        self.export_format = None
+        self.tar_stream = None
+        self.lock = threading.Lock()
+
+    def read(self, member_name, location):
+        """Returns raw bytes of member_name at location."""
+
+        with self.lock:
+            if self.export_format is None:
+                self.export_format = get_export_format(self.export_path)
+
+        if self.export_format == 'directory':
+            return read_directory_file(get_directory_member_path(self.export_path, member_name))
+
+        offset_data, size, _ = location
+
+        with self.lock:
+            if self.tar_stream is not None and self.export_format == 'tar.zst' and self.tar_stream.tell() > offset_data:
+                self.tar_stream.close()
+                self.tar_stream = None
+
+            if self.tar_stream is None:
+                self.tar_stream = open_serialization_tar_stream(self.export_path)
+
+            self.tar_stream.seek(offset_data)
+
+            return self.tar_stream.read(size)
+
+    def close(self):
+        with self.lock:
+            if self.tar_stream is not None:
+                self.tar_stream.close()
+                self.tar_stream = None
+
+
+def get_seek_bytes(locations):
+    """Returns the uncompressed bytes a MemberReader decompresses, without returning them, to read members at locations
+        (offset_data, size, digest,) in order from a compressed tar stream.
+        - Reading a member before the previous one decompresses the archive again from its start.
+    """
+
+    seek_bytes = 0
+    position = 0
+
+    for offset_data, size, _ in locations:
+        seek_bytes += offset_data if offset_data < position else offset_data - position
+        position = offset_data + size
+
+    return seek_bytes
+
+
+def spool_stdin_export(directory=None):
+    """Copies the export tgz read from stdin to a temporary file and returns its path.
+        - Used when the export has to be read more than once, e.g. to copy unchanged members to the output export.
+    """
+
+    file_descriptor, spool_path = tempfile.mkstemp(suffix='.tgz', dir=directory)
+
+    with os.fdopen(file_descriptor, 'wb') as spool_file:
+        shutil.copyfileobj(sys.stdin.buffer, spool_file, 1024 * 1024)
+
+    return spool_path
+
+
+def get_member_file_type(member):
+    """Returns 'file', 'dir', or 'not file or dir' for a tar member."""
+
+    return 'file' if member.isfile() else ('dir' if member.isdir() else 'not file or dir')
+
+
+def get_member_location(member, raw_data=None, digest=True):
+    """Returns (offset_data, size, digest,) of a tar member's data in the uncompressed archive.
+        - `digest` is the content hash of `raw_data`, or None for members without data like directories and when
+          `digest` is False.
+    """
+
+    return (member.offset_data, member.size, None if raw_data is None or not digest else generate_hash_for_bytes(raw_data), )
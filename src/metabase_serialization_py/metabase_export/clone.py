@@ -0,0 +1,258 @@
+"""Copy-on-write cloning of Metabase Serialization Export entities, with their contents for collections."""
+import logging
+import posixpath
+import secrets
+
+from metabase_serialization_py.metabase_export.edit_plans import EditPlan
+from metabase_serialization_py.metabase_export.member_filter import get_root_directory
+from metabase_serialization_py.metabase_export.reference_rules import REFERENCE_EXTRACTORS, parse_relationship
+from metabase_serialization_py.metabase_export.remap import remap_document
+from metabase_serialization_py.metabase_export.secondary_indexes import ROOT_COLLECTION_ID
+
+LOGGER = logging.getLogger(__name__)
+
+
+# Alphabet and length of Metabase entity_ids (NanoID); 64 characters so each random byte maps to one with `& 63`.
+NANOID_ALPHABET = 'ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789_-'
+NANOID_LENGTH = 21
+NANOID_TRANSLATION = bytes(NANOID_ALPHABET[byte & 63].encode('ascii')[0] for byte in range(256))
+
+
+def generate_entity_ids(count, *reserved_ids):
+    """Returns list of count new unique NanoID entity_ids, none of them in any of the reserved_ids containers.
+        - Random bytes for every id are drawn at once and mapped to the NanoID alphabet with bytes.translate.
+    """
+
+    entity_ids = {}
+
+    while len(entity_ids) < count:
+        missing = count - len(entity_ids)
+        characters = secrets.token_bytes(missing * NANOID_LENGTH).translate(NANOID_TRANSLATION).decode('ascii')
+
+        for start in range(0, len(characters), NANOID_LENGTH):
+            entity_id = characters[start:start + NANOID_LENGTH]
+
+            if not any(entity_id in reserved for reserved in reserved_ids):
+                entity_ids[entity_id] = None
+
+    return list(entity_ids)
+
+
+def get_embedded_entity_ids(references):
+    """Returns list of the entity_ids of entities embedded in a document, like dashcards, from its references."""
+
+    return [reference_key for index, reference_key, relationship in references if index == 'id' and relationship.endswith('.entity_id')]
+
+
+def get_document_references(document):
+    """Returns list of (index, reference_key, relationship,) of a document, see ReferenceExtractor."""
+
+    reference_extractor = REFERENCE_EXTRACTORS.get(document['serdes/meta'][-1]['model'], None)
+
+    return [] if reference_extractor is None else reference_extractor.extract(document)
+
+
+def get_database_change(changes):
+    """Returns the database name set by a create's changes, from `database_id` or `dataset_query.database`, or None."""
+
+    dataset_query = changes.get('dataset_query', None)
+
+    if 'database_id' in changes:
+        return changes['database_id']
+
+    if isinstance(dataset_query, dict):
+        return dataset_query.get('database', None)
+
+    return None
+
+
+def get_copy_changes(changes, model):
+    """Returns the changes of a create applied to the copy of its source itself.
+        - `database_id` and `dataset_query.database` are left out, they retarget the data path references of every copy.
+        - `collection_id` of a collection copy is its parent collection, i.e. `parent_id`.
+    """
+
+    changes = {key: value for key, value in changes.items() if key != 'database_id'}
+    dataset_query = changes.get('dataset_query', None)
+
+    if isinstance(dataset_query, dict) and 'database' in dataset_query:
+        dataset_query = {key: value for key, value in dataset_query.items() if key != 'database'}
+
+        if dataset_query:
+            changes['dataset_query'] = dataset_query
+        else:
+            del changes['dataset_query']
+
+    if model == 'Collection' and 'collection_id' in changes:
+        changes['parent_id'] = changes.pop('collection_id')
+
+    return changes
+
+
+def rename_member_path(member_name, old_directory, new_directory, entity_id_map):
+    """Returns member_name moved from old_directory to new_directory, with the entity_ids starting its path segments
+        renamed by entity_id_map, e.g. '<entity_id>_<slug>.yaml'.
+    """
+
+    segments = member_name[len(old_directory):].split('/')
+
+    for position, segment in enumerate(segments):
+        separator = segment.find('_')
+
+        while separator > 0:
+            new_entity_id = entity_id_map.get(segment[:separator], None)
+
+            if new_entity_id is not None:
+                segments[position] = new_entity_id + segment[separator:]
+
+                break
+
+            separator = segment.find('_', separator + 1)
+
+    return new_directory + '/'.join(segments)
+
+
+class EntityCloner:
+    """Creates copies of export entities as new members of an ExportOverlay.
+        - Copies share every unchanged value with their source documents: only the dicts and lists along the rewritten
+          references are copied, so copying a collection of large cards costs little more than its changed values.
+        - Collections are copied with their contents, transitively. References between copied entities, including
+          collection containment and entities embedded in documents like dashcards, point at the copies; references to
+          other entities are kept.
+        - Entity ids of copies are generated in bulk, unique across the export and every copy of the cloner.
+    """
+
+    def __init__(self, metabase_export, export_overlay):
+        self.metabase_export = metabase_export
+        self.export_overlay = export_overlay
+        self.member_names = {}
+        # Every entity_id generated by the cloner, including those of embedded entities without a member of their own.
+        self.generated_entity_ids = {}
+
+    def generate_entity_id_map(self, entity_ids):
+        """Returns dict of a new entity_id by each of entity_ids, unique across the export and the cloner's copies."""
+
+        new_entity_ids = generate_entity_ids(len(entity_ids), self.metabase_export.index_by_id, self.generated_entity_ids)
+        self.generated_entity_ids.update(dict.fromkeys(new_entity_ids))
+
+        return dict(zip(entity_ids, new_entity_ids))
+
+    def get_member_name(self, entity_id):
+        """Returns member_name of an export entity or copy, or None."""
+
+        member_name = self.member_names.get(entity_id, None)
+
+        if member_name is None:
+            member_name = self.metabase_export.index_by_id.get(entity_id, {}).get('filename', None)
+
+        return member_name
+
+    def get_collection_directory(self, collection_id, member_name):
+        """Returns directory of the contents of collection_id, ending with '/', or of the root collection for the
+            export member_name is in.
+        """
+
+        if collection_id is None or collection_id == ROOT_COLLECTION_ID:
+            root_directory = get_root_directory(member_name)
+
+            if root_directory is None:
+                raise ValueError(f'Root collection directory not found for export member: {member_name}')
+
+            return f'{root_directory}collections/'
+
+        collection_member_name = self.get_member_name(collection_id)
+
+        if collection_member_name is None:
+            raise ValueError(f'Collection not found in export: {collection_id}')
+
+        return posixpath.dirname(collection_member_name) + '/'
+
+    def clone(self, source_entity_id, changes=None):
+        """Copies source_entity_id, with its contents for collections, applying changes to the copy of the source, and
+            returns dict of new entity_id by copied entity_id.
+            - A database name set by `database_id` or `dataset_query.database` retargets the data path references of
+              every copy to that database.
+        """
+
+        metabase_export = self.metabase_export
+        export_overlay = self.export_overlay
+        changes = changes or {}
+        dependency_graph = metabase_export.get_dependency_graph()
+        nodes = [node for node in dependency_graph.get_contents_closure(source_entity_id) if node in dependency_graph.member_names]
+        documents = {}
+        references = {}
+        entity_ids = {}
+
+        for node in nodes:
+            member_name = dependency_graph.member_names[node]
+            document = documents[node] = export_overlay.get_file_data(member_name)
+            references[node] = get_document_references(document)
+            entity_ids[node] = None
+            # Entities embedded in the document, like dashcards, are copied with it.
+            entity_ids.update(dict.fromkeys(get_embedded_entity_ids(references[node])))
+
+        entity_id_map = self.generate_entity_id_map(list(entity_ids))
+
+        source_document = documents[source_entity_id]
+        source_model = source_document['serdes/meta'][-1]['model']
+        source_member_name = dependency_graph.member_names[source_entity_id]
+        copy_changes = get_copy_changes(changes, source_model)
+        container_attribute = 'parent_id' if source_model == 'Collection' else 'collection_id'
+        old_directory = posixpath.dirname(posixpath.dirname(source_member_name)) + '/'
+        new_directory = self.get_collection_directory(copy_changes.get(container_attribute, source_document.get(container_attribute, None)), source_member_name)
+        database = get_database_change(changes)
+        data_path_trie = metabase_export.get_data_path_trie() if database is not None else None
+        missing_data_paths = {}
+
+        for node in nodes:
+            rewrites = [
+                (('entity_id', ), (node, ), (entity_id_map[node], ), ),
+                (('serdes/meta', len(documents[node]['serdes/meta']) - 1, 'id', ), (node, ), (entity_id_map[node], ), ),
+            ]
+
+            for index, reference_key, relationship in references[node]:
+                if index == 'id':
+                    if reference_key in entity_id_map:
+                        rewrites.append((parse_relationship(relationship), (reference_key, ), (entity_id_map[reference_key], ), ))
+                elif database is not None and reference_key[0] != database:
+                    new_data_path = (database, *reference_key[1:], )
+
+                    if len(new_data_path) > 1 and new_data_path not in data_path_trie:
+                        missing_data_paths[new_data_path] = None
+
+                    rewrites.append((parse_relationship(relationship), reference_key, new_data_path, ))
+
+            document, rewritten, skipped = remap_document(documents[node], rewrites)
+
+            if node == source_entity_id and copy_changes:
+                edit_plan = EditPlan(source_member_name)
+                edit_plan.add_changes(None, copy_changes)
+                document = edit_plan.apply(document)
+
+            member_name = rename_member_path(dependency_graph.member_names[node], old_directory, new_directory, entity_id_map)
+
+            export_overlay.create(member_name, document)
+            self.member_names[entity_id_map[node]] = member_name
+
+        if missing_data_paths:
+            LOGGER.warning(f'Copies of {source_entity_id} reference {len(missing_data_paths)} tables and fields not found in database "{database}", e.g. {next(iter(missing_data_paths))}.')
+
+        return entity_id_map
+
+    def copy_replacement(self, source_document, target_entity_id):
+        """Returns a copy of source_document to replace the document of target_entity_id with, see EditPlan.apply.
+            - Entities embedded in the copy, like dashcards, get new entity_ids, so they are not moved from the source
+              to the target on import, and references to the source point at the target.
+            - Only the values along the rewritten references are copied, see remap_document.
+        """
+
+        references = get_document_references(source_document)
+        entity_id_map = self.generate_entity_id_map(list(dict.fromkeys(get_embedded_entity_ids(references))))
+        entity_id_map[source_document['entity_id']] = target_entity_id
+        rewrites = [
+            (parse_relationship(relationship), (reference_key, ), (entity_id_map[reference_key], ), )
+            for index, reference_key, relationship in references
+            if index == 'id' and reference_key in entity_id_map
+        ]
+
+        return remap_document(source_document, rewrites)[0]
@@ -0,0 +1,75 @@
+"""Prefix trie of data paths like (database, schema, table, field,) referenced in a Metabase Serialization Export."""
+
+
+class DataPathTrieNode:
+    __slots__ = ('children', 'data_path', )
+
+    def __init__(self):
+        self.children = {}
+        self.data_path = None
+
+
+class DataPathTrie:
+    """Data paths by their elements, so every data path under a database, schema, or table is found without scanning
+        all of them.
+        - Schemas may be None for databases without schemas.
+    """
+
+    def __init__(self, data_paths=()):
+        self.root = DataPathTrieNode()
+        self.size = 0
+
+        for data_path in data_paths:
+            self.add(data_path)
+
+    def __len__(self):
+        return self.size
+
+    def __contains__(self, data_path):
+        node = self.get_node(data_path)
+
+        return node is not None and node.data_path is not None
+
+    def add(self, data_path):
+        node = self.root
+
+        for element in data_path:
+            child = node.children.get(element, None)
+
+            if child is None:
+                child = node.children[element] = DataPathTrieNode()
+
+            node = child
+
+        if node.data_path is None:
+            node.data_path = tuple(data_path)
+            self.size += 1
+
+    def get_node(self, prefix):
+        node = self.root
+
+        for element in prefix:
+            node = node.children.get(element, None)
+
+            if node is None:
+                return None
+
+        return node
+
+    def iter_prefix(self, prefix):
+        """Returns an iterative of the data paths starting with prefix, including prefix itself, depth first."""
+
+        node = self.get_node(prefix)
+
+        if node is None:
+            return
+
+        pending = [node]
+
+        while pending:
+            node = pending.pop()
+
+            if node.data_path is not None:
+                yield node.data_path
+
+            pending.extend(reversed(node.children.values()))
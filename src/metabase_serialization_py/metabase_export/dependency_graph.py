@@ -0,0 +1,281 @@
+"""Dependency graph of Metabase Serialization Export entities built from the reference indexes."""
+import heapq
+import itertools
+
+
+# Relationships placing an entity in a collection rather than depending on it.
+CONTAINMENT_RELATIONSHIPS = ('collection_id', 'parent_id', )
+
+
+def get_node_key(reference_key):
+    """Returns the graph node of an index key; database data paths like (database,) are keyed by database name."""
+
+    if isinstance(reference_key, tuple) and len(reference_key) == 1:
+        return reference_key[0]
+
+    return reference_key
+
+
+class CycleError(ValueError):
+    """Nodes that cannot be ordered by topological_sort, in `nodes`: those in cycles and those after them."""
+
+    def __init__(self, nodes):
+        super().__init__(f'Cycle between: {", ".join(str(node) for node in nodes)}')
+        self.nodes = tuple(nodes)
+
+
+def topological_sort(nodes, predecessors, order_key=None):
+    """Returns list of nodes where each node comes after its predecessors (Kahn's algorithm).
+        - `predecessors` maps a node to the nodes that must come before it; nodes outside `nodes` are ignored.
+        - Ready nodes are taken by smallest `order_key(node)`, or in the order of `nodes`.
+        - Raises CycleError listing the nodes left in cycles.
+    """
+
+    nodes = list(dict.fromkeys(nodes))
+    positions = {node: position for position, node in enumerate(nodes)}
+    order_key = (lambda node: positions[node]) if order_key is None else order_key
+    successors = {node: [] for node in nodes}
+    in_degrees = dict.fromkeys(nodes, 0)
+
+    for node in nodes:
+        for predecessor in dict.fromkeys(predecessors.get(node, ())):
+            if predecessor in positions and predecessor != node:
+                successors[predecessor].append(node)
+                in_degrees[node] += 1
+
+    ready = [(order_key(node), positions[node], node, ) for node in nodes if in_degrees[node] == 0]
+    heapq.heapify(ready)
+    ordered = []
+
+    while ready:
+        node = heapq.heappop(ready)[2]
+        ordered.append(node)
+
+        for successor in successors[node]:
+            in_degrees[successor] -= 1
+
+            if in_degrees[successor] == 0:
+                heapq.heappush(ready, (order_key(successor), positions[successor], successor, ))
+
+    if len(ordered) < len(nodes):
+        raise CycleError([node for node in nodes if in_degrees[node] > 0])
+
+    return ordered
+
+
+class DependencyGraph:
+    """Forward and reverse dependency adjacency between entity_ids and data paths of an export.
+        - An entity depends on every entity_id and data path it references, except for the collection it is in.
+        - Collection containment (`collection_id`, `parent_id`) is kept apart, as contents and containers, so the
+          closure of a card does not include its collection and the copy closure of a collection includes its contents.
+        - Strongly connected components, and the closure of each, are computed once on first use; closures are
+          memoized per component so overlapping changes do not re-traverse shared subgraphs.
+    """
+
+    def __init__(self, index_by_id, data_index_by_path):
+        self.dependencies = {}
+        self.dependents = {}
+        self.contents = {}
+        self.containers = {}
+        self.member_names = {}
+
+        for index in (index_by_id, data_index_by_path, ):
+            for reference_key, index_entry in index.items():
+                node = get_node_key(reference_key)
+
+                self.dependents.setdefault(node, {})
+
+                if 'filename' in index_entry:
+                    self.member_names[node] = index_entry['filename']
+
+                for entity_model, relationship, serdes_meta_id, member_name in index_entry['references']:
+                    if relationship in CONTAINMENT_RELATIONSHIPS:
+                        self.contents.setdefault(node, {})[serdes_meta_id] = None
+                        self.containers[serdes_meta_id] = node
+                    else:
+                        self.dependencies.setdefault(serdes_meta_id, {})[node] = None
+                        self.dependents[node][serdes_meta_id] = None
+
+        self.components = None
+        self.component_of = None
+        self.component_closures = {}
+        self.copy_closures = {}
+
+    def get_dependencies(self, node):
+        """Returns tuple of nodes node references directly."""
+
+        return tuple(self.dependencies.get(node, ()))
+
+    def get_dependents(self, node):
+        """Returns tuple of nodes referencing node directly."""
+
+        return tuple(self.dependents.get(node, ()))
+
+    def find_strongly_connected_components(self):
+        """Returns tuple of strongly connected components (Tarjan's algorithm), each a tuple of nodes.
+            - Components come after the components they depend on, so their order is a topological order of the
+              graph of components.
+        """
+
+        if self.components is not None:
+            return self.components
+
+        indexes = {}
+        lowlinks = {}
+        stack = []
+        on_stack = set()
+        components = []
+        component_of = {}
+
+        for root in dict.fromkeys(itertools.chain(self.dependents, self.dependencies)):
+            if root in indexes:
+                continue
+
+            indexes[root] = lowlinks[root] = len(indexes)
+            stack.append(root)
+            on_stack.add(root)
+            work = [(root, iter(self.dependencies.get(root, ())), )]
+
+            while work:
+                node, successors = work[-1]
+
+                for successor in successors:
+                    if successor not in indexes:
+                        indexes[successor] = lowlinks[successor] = len(indexes)
+                        stack.append(successor)
+                        on_stack.add(successor)
+                        work.append((successor, iter(self.dependencies.get(successor, ())), ))
+
+                        break
+
+                    if successor in on_stack:
+                        lowlinks[node] = min(lowlinks[node], indexes[successor])
+                else:
+                    work.pop()
+
+                    if work:
+                        parent = work[-1][0]
+                        lowlinks[parent] = min(lowlinks[parent], lowlinks[node])
+
+                    if lowlinks[node] == indexes[node]:
+                        component = []
+
+                        while True:
+                            member = stack.pop()
+                            on_stack.discard(member)
+                            component_of[member] = len(components)
+                            component.append(member)
+
+                            if member == node:
+                                break
+
+                        components.append(tuple(component))
+
+        self.components = tuple(components)
+        self.component_of = component_of
+
+        return self.components
+
+    def find_cycles(self):
+        """Returns list of components of nodes depending on each other, including nodes referencing themselves."""
+
+        return [
+            component
+            for component in self.find_strongly_connected_components()
+            if len(component) > 1 or component[0] in self.dependencies.get(component[0], ())
+        ]
+
+    def get_component_successors(self, component):
+        component_of = self.component_of
+
+        return {component_of[dependency] for node in self.components[component] for dependency in self.dependencies.get(node, ())}.difference((component, ))
+
+    def get_closure(self, node):
+        """Returns frozenset of node and every node it depends on, transitively."""
+
+        self.find_strongly_connected_components()
+
+        component = self.component_of.get(node, None)
+
+        if component is None:
+            return frozenset((node, ))
+
+        closures = self.component_closures
+        pending = [component]
+
+        # Post-order over the acyclic graph of components, each closure is computed once.
+        while pending:
+            component = pending[-1]
+
+            if component in closures:
+                pending.pop()
+
+                continue
+
+            successors = self.get_component_successors(component)
+            missing_successors = [successor for successor in successors if successor not in closures]
+
+            if missing_successors:
+                pending.extend(missing_successors)
+
+                continue
+
+            pending.pop()
+
+            closure = set(self.components[component])
+
+            for successor in successors:
+                closure.update(closures[successor])
+
+            closures[component] = frozenset(closure)
+
+        return closures[self.component_of[node]]
+
+    def get_contents_closure(self, node):
+        """Returns list of node and the nodes in it, transitively for collections, in breadth first order."""
+
+        contents = [node]
+        seen = {node}
+
+        for content in contents:
+            for child in self.contents.get(content, ()):
+                if child not in seen:
+                    seen.add(child)
+                    contents.append(child)
+
+        return contents
+
+    def get_copy_closure(self, node):
+        """Returns frozenset of the nodes copied with node: its contents if it is a collection, and every node they
+            depend on, transitively.
+        """
+
+        closure = self.copy_closures.get(node, None)
+
+        if closure is None:
+            closure = set()
+
+            for content in self.get_contents_closure(node):
+                closure.update(self.get_closure(content))
+
+            closure = self.copy_closures[node] = frozenset(closure)
+
+        return closure
+
+    def get_members(self, nodes):
+        """Returns dict of member_name by node for nodes with an export member, e.g. not data paths of fields without a
+            file or dashcards.
+        """
+
+        return {node: self.member_names[node] for node in nodes if node in self.member_names}
+
+    def topological_order(self, nodes):
+        """Returns list of nodes ordered so dependencies come before the nodes depending on them.
+            - Nodes in a cycle are kept together in an arbitrary order.
+        """
+
+        self.find_strongly_connected_components()
+
+        component_of = self.component_of
+
+        return sorted(nodes, key=lambda node: component_of.get(node, -1))
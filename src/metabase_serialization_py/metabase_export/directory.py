@@ -0,0 +1,100 @@
+"""Directory helpers for reading Metabase Serialization Exports extracted to a directory, e.g. one kept in git."""
+import os
+import stat
+import tarfile
+import time
+
+from metabase_serialization_py.metrics import METRICS
+
+
+def get_directory_member_path(directory_path, member_name):
+    """Returns the path of the file or directory of member_name in the export directory."""
+
+    return os.path.join(directory_path, *member_name.split('/'))
+
+
+def get_entry_file_type(entry):
+    """Returns 'file', 'dir', or None for other entries like symbolic links, which are not followed."""
+
+    if entry.is_file(follow_symlinks=False):
+        return 'file'
+
+    if entry.is_dir(follow_symlinks=False):
+        return 'dir'
+
+    return None
+
+
+def iter_directory_members(directory_path, member_filter=None, prefix=''):
+    """Returns an iterative of (member_name, file_type, path,) for the files and directories of an export directory.
+        - Member names are relative to directory_path with `/` separators, as in a tgz of its contents, e.g. the
+          `metabase_data/...` members of a directory written with `--output_directory`.
+        - Entries are walked depth first in name order with os.scandir, each directory before its contents.
+        - Hidden entries like `.git` and entries other than files and directories are skipped.
+        - `member_filter` skips members by member name before they are read, see MemberFilter.
+    """
+
+    with os.scandir(directory_path) as entries:
+        entries = sorted(entries, key=lambda entry: entry.name)
+
+    for entry in entries:
+        file_type = None if entry.name.startswith('.') else get_entry_file_type(entry)
+
+        if file_type is None:
+            continue
+
+        member_name = prefix + entry.name
+
+        if member_filter is None or member_filter.select(member_name, file_type):
+            yield (member_name, file_type, entry.path, )
+
+        if file_type == 'dir':
+            yield from iter_directory_members(entry.path, member_filter, f'{member_name}/')
+
+
+def read_directory_file(path):
+    """Returns raw bytes of the file at path, read in a single call sized to the file, timed as 'read' metrics."""
+
+    started = time.perf_counter()
+
+    with open(path, 'rb', buffering=0) as member_file:
+        raw_data = member_file.readall()
+
+    METRICS.add_time('read', time.perf_counter() - started)
+
+    return raw_data
+
+
+def get_directory_member_location(raw_data=None):
+    """Returns (offset_data, size, digest,) of a member of an export directory like get_member_location.
+        - `offset_data` is None: members are read from their own file, see MemberReader.
+        - `digest` is None: export directories are not index cached, so no incremental load compares digests.
+        - `raw_data` is None for directories, which have no data.
+    """
+
+    if raw_data is None:
+        return (None, 0, None, )
+
+    return (None, len(raw_data), None, )
+
+
+def read_directory_member(member_name, file_type, path):
+    """Returns (member_name, file_type, raw_data, location,) of a member of an export directory, see
+        iter_directory_members.
+    """
+
+    raw_data = read_directory_file(path) if file_type == 'file' else None
+
+    return (member_name, file_type, raw_data, get_directory_member_location(raw_data), )
+
+
+def get_directory_member_info(member_name, file_type, path):
+    """Returns TarInfo for writing a member of an export directory to a tar archive, without its size."""
+
+    member_stat = os.stat(path)
+    member = tarfile.TarInfo(member_name)
+    member.type = tarfile.DIRTYPE if file_type == 'dir' else tarfile.REGTYPE
+    member.mode = stat.S_IMODE(member_stat.st_mode)
+    member.mtime = int(member_stat.st_mtime)
+
+    return member
@@ -0,0 +1,162 @@
+"""Edit plans merging every change to a Metabase Serialization Export document into a single pass over it."""
+from metabase_serialization_py.metabase_export.reference_rules import format_relationship
+
+
+# Keys of a replaced document kept from the target, so the replacement keeps the target's identity, name, and file
+# location; `changes` of the replace may still set them.
+REPLACE_PRESERVED_KEYS = ('entity_id', 'serdes/meta', 'collection_id', 'parent_id', 'name', 'slug', )
+
+
+def get_copied_container(document, tokens, copies):
+    """Returns the container of the value at tokens in document, first replacing every dict and list along the path
+        with a shallow copy, so the value can be set without changing values document shares with other documents.
+        - `copies` is a dict of copied containers by id, including document itself, so each container is copied once
+          however many values are set inside it.
+        - Raises KeyError, IndexError, or TypeError if the path does not exist in document.
+    """
+
+    container = document
+
+    for token in tokens[:-1]:
+        child = container[token]
+
+        if id(child) not in copies:
+            if isinstance(child, dict):
+                child = dict(child)
+            elif isinstance(child, (list, tuple, )):
+                # Sequences of interned documents may be tuples, see StructureInterner.
+                child = list(child)
+            else:
+                raise TypeError(f'Cannot set a value inside {type(child).__name__} at {token}.')
+
+            container[token] = child
+            copies[id(child)] = child
+
+        container = child
+
+    return container
+
+
+class Edit:
+    """Value set at a document path by a change."""
+
+    __slots__ = ('value', 'change', )
+
+    def __init__(self, value, change):
+        self.value = value
+        self.change = change
+
+
+def apply_edit_tree(value, edit_tree):
+    """Returns a copy of value with the edits of edit_tree applied, copying only the dicts along edited paths.
+        - Unchanged values are shared with value, which is never modified.
+        - Editing inside a value that is not a dict replaces it with a dict of the edits.
+    """
+
+    edited = dict(value) if isinstance(value, dict) else {}
+
+    for key, edit in edit_tree.items():
+        if isinstance(edit, Edit):
+            edited[key] = edit.value
+        else:
+            edited[key] = apply_edit_tree(edited.get(key, None), edit)
+
+    return edited
+
+
+def get_edit_tree_changes(edit_tree):
+    """Returns tuple of the changes editing inside edit_tree, in order of first edit."""
+
+    changes = {}
+    pending = [edit_tree]
+
+    while pending:
+        for edit in pending.pop().values():
+            if isinstance(edit, Edit):
+                changes.setdefault(edit.change, None)
+            else:
+                pending.append(edit)
+
+    return tuple(changes)
+
+
+class EditPlan:
+    """Edits of a single export member merged from every change request touching it.
+        - `changes` dicts are merged recursively: dict values edit the keys inside them and other values, including
+          lists and empty dicts, replace the value at their path.
+        - A replaced member's document is a copy of its source document with the target's REPLACE_PRESERVED_KEYS, see
+          EntityCloner.copy_replacement, and the edits are applied on top of it.
+        - Conflicting edits are collected in `conflicts` as (path, changes,) instead of being applied.
+    """
+
+    def __init__(self, member_name):
+        self.member_name = member_name
+        self.replacement = None
+        self.edit_tree = {}
+        self.changes = []
+        self.conflicts = []
+
+    def set_replacement(self, change, source_member_name):
+        """Replaces the member's document with a copy of source_member_name's."""
+
+        if self.replacement is not None or self.changes:
+            self.conflicts.append(('', tuple(self.changes) + (change, ), ))
+
+        self.replacement = (change, source_member_name, )
+        self.changes.append(change)
+
+    def add_changes(self, change, changes, path=()):
+        """Adds the edits of a change's `changes` dict."""
+
+        if self.replacement is not None and self.replacement[0] != change:
+            self.conflicts.append(('', (self.replacement[0], change, ), ))
+
+        if change not in self.changes:
+            self.changes.append(change)
+
+        for key, value in changes.items():
+            if isinstance(value, dict) and value:
+                self.add_changes(change, value, (*path, key, ))
+            else:
+                self.add_edit(change, (*path, key, ), value)
+
+    def add_edit(self, change, path, value):
+        """Adds an edit setting value at path, recording a conflict if another change edits the same path differently
+            or edits inside it.
+        """
+
+        node = self.edit_tree
+
+        for depth, key in enumerate(path[:-1]):
+            child = node.get(key, None)
+
+            if child is None:
+                child = node[key] = {}
+            elif isinstance(child, Edit):
+                self.conflicts.append((format_relationship(path[:depth + 1]), (child.change, change, ), ))
+
+                return
+
+            node = child
+
+        existing = node.get(path[-1], None)
+
+        if existing is None:
+            node[path[-1]] = Edit(value, change)
+        elif not isinstance(existing, Edit):
+            self.conflicts.append((format_relationship(path), (*get_edit_tree_changes(existing), change, ), ))
+        elif existing.value != value:
+            self.conflicts.append((format_relationship(path), (existing.change, change, ), ))
+
+    def apply(self, document, source_document=None):
+        """Returns the edited copy of document, or of source_document for replaced members, in a single traversal.
+            - `source_document` of a replaced member is the copy of its source, see EntityCloner.copy_replacement.
+        """
+
+        if self.replacement is not None:
+            document = {
+                **source_document,
+                **{key: document[key] for key in REPLACE_PRESERVED_KEYS if key in document},
+            }
+
+        return apply_edit_tree(document, self.edit_tree)
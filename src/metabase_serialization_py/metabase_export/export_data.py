@@ -0,0 +1,195 @@
+"""Export data containers for Metabase Serialization Exports."""
+from collections import OrderedDict
+import threading
+
+from metabase_serialization_py.defaults import DEFAULT_DOCUMENT_CACHE_MB
+from metabase_serialization_py.metabase_export.archive import MemberReader
+from metabase_serialization_py.yaml import parse_yaml, Loader
+
+
+class DocumentCache:
+    """Size-bounded LRU cache of parsed documents keyed by export_data index.
+        - Entries are weighed by the raw size of the archive member they were parsed from.
+        - Safe to use from several threads, e.g. concurrent server requests or tenant writers.
+    """
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.documents = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        """Returns cached document for key or None, counting hits and misses."""
+
+        with self.lock:
+            entry = self.documents.get(key, None)
+
+            if entry is not None:
+                self.hits += 1
+                self.documents.move_to_end(key)
+
+                return entry[0]
+
+            self.misses += 1
+
+            return None
+
+    def put(self, key, document, size):
+        """Adds document to the cache, evicting least recently used documents over max_bytes."""
+
+        with self.lock:
+            if key in self.documents:
+                self.current_bytes -= self.documents.pop(key)[1]
+
+            self.documents[key] = (document, size, )
+            self.current_bytes += size
+
+            while self.current_bytes > self.max_bytes and len(self.documents) > 1:
+                _, (_, evicted_size) = self.documents.popitem(last=False)
+                self.current_bytes -= evicted_size
+
+    def stats(self):
+        """Returns dict of cache counters."""
+
+        with self.lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'documents': len(self.documents),
+                'bytes': self.current_bytes,
+                'max_bytes': self.max_bytes,
+            }
+
+
+class ExportData:
+    """Sequence of (member_name, parsing_message, file_type, metadata, file_data,) tuples for an export.
+        - Eager exports keep every parsed file_data in memory.
+        - Lazy exports keep only metadata and each member's tar location (offset_data, size, digest,) and re-parse
+          file_data on demand through a DocumentCache, reading members with a MemberReader.
+        - Eager exports spilled to a SpillStore keep their documents in the store instead, and read them back through
+          a DocumentCache the same way.
+    """
+
+    def __init__(self, export_path, lazy=False, cache_size_mb=DEFAULT_DOCUMENT_CACHE_MB):
+        self.export_path = export_path
+        self.lazy = lazy
+        self.entries = []
+        self.locations = []
+        self.documents = None if lazy else []
+        self.document_cache = DocumentCache(cache_size_mb * 1024 * 1024) if lazy else None
+        self.cache_size_mb = cache_size_mb
+        self.spill_store = None
+        self.member_reader = MemberReader(export_path)
+
+    @classmethod
+    def from_entries(cls, export_path, entries, locations, cache_size_mb=DEFAULT_DOCUMENT_CACHE_MB):
+        """Returns a lazy ExportData for previously loaded entries and member locations."""
+
+        export_data = cls(export_path, True, cache_size_mb)
+        export_data.entries = entries
+        export_data.locations = locations
+
+        return export_data
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __iter__(self):
+        for i in range(len(self.entries)):
+            yield self[i]
+
+    def __getitem__(self, i):
+        return (*self.entries[i], self.get_file_data(i), )
+
+    def append(self, member_name, parsing_message, file_type, metadata, file_data, location):
+        """Appends an export member and returns its index."""
+
+        # Members that could not be parsed have no document to re-read.
+        i = self.append_entry((member_name, parsing_message, file_type, metadata, ), location if file_data is not None else None)
+
+        if self.lazy:
+            return i
+
+        if self.spill_store is not None:
+            if file_data is not None:
+                self.spill_store.add_document(i, file_data)
+        else:
+            self.documents.append(file_data)
+
+        return i
+
+    def append_entry(self, entry, location):
+        """Appends a previously loaded (member_name, parsing_message, file_type, metadata,) entry and its location
+            and returns its index.
+            - Lazy exports only, file_data is re-parsed from the location on demand.
+        """
+
+        self.entries.append(entry)
+        self.locations.append(location)
+
+        return len(self.entries) - 1
+
+    def spill(self, spill_store):
+        """Moves the documents of an eager export to spill_store, including those appended later."""
+
+        self.spill_store = spill_store
+
+        if self.lazy:
+            return
+
+        documents = self.documents
+        self.documents = None
+
+        for i, file_data in enumerate(documents):
+            if file_data is not None:
+                spill_store.add_document(i, file_data)
+                # Released as they are spilled, so the documents are not held twice.
+                documents[i] = None
+        self.document_cache = DocumentCache(self.cache_size_mb * 1024 * 1024)
+
+    def get_file_data(self, i):
+        """Returns file_data for the member at index i, re-parsing it from the archive in lazy mode."""
+
+        if self.documents is not None:
+            return self.documents[i]
+
+        file_data = self.document_cache.get(i)
+
+        if file_data is not None:
+            return file_data
+
+        if not self.lazy:
+            document = self.spill_store.get_document(i)
+
+            if document is None:
+                return None
+
+            file_data, size = document
+        else:
+            location = self.locations[i]
+
+            if location is None:
+                return None
+
+            file_data = parse_yaml(self.read_member(self.entries[i][0], location), Loader)
+            size = location[1]
+
+        self.document_cache.put(i, file_data, size)
+
+        return file_data
+
+    def read_member(self, member_name, location):
+        """Returns raw bytes of member_name at location (offset_data, size, digest,) in the export, see MemberReader."""
+
+        return self.member_reader.read(member_name, location)
+
+    def close(self):
+        """Closes the export archive if it was opened for lazy reads, and removes the spill store if any."""
+
+        self.member_reader.close()
+
+        if self.spill_store is not None:
+            self.spill_store.close()
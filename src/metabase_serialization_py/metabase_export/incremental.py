@@ -0,0 +1,113 @@
+"""Incremental re-indexing of a Metabase Serialization Export against a previous export's index cache."""
+from array import array
+import time
+
+from metabase_serialization_py.metabase_export.archive import get_member_file_type, get_member_location, open_serialization_tgz
+from metabase_serialization_py.metrics import METRICS
+
+
+def is_member_unchanged(previous_entry, previous_location, file_type, location):
+    """Returns True if an archive member matches its entry and location in the previous export.
+        - Files match on size and content hash, other members on file type only.
+        - Files that could not be parsed in the previous export are never unchanged.
+    """
+
+    if previous_entry[2] != file_type:
+        return False
+
+    if file_type != 'file':
+        return True
+
+    return previous_location is not None and previous_location[1:] == location[1:]
+
+
+def scan_serialization_tgz_changes(tgz_path, previous_members, parse_member):
+    """Reads the archive in a single streaming pass and returns (scanned_members, changed_members,).
+        - `previous_members` is a dict of member_name to (entry, location,) of the previous export.
+        - `scanned_members` lists (member_name, previous_entry, previous_location, location,) in archive order with
+          previous_entry None for changed or added members.
+        - `changed_members` lists (member_name, parsing_message, file_type, file_data, location,) of changed or added
+          members, parsed with `parse_member`.
+    """
+
+    scanned_members = []
+    changed_members = []
+
+    with open_serialization_tgz(tgz_path, stream=True) as tar_file:
+        for member in tar_file:
+            file_type = get_member_file_type(member)
+            started = time.perf_counter()
+            raw_data = None if file_type != 'file' else tar_file.extractfile(member).read()
+            METRICS.add_time('decompress', time.perf_counter() - started)
+            location = get_member_location(member, raw_data)
+            previous_entry, previous_location = previous_members.get(member.name, (None, None, ))
+
+            if previous_entry is not None and is_member_unchanged(previous_entry, previous_location, file_type, location):
+                scanned_members.append((member.name, previous_entry, previous_location, location, ))
+
+                continue
+
+            scanned_members.append((member.name, None, None, location, ))
+            changed_members.append((*parse_member(member.name, file_type, raw_data), location, ))
+
+    return (scanned_members, changed_members, )
+
+
+def iter_index_entries(index_by_id, data_index_by_path):
+    """Returns an iterative of every entry of both indexes."""
+
+    for index in (index_by_id, data_index_by_path, ):
+        yield from index.values()
+
+
+def remove_stale_index_entries(index_by_id, data_index_by_path, reference_store, stale_member_names, member_positions):
+    """Removes entities and references of stale (changed or removed) members from the indexes and renumbers the
+        export_data index 'i' of the remaining entities to their position in the new export.
+    """
+
+    stale_member_codes = {reference_store.codes[member_name] for member_name in stale_member_names if member_name in reference_store.codes}
+    member_names = reference_store.member_names
+
+    for entry in iter_index_entries(index_by_id, data_index_by_path):
+        if 'filename' in entry:
+            if entry['filename'] in stale_member_names:
+                del entry['i']
+                del entry['filename']
+            else:
+                entry['i'] = member_positions[entry['filename']]
+
+        if stale_member_codes:
+            references = entry['references']
+            rows = [row for row in references.rows if member_names[row] not in stale_member_codes]
+
+            if len(rows) != len(references.rows):
+                references.rows = array('I', rows)
+
+
+def drop_empty_index_entries(index_by_id, data_index_by_path):
+    """Removes entries left without an entity or references after stale members were removed."""
+
+    for index in (index_by_id, data_index_by_path, ):
+        empty_keys = [key for key, entry in index.items() if 'i' not in entry and not entry['references']]
+
+        for key in empty_keys:
+            del index[key]
+
+
+def sort_index_references(index_by_id, data_index_by_path, reference_store, member_positions, first_new_row, reorder_all):
+    """Sorts references into export order, matching the order a full load would add them in.
+        - Only lists with references added from row `first_new_row` are sorted unless `reorder_all`.
+    """
+
+    positions_by_code = {reference_store.codes[member_name]: position for member_name, position in member_positions.items() if member_name in reference_store.codes}
+    member_names = reference_store.member_names
+
+    for entry in iter_index_entries(index_by_id, data_index_by_path):
+        rows = entry['references'].rows
+
+        if len(rows) < 2 or not (reorder_all or rows[-1] >= first_new_row):
+            continue
+
+        sorted_rows = sorted(rows, key=lambda row: (positions_by_code[member_names[row]], row, ))
+
+        entry['references'].rows = array('I', sorted_rows)
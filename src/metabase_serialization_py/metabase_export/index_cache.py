@@ -0,0 +1,69 @@
+"""On-disk cache of parsed metadata and reference indexes for Metabase Serialization Exports."""
+import logging
+import os
+import pickle
+import tempfile
+
+from metabase_serialization_py.version import __version__
+
+LOGGER = logging.getLogger(__name__)
+
+
+# Bump when the layout of cached export data or indexes changes.
+INDEX_CACHE_FORMAT_VERSION = 7
+
+
+def get_index_cache_path(index_cache_dir, export_hash):
+    """Returns path of the index cache file for an export content hash."""
+
+    return os.path.join(index_cache_dir, f'{export_hash}.pickle')
+
+
+def load_index_cache(index_cache_dir, export_hash):
+    """Returns cached index dict for export_hash or None if missing or written by another library version."""
+
+    index_cache_path = get_index_cache_path(index_cache_dir, export_hash)
+
+    try:
+        with open(index_cache_path, 'rb') as index_cache_file:
+            index_cache = pickle.load(index_cache_file)
+    except FileNotFoundError:
+        return None
+    except (pickle.UnpicklingError, EOFError, AttributeError, ImportError) as error:
+        LOGGER.warning(f'Ignoring unreadable index cache {index_cache_path}: {error}')
+
+        return None
+
+    cache_versions = (index_cache.get('format_version', None), index_cache.get('library_version', None), index_cache.get('export_hash', None), )
+
+    if cache_versions != (INDEX_CACHE_FORMAT_VERSION, __version__, export_hash, ):
+        LOGGER.info(f'Ignoring stale index cache {index_cache_path}.')
+
+        return None
+
+    return index_cache
+
+
+def save_index_cache(index_cache_dir, export_hash, index_cache):
+    """Writes index_cache dict for export_hash, replacing any existing cache file atomically."""
+
+    os.makedirs(index_cache_dir, exist_ok=True)
+
+    index_cache = {
+        **index_cache,
+        'format_version': INDEX_CACHE_FORMAT_VERSION,
+        'library_version': __version__,
+        'export_hash': export_hash,
+    }
+
+    file_descriptor, temporary_path = tempfile.mkstemp(dir=index_cache_dir, suffix='.tmp')
+
+    try:
+        with os.fdopen(file_descriptor, 'wb') as index_cache_file:
+            pickle.dump(index_cache, index_cache_file, protocol=pickle.HIGHEST_PROTOCOL)
+
+        os.replace(temporary_path, get_index_cache_path(index_cache_dir, export_hash))
+    except BaseException:
+        os.unlink(temporary_path)
+
+        raise
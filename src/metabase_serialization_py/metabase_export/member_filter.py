@@ -0,0 +1,249 @@
+"""Selection of Metabase Serialization Export members by their archive paths, before any YAML is parsed.
+
+Exports lay out members by model:
+    - `collections/<entity_id>_<slug>/` for each collection, nested under its parent collection, with its own
+      `<entity_id>_<slug>.yaml` and `cards/`, `dashboards/`, and `timelines/` directories
+    - `databases/<database>/[schemas/<schema>/]tables/<table>/` for each table, with its own `<table>.yaml` and
+      `fields/`, `segments/`, and `metrics/` directories
+"""
+
+
+# Models of members in collection directories, by directory name.
+COLLECTION_ITEM_DIRECTORY_MODELS = {
+    'cards': 'Card',
+    'dashboards': 'Dashboard',
+    'timelines': 'Timeline',
+}
+# Models of members in table directories, by directory name.
+TABLE_ITEM_DIRECTORY_MODELS = {
+    'fields': 'Field',
+    'segments': 'Segment',
+    'metrics': 'Metric',
+}
+# Models of members in top level directories other than collections and databases, by directory name.
+TOP_LEVEL_DIRECTORY_MODELS = {
+    'actions': 'Action',
+    'snippets': 'NativeQuerySnippet',
+}
+# Top level directories of the export, below its root directory if any.
+TOP_LEVEL_DIRECTORIES = ('collections', 'databases', *TOP_LEVEL_DIRECTORY_MODELS, )
+MEMBER_MODELS = (
+    'Action',
+    'Card',
+    'Collection',
+    'Dashboard',
+    'Database',
+    'Field',
+    'Metric',
+    'NativeQuerySnippet',
+    'Segment',
+    'Table',
+    'Timeline',
+)
+# Escaped characters of names used as path segments, see `serdes/escape-segment` in Metabase.
+PATH_SEGMENT_ESCAPES = (
+    ('__SLASH__', '/', ),
+    ('__BACKSLASH__', '\\', ),
+)
+YAML_EXTENSIONS = ('.yaml', '.yml', )
+
+
+def unescape_path_segment(segment):
+    for escaped, character in PATH_SEGMENT_ESCAPES:
+        segment = segment.replace(escaped, character)
+
+    return segment
+
+
+def strip_yaml_extension(file_name):
+    for extension in YAML_EXTENSIONS:
+        if file_name.endswith(extension):
+            return file_name[:-len(extension)]
+
+    return None
+
+
+def get_database_member_scope(parts, is_file):
+    """Returns (model, data_path,) for the path parts below `databases/`.
+        - `data_path` is the data path the member belongs to, like (database, schema, table, field,) for a Field or
+          (database, schema, table,) for a Segment, as referenced in data_index_by_path.
+    """
+
+    database = unescape_path_segment(parts[0])
+
+    if len(parts) == 1:
+        return (None, (database, ), )
+
+    if is_file and len(parts) == 2:
+        return ('Database' if strip_yaml_extension(parts[1]) == parts[0] else None, (database, ), )
+
+    if parts[1] == 'schemas' and len(parts) > 2:
+        schema = unescape_path_segment(parts[2])
+        table_parts = parts[3:]
+    else:
+        schema = None
+        table_parts = parts[1:]
+
+    if len(table_parts) < 2 or table_parts[0] != 'tables':
+        return (None, (database, ), )
+
+    table_path = (database, schema, unescape_path_segment(table_parts[1]), )
+    item_parts = table_parts[2:]
+
+    if not is_file or not item_parts:
+        return (None, table_path, )
+
+    if len(item_parts) == 1:
+        return ('Table' if strip_yaml_extension(item_parts[0]) == table_parts[1] else None, table_path, )
+
+    model = TABLE_ITEM_DIRECTORY_MODELS.get(item_parts[0], None)
+
+    if model == 'Field':
+        field = strip_yaml_extension(item_parts[-1])
+
+        return (model, (*table_path, unescape_path_segment(item_parts[-1] if field is None else field), ), )
+
+    return (model, table_path, )
+
+
+def get_collection_member_scope(parts, is_file):
+    """Returns (model, collection_directories,) for the path parts below `collections/`.
+        - `collection_directories` are the `<entity_id>_<slug>` directories the member is in, outermost first.
+    """
+
+    directories = parts[:-1] if is_file else parts
+    collection_directories = tuple([directory for directory in directories if directory not in COLLECTION_ITEM_DIRECTORY_MODELS])
+
+    if not is_file:
+        return (None, collection_directories, )
+
+    if directories and directories[-1] in COLLECTION_ITEM_DIRECTORY_MODELS:
+        return (COLLECTION_ITEM_DIRECTORY_MODELS[directories[-1]], collection_directories, )
+
+    if directories and strip_yaml_extension(parts[-1]) == directories[-1]:
+        return ('Collection', collection_directories, )
+
+    return (None, collection_directories, )
+
+
+def get_root_directory(member_name):
+    """Returns the export's root directory of a member, like `metabase_data/`, '' for member names without one, or
+        None if the member is not in a top level directory of the export.
+    """
+
+    parts = member_name.split('/')
+
+    for i, part in enumerate(parts[:-1]):
+        if part in TOP_LEVEL_DIRECTORIES:
+            return ''.join(f'{directory}/' for directory in parts[:i])
+
+    return None
+
+
+def get_member_scope(member_name, file_type='file'):
+    """Returns (tree, model, key,) of an export member from its archive path.
+        - `tree` is 'collections', 'databases', or None for other members like settings.
+        - `model` is the serdes/meta model of the member's YAML file or None if unknown or not a file.
+        - `key` is the member's collection directories for 'collections' and data path for 'databases', else None.
+    """
+
+    parts = member_name.rstrip('/').split('/')
+    is_file = file_type == 'file'
+
+    # Skip the export's root directory, e.g. `metabase_data/`.
+    for i, part in enumerate(parts[:-1] if is_file else parts):
+        if part == 'collections':
+            return ('collections', *get_collection_member_scope(parts[i + 1:], is_file), )
+
+        if part == 'databases' and i + 1 < len(parts):
+            return ('databases', *get_database_member_scope(parts[i + 1:], is_file), )
+
+        if part in TOP_LEVEL_DIRECTORY_MODELS and is_file:
+            return (None, TOP_LEVEL_DIRECTORY_MODELS[part], None, )
+
+    return (None, None, None, )
+
+
+class MemberFilter:
+    """Selects the export members to parse from their archive paths.
+        - `collections` keeps only the members in the subtrees of these collection entity_ids.
+        - `models` keeps only members of these serdes/meta models.
+        - `databases` keeps only the database members of these database names.
+        - Database members left out by `collections` or `models`, but not by `databases`, are deferred: only those
+          whose data path is referenced by the selected members are parsed, in a second pass (see
+          get_dependency_member_names).
+        - Directories are kept if they are in a selected collection or database.
+    """
+
+    def __init__(self, collections=None, models=None, databases=None):
+        self.collections = None if collections is None else tuple(collections)
+        self.models = None if models is None else frozenset(models)
+        self.databases = None if databases is None else frozenset(databases)
+
+        unknown_models = set() if self.models is None else self.models.difference(MEMBER_MODELS)
+
+        if unknown_models:
+            raise ValueError(f'Unknown models: {", ".join(sorted(unknown_models))}. Models must be one of {", ".join(MEMBER_MODELS)}.')
+
+        # Data paths of deferred database members by member_name.
+        self.deferred_members = {}
+
+    def is_empty(self):
+        return self.collections is None and self.models is None and self.databases is None
+
+    def is_in_collections(self, collection_directories):
+        """Returns True if any of collection_directories, named `<entity_id>_<slug>`, is a selected collection."""
+
+        return any(
+            directory == entity_id or directory.startswith(f'{entity_id}_')
+            for directory in collection_directories
+            for entity_id in self.collections
+        )
+
+    def select(self, member_name, file_type):
+        """Returns True if the member is parsed in the first pass, deferring database members as dependencies."""
+
+        tree, model, key = get_member_scope(member_name, file_type)
+
+        if tree == 'databases':
+            if self.databases is not None and key[0] not in self.databases:
+                return False
+
+            if (self.databases is None and self.collections is not None) or (self.models is not None and model not in self.models):
+                if file_type == 'file':
+                    self.deferred_members[member_name] = key
+
+                return False
+
+            return True
+
+        if tree == 'collections' and self.collections is not None and not self.is_in_collections(key):
+            return False
+
+        if file_type != 'file':
+            return True
+
+        return self.models is None or model in self.models
+
+    def get_dependency_member_names(self, data_index_by_path):
+        """Returns set of deferred member names whose data path, or a data path within it, is referenced.
+            - A referenced Field also selects its Table and Database, and a referenced Table its Database.
+        """
+
+        referenced_paths = set()
+
+        for data_path in data_index_by_path:
+            if data_index_by_path[data_path]['references']:
+                referenced_paths.update(data_path[:k] for k in range(1, len(data_path) + 1))
+
+        return {member_name for member_name, data_path in self.deferred_members.items() if data_path in referenced_paths}
+
+
+class MemberNameFilter:
+    """Selects export members by name, e.g. the dependencies of a MemberFilter's second pass."""
+
+    def __init__(self, member_names):
+        self.member_names = member_names
+
+    def select(self, member_name, file_type):
+        return member_name in self.member_names
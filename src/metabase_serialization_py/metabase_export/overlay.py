@@ -0,0 +1,62 @@
+"""Documents changed or created on top of a loaded Metabase Serialization Export."""
+
+
+class ExportOverlay:
+    """Changed and created documents by member_name, leaving the MetabaseExport they are based on unchanged.
+        - Members without a document in the overlay are copied unchanged to the output export.
+        - Documents are never changed in place: edited and created documents share unchanged values with the
+          documents they are based on.
+    """
+
+    def __init__(self, metabase_export):
+        self.metabase_export = metabase_export
+        self.updated = {}
+        self.created = {}
+
+    def __contains__(self, member_name):
+        return member_name in self.updated or member_name in self.created
+
+    def __len__(self):
+        return len(self.updated) + len(self.created)
+
+    def get_member_index(self, member_name):
+        """Returns the export_data index of member_name in the export or None."""
+
+        return self.metabase_export.secondary_indexes.get_member_position(member_name)
+
+    def get_file_data(self, member_name):
+        """Returns the overlay's document for member_name, or the export's if it was not changed."""
+
+        if member_name in self.updated:
+            return self.updated[member_name]
+
+        if member_name in self.created:
+            return self.created[member_name]
+
+        i = self.get_member_index(member_name)
+
+        if i is None:
+            raise ValueError(f'Member not found in export: {member_name}')
+
+        return self.metabase_export.export_data.get_file_data(i)
+
+    def update(self, member_name, file_data):
+        """Replaces the document of an existing export member."""
+
+        if member_name in self.created:
+            self.created[member_name] = file_data
+
+            return
+
+        if self.get_member_index(member_name) is None:
+            raise ValueError(f'Cannot update member not found in export: {member_name}')
+
+        self.updated[member_name] = file_data
+
+    def create(self, member_name, file_data):
+        """Adds a document as a new member of the output export."""
+
+        if member_name in self.created or self.get_member_index(member_name) is not None:
+            raise ValueError(f'Cannot create member that already exists: {member_name}')
+
+        self.created[member_name] = file_data
@@ -0,0 +1,577 @@
+"""Declarative extraction of entity references from Metabase Serialization Export documents.
+
+Each model declares (pattern, kind,) rules. Patterns are paths into a document:
+    - `key` or `key.key` selects dict keys, and `["key"]` keys that are not simple names, like `["table.columns"]`
+    - `[n]` selects a list index and `[*]` every list index
+    - `*` selects every dict value
+
+A model's patterns are compiled once into a trie, and the trie into a Python function walking every document once
+along it, only looking up the keys and indices some rule can match. Each match emits references like
+(index, reference_key, relationship,) where `index` is 'id' (index_by_id) or 'path' (data_index_by_path) and
+`relationship` is the concrete path of the referencing value in the document.
+"""
+import json
+import re
+
+
+# Kinds of values matched by a rule.
+# - 'id': entity_id string
+# - 'path': data path list (or database name) like [database, schema, table, field]
+# - 'field': field clause like ['field', [database, schema, table, field], options]
+# - 'serdes_path': serdes/meta list, referencing each parent data path
+# - 'click_behavior': click_behavior dict linking to a question or dashboard
+# - 'column_settings': visualization_settings.column_settings dict keyed by JSON encoded column references
+# - 'query': MBQL query dict, referencing its source-table and the field clauses of its clauses, joins, and nested
+#   source-query, see emit_query_references
+REFERENCE_RULES = {
+    'Action': (
+        ('model_id', 'id', ),
+    ),
+    'Card': (
+        ('collection_id', 'id', ),
+        ('source_card_id', 'id', ),
+        ('database_id', 'path', ),
+        ('table_id', 'path', ),
+        ('dataset_query.database', 'path', ),
+        # Source tables and field clauses anywhere in the query, including joins and nested source-query clauses.
+        ('dataset_query.query', 'query', ),
+        ('dataset_query.native.template-tags.*.card-id', 'id', ),
+        ('dataset_query.native.template-tags.*.snippet-id', 'id', ),
+        ('dataset_query.native.template-tags.*.dimension', 'field', ),
+        ('result_metadata[*].id', 'path', ),
+        ('result_metadata[*].table_id', 'path', ),
+        ('result_metadata[*].fk_target_field_id', 'path', ),
+        ('result_metadata[*].field_ref', 'field', ),
+        ('parameters[*].values_source_config.card_id', 'id', ),
+        # Parameter targets look like ['dimension', field_clause, options].
+        ('parameters[*].target[1]', 'field', ),
+        ('parameter_mappings[*].card_id', 'id', ),
+        ('parameter_mappings[*].target[1]', 'field', ),
+        # Visualization settings are walked only where they hold field clauses, not as a whole.
+        ('visualization_settings["table.columns"][*].fieldRef', 'field', ),
+        ('visualization_settings["pivot_table.column_split"].rows[*]', 'field', ),
+        ('visualization_settings["pivot_table.column_split"].columns[*]', 'field', ),
+        ('visualization_settings.click_behavior', 'click_behavior', ),
+        ('visualization_settings.click_behavior.parameterMapping.*.target.dimension[1]', 'field', ),
+        ('visualization_settings.column_settings', 'column_settings', ),
+        ('visualization_settings.column_settings.*.click_behavior', 'click_behavior', ),
+    ),
+    'Collection': (
+        # Collections only have parent_id references or no references if at the top level.
+        ('parent_id', 'id', ),
+    ),
+    'Dashboard': (
+        ('collection_id', 'id', ),
+        ('parameters[*].values_source_config.card_id', 'id', ),
+        # Dashboard entities with content other than text/headers have external references in the dashcards array.
+        # Virtual cards like headings and text blocks have no card_id.
+        ('dashcards[*].entity_id', 'id', ),
+        ('dashcards[*].card_id', 'id', ),
+        ('dashcards[*].action_id', 'id', ),
+        ('dashcards[*].series[*].card_id', 'id', ),
+        ('dashcards[*].parameter_mappings[*].card_id', 'id', ),
+        ('dashcards[*].parameter_mappings[*].action_id', 'id', ),
+        ('dashcards[*].parameter_mappings[*].target[1]', 'field', ),
+        ('dashcards[*].visualization_settings.click_behavior', 'click_behavior', ),
+        ('dashcards[*].visualization_settings.column_settings', 'column_settings', ),
+        ('dashcards[*].visualization_settings.column_settings.*.click_behavior', 'click_behavior', ),
+    ),
+    'Database': (),
+    'Field': (
+        ('table_id', 'path', ),
+        ('fk_target_field_id', 'path', ),
+        ('serdes/meta', 'serdes_path', ),
+    ),
+    'Metric': (
+        ('table_id', 'path', ),
+        ('definition', 'query', ),
+    ),
+    'NativeQuerySnippet': (
+        ('collection_id', 'id', ),
+    ),
+    'Segment': (
+        ('table_id', 'path', ),
+        ('definition', 'query', ),
+    ),
+    'Table': (
+        ('db_id', 'path', ),
+        ('serdes/meta', 'serdes_path', ),
+    ),
+    'Timeline': (
+        ('collection_id', 'id', ),
+    ),
+}
+
+CLICK_BEHAVIOR_ENTITY_LINK_TYPES = ('question', 'dashboard', )
+
+PATTERN_TOKEN_RE = re.compile(r'\[(\*|-?\d+)\]|\[("(?:[^"\\]|\\.)*")\]|\.?([^.\[\]"]+)')
+SIMPLE_KEY_RE = re.compile(r'[A-Za-z0-9_/\-]+')
+RELATIONSHIP_TOKEN_RE = re.compile(r'\[(-?\d+)\]|\[("(?:[^"\\]|\\.)*")\]|\.?([^.\[\]"]+)')
+
+# Memos of relationship segments for dict keys seen while walking documents, inside documents and at their root.
+KEY_SEGMENTS = {}
+ROOT_KEY_SEGMENTS = {}
+# Memo of the data path of column_settings keys, which repeat across the cards of the same tables.
+COLUMN_SETTINGS_DATA_PATHS = {}
+MAX_KEY_SEGMENTS = 100000
+# Largest list index, plus one, whose relationships are formatted once per rule when it is compiled.
+MAX_INDEXED_RELATIONSHIPS = 1000
+
+ANY_INDEX = ('any_index', )
+ANY_KEY = ('any_key', )
+
+
+def compile_pattern(pattern):
+    """Returns tuple of steps for a rule pattern like `dataset_query.query.joins[*].source-table`."""
+
+    steps = []
+
+    for index, quoted_key, key in PATTERN_TOKEN_RE.findall(pattern):
+        if index == '*':
+            steps.append(ANY_INDEX)
+        elif index:
+            steps.append(('index', int(index), ))
+        elif quoted_key:
+            steps.append(('key', json.loads(quoted_key), ))
+        elif key == '*':
+            steps.append(ANY_KEY)
+        else:
+            steps.append(('key', key, ))
+
+    return tuple(steps)
+
+
+def format_relationship(tokens):
+    """Returns relationship path string for tokens of dict keys and list indices.
+        - Keys that are not simple names are JSON quoted, e.g. `visualization_settings["table.columns"][0]`.
+    """
+
+    relationship = []
+
+    for token in tokens:
+        if isinstance(token, int):
+            relationship.append(f'[{token}]')
+        elif SIMPLE_KEY_RE.fullmatch(token):
+            relationship.append(f'.{token}' if relationship else token)
+        else:
+            relationship.append(f'[{json.dumps(token)}]')
+
+    return ''.join(relationship)
+
+
+def parse_relationship(relationship):
+    """Returns tuple of dict keys and list indices for a relationship path string (see format_relationship)."""
+
+    tokens = []
+
+    for index, quoted_key, key in RELATIONSHIP_TOKEN_RE.findall(relationship):
+        if index:
+            tokens.append(int(index))
+        elif quoted_key:
+            tokens.append(json.loads(quoted_key))
+        else:
+            tokens.append(key)
+
+    return tuple(tokens)
+
+
+def is_field_clause(value):
+    """Returns True for field clauses like ['field', [database, schema, table, field], options]."""
+
+    return isinstance(value, (list, tuple, )) and len(value) > 1 and value[0] == 'field'
+
+
+class RuleNode:
+    """Trie node of compiled reference rules."""
+
+    __slots__ = ('kinds', 'keys', 'indices', 'any_index', 'any_key', )
+
+    def __init__(self):
+        self.kinds = ()
+        self.keys = {}
+        self.indices = {}
+        self.any_index = None
+        self.any_key = None
+
+    def child(self, step):
+        """Returns child node for step, creating it if needed."""
+
+        if step[0] == 'key':
+            return self.keys.setdefault(step[1], RuleNode())
+
+        if step[0] == 'index':
+            return self.indices.setdefault(step[1], RuleNode())
+
+        attribute = step[0]
+
+        if getattr(self, attribute) is None:
+            setattr(self, attribute, RuleNode())
+
+        return getattr(self, attribute)
+
+
+class ReferenceExtractor:
+    """Extracts references from documents of a single model in one walk per document.
+        - The rule trie is compiled into a single function of nested loops, see compile_extractor, so walking a
+          document only tests the keys and indices that some rule can match and never visits other subtrees.
+    """
+
+    def __init__(self, rules):
+        root = RuleNode()
+
+        for pattern, kind in rules:
+            node = root
+
+            for step in compile_pattern(pattern):
+                node = node.child(step)
+
+            if kind not in node.kinds:
+                node.kinds = (*node.kinds, kind, )
+
+        self.root = root
+        self.match = compile_extractor(root)
+
+    def extract(self, file_data):
+        """Returns list of (index, reference_key, relationship,) for references found in file_data."""
+
+        references = []
+
+        self.match(file_data, references)
+
+        return references
+
+
+def get_relationship_segment(segment):
+    """Returns a relationship segment escaped for a single-quoted f-string literal of generated code."""
+
+    return segment.replace('\\', '\\\\').replace("'", "\\'").replace('{', '{{').replace('}', '}}')
+
+
+def compile_extractor(root):
+    """Returns a function like match(file_data, references) walking the RuleNode trie root as nested loops.
+        - Every node is a local variable of the generated code, and relationships are f-strings of the keys and loop
+          indices on the way to a match, only formatted when a reference is emitted. Values of missing keys are None
+          and fail the type test of inline emitters and children, so only other emitters test for None.
+        - Relationships under a single `[*]` or `[n]`, like `result_metadata[0].id`, repeat across documents. Those of
+          the first MAX_INDEXED_RELATIONSHIPS indices are formatted into a tuple when the rule is compiled, so
+          documents share them without writing to the rule.
+        - `id`, `path`, and `field` references are emitted inline, other kinds call their emitter.
+        - Generated code, rather than nested matcher functions with a call per visited node, keeps extraction faster
+          than the legacy update_entity_references_* methods, see benchmarks/bench_reference_extraction.py.
+    """
+
+    namespace = {f'emit_{kind}_references': emitter for kind, emitter in EMITTERS.items()}
+    namespace.update(
+        emit_checked_field_clause_references=emit_checked_field_clause_references,
+        get_key_segment=get_key_segment,
+        KEY_SEGMENTS=KEY_SEGMENTS,
+        ROOT_KEY_SEGMENTS=ROOT_KEY_SEGMENTS,
+    )
+    prelude = []
+    lines = ['def match(value, references):', '    append = references.append']
+    counter = [0]
+
+    def new_name(prefix):
+        counter[0] += 1
+
+        return f'{prefix}{counter[0]}'
+
+    def add(indent, line):
+        lines.append('    ' * indent + line)
+
+    def get_relationship_code(relationship, variables):
+        """Returns code of the relationship string, an f-string or a lookup of relationships formatted on compiling."""
+
+        if len(variables) != 1 or not variables[0].startswith('index'):
+            return f"f'{relationship}'"
+
+        index_name = variables[0]
+        relationships_name = new_name('relationships')
+        template = relationship.replace(f'{{{index_name}}}', '{0}')
+        prelude.append(f"{relationships_name} = tuple([{relationships_name}_template.format(index) for index in range({MAX_INDEXED_RELATIONSHIPS})])")
+        prelude.insert(-1, f"{relationships_name}_template = '{template}'")
+
+        return f"({relationships_name}[{index_name}] if {index_name} < {MAX_INDEXED_RELATIONSHIPS} else {relationships_name}_template.format({index_name}))"
+
+    def add_emitter(kind, name, relationship, variables, indent):
+        relationship_code = get_relationship_code(relationship, variables)
+
+        if kind == 'id':
+            add(indent, f'if {name} and type({name}) is str:')
+            add(indent + 1, f"append(('id', {name}, {relationship_code}, ))")
+        elif kind == 'path':
+            add(indent, f'if type({name}) is list or type({name}) is tuple:')
+            add(indent + 1, f"append(('path', tuple({name}), {relationship_code}, ))")
+            add(indent, f'elif {name} and type({name}) is str:')
+            # Database references are names rather than paths.
+            add(indent + 1, f"append(('path', ({name}, ), {relationship_code}, ))")
+        elif kind == 'field':
+            add(indent, f"if (type({name}) is list or type({name}) is tuple) and len({name}) > 1 and {name}[0] == 'field':")
+            add(indent + 1, f'if type({name}[1]) is list and (len({name}) < 3 or type({name}[2]) is not dict):')
+            add(indent + 2, f"append(('path', tuple({name}[1]), {get_relationship_code(relationship + '[1]', variables)}, ))")
+            add(indent + 1, 'else:')
+            add(indent + 2, f"emit_checked_field_clause_references({name}, {relationship_code}, references)")
+        else:
+            add(indent, f'if {name} is not None:')
+            add(indent + 1, f"emit_{kind}_references({name}, {relationship_code}, references)")
+
+    def add_node(node, name, relationship, indent, is_root=False, variables=()):
+        for kind in node.kinds:
+            add_emitter(kind, name, relationship, variables, indent)
+
+        if node.keys or node.any_key is not None:
+            add(indent, f'if type({name}) is dict:')
+
+            for key, child in node.keys.items():
+                item_name = new_name('item')
+                add(indent + 1, f'{item_name} = {name}.get({key!r}, None)')
+                add_node(child, item_name, relationship + get_relationship_segment(get_key_segment(key, is_root)), indent + 1, variables=variables)
+
+            if node.any_key is not None:
+                key_name, item_name = new_name('key'), new_name('item')
+                add(indent + 1, f'for {key_name}, {item_name} in {name}.items():')
+                add(indent + 2, f'{key_name} = {"ROOT_KEY_SEGMENTS" if is_root else "KEY_SEGMENTS"}.get({key_name}, None) or get_key_segment({key_name}, {is_root})')
+                add_node(node.any_key, item_name, f'{relationship}{{{key_name}}}', indent + 2, variables=(*variables, key_name, ))
+
+        if node.indices or node.any_index is not None:
+            add(indent, f'if type({name}) is list or type({name}) is tuple:')
+
+            for index, child in node.indices.items():
+                index_name, item_name = new_name('index'), new_name('item')
+                add(indent + 1, f'if {-index if index < 0 else index + 1} <= len({name}):')
+                add(indent + 2, f'{index_name} = {index} % len({name})')
+                add(indent + 2, f'{item_name} = {name}[{index_name}]')
+                add_node(child, item_name, f'{relationship}[{{{index_name}}}]', indent + 2, variables=(*variables, index_name, ))
+
+            if node.any_index is not None:
+                index_name, item_name = new_name('index'), new_name('item')
+                add(indent + 1, f'for {index_name}, {item_name} in enumerate({name}):')
+                add_node(node.any_index, item_name, f'{relationship}[{{{index_name}}}]', indent + 2, variables=(*variables, index_name, ))
+
+    add_node(root, 'value', '', 1, True)
+    exec(compile('\n'.join([*prelude, *lines]), '<reference rules>', 'exec'), namespace)
+
+    return namespace['match']
+
+
+def get_key_segment(key, is_root=False):
+    """Returns relationship segment for a dict key (see format_relationship)."""
+
+    key_segments = ROOT_KEY_SEGMENTS if is_root else KEY_SEGMENTS
+    segment = key_segments.get(key, None)
+
+    if segment is None:
+        if isinstance(key, str) and SIMPLE_KEY_RE.fullmatch(key):
+            segment = key if is_root else f'.{key}'
+        else:
+            segment = f'[{json.dumps(key)}]'
+
+        if len(key_segments) < MAX_KEY_SEGMENTS:
+            key_segments[key] = segment
+
+    return segment
+
+
+def emit_id_reference(value, relationship, references):
+    if value and type(value) is str:
+        references.append(('id', value, relationship, ))
+
+
+def emit_path_reference(value, relationship, references):
+    value_type = type(value)
+
+    if value_type is list or value_type is tuple:
+        references.append(('path', tuple(value), relationship, ))
+    elif value and value_type is str:
+        # Database references are names rather than paths.
+        references.append(('path', (value, ), relationship, ))
+
+
+def emit_field_clause_references(value, relationship, references):
+    """Appends data path references of a field clause to references."""
+
+    if is_field_clause(value):
+        emit_checked_field_clause_references(value, relationship, references)
+
+
+def emit_checked_field_clause_references(value, relationship, references):
+    """Appends data path references of value, already known to be a field clause, to references."""
+
+    field_type = type(value[1])
+
+    if field_type is list or field_type is tuple:
+        references.append(('path', tuple(value[1]), f'{relationship}[1]', ))
+
+    if len(value) > 2 and type(value[2]) is dict:
+        source_field = value[2].get('source-field', None)
+
+        if type(source_field) is list or type(source_field) is tuple:
+            # Implicit joins through a foreign key.
+            references.append(('path', tuple(source_field), f'{relationship}[2].source-field', ))
+
+
+def emit_query_references(value, relationship, references):
+    """Appends references of an MBQL query dict like dataset_query.query to references.
+        - Its source-table comes first, then the field clauses of its clauses, see emit_clause_references, with joins
+          and a nested source-query read as queries themselves.
+    """
+
+    if type(value) is not dict:
+        return
+
+    source_table = value.get('source-table', None)
+    source_table_type = type(source_table)
+
+    if source_table_type is list or source_table_type is tuple:
+        references.append(('path', tuple(source_table), relationship + '.source-table', ))
+    elif source_table and source_table_type is str:
+        references.append(('id', source_table, relationship + '.source-table', ))
+
+    for key, item in value.items():
+        item_type = type(item)
+
+        if (item_type is not list and item_type is not tuple and item_type is not dict) or key == 'source-table':
+            continue
+
+        item_relationship = relationship + (KEY_SEGMENTS.get(key, None) or get_key_segment(key))
+
+        if key == 'source-query' and item_type is dict:
+            emit_query_references(item, item_relationship, references)
+        elif key == 'joins' and item_type is not dict:
+            for index, join in enumerate(item):
+                emit_query_references(join, f'{item_relationship}[{index}]', references)
+        else:
+            emit_clause_references(item, item_relationship, references)
+
+
+def emit_clause_references(value, relationship, references):
+    """Appends data path references of the field clauses nested anywhere in an MBQL clause to references.
+        - Field clauses are emitted whole; their data paths are not walked again. Only lists and dicts are descended
+          into.
+        - Clauses and the arguments of clauses, like the filter `['>', field, 10]` or the aggregations
+          `[['sum', field]]`, are walked inline, without a call or a relationship string per clause, and without
+          a call per field clause unless it joins through a source-field.
+    """
+
+    value_type = type(value)
+
+    if value_type is dict:
+        for key, item in value.items():
+            item_type = type(item)
+
+            if item_type is list or item_type is tuple or item_type is dict:
+                emit_clause_references(item, relationship + (KEY_SEGMENTS.get(key, None) or get_key_segment(key)), references)
+
+        return
+
+    if value_type is not list and value_type is not tuple:
+        return
+
+    if len(value) > 1 and value[0] == 'field':
+        emit_checked_field_clause_references(value, relationship, references)
+
+        return
+
+    for index, item in enumerate(value):
+        item_type = type(item)
+
+        if item_type is dict:
+            emit_clause_references(item, f'{relationship}[{index}]', references)
+
+            continue
+
+        if item_type is not list and item_type is not tuple:
+            continue
+
+        if len(item) > 1 and item[0] == 'field':
+            if len(item) > 2 and type(item[2]) is dict and 'source-field' in item[2]:
+                emit_checked_field_clause_references(item, f'{relationship}[{index}]', references)
+            elif type(item[1]) is list or type(item[1]) is tuple:
+                references.append(('path', tuple(item[1]), f'{relationship}[{index}][1]', ))
+
+            continue
+
+        item_relationship = None
+
+        for argument_index, argument in enumerate(item):
+            argument_type = type(argument)
+
+            if argument_type is list or argument_type is tuple:
+                if item_relationship is None:
+                    item_relationship = f'{relationship}[{index}]'
+
+                if len(argument) > 1 and argument[0] == 'field':
+                    if len(argument) > 2 and type(argument[2]) is dict and 'source-field' in argument[2]:
+                        emit_checked_field_clause_references(argument, f'{item_relationship}[{argument_index}]', references)
+                    elif type(argument[1]) is list or type(argument[1]) is tuple:
+                        references.append(('path', tuple(argument[1]), f'{item_relationship}[{argument_index}][1]', ))
+                else:
+                    emit_clause_references(argument, f'{item_relationship}[{argument_index}]', references)
+            elif argument_type is dict:
+                if item_relationship is None:
+                    item_relationship = f'{relationship}[{index}]'
+
+                emit_clause_references(argument, f'{item_relationship}[{argument_index}]', references)
+
+
+def emit_serdes_path_references(value, relationship, references):
+    serdes_meta_ids = ()
+
+    for i in range(len(value) - 1):
+        serdes_meta_ids = (*serdes_meta_ids, value[i].get('id', None), )
+        references.append(('path', serdes_meta_ids, f'{relationship}[{i}].id', ))
+
+
+def emit_click_behavior_reference(value, relationship, references):
+    if type(value) is dict and value.get('linkType', None) in CLICK_BEHAVIOR_ENTITY_LINK_TYPES and type(value.get('targetId', None)) is str:
+        references.append(('id', value['targetId'], f'{relationship}.targetId', ))
+
+
+def emit_column_settings_references(value, relationship, references):
+    """Appends data path references of column_settings keys like '["ref",["field",[...],null]]' to references."""
+
+    if type(value) is not dict:
+        return
+
+    for key in value:
+        if '"field"' not in key:
+            continue
+
+        data_path = COLUMN_SETTINGS_DATA_PATHS.get(key, False)
+
+        if data_path is False:
+            data_path = get_column_settings_data_path(key)
+
+            if len(COLUMN_SETTINGS_DATA_PATHS) < MAX_KEY_SEGMENTS:
+                COLUMN_SETTINGS_DATA_PATHS[key] = data_path
+
+        if data_path is not None:
+            # The relationship is the key itself since the reference is inside the key rather than its value.
+            references.append(('path', data_path, relationship + get_key_segment(key), ))
+
+
+def get_column_settings_data_path(key):
+    """Returns the data path tuple of a column_settings key like '["ref",["field",[...],null]]', or None."""
+
+    try:
+        column_reference = json.loads(key)
+    except ValueError:
+        return None
+
+    if isinstance(column_reference, list) and len(column_reference) > 1 and is_field_clause(column_reference[1]) and isinstance(column_reference[1][1], list):
+        return tuple(column_reference[1][1])
+
+    return None
+
+
+EMITTERS = {
+    'id': emit_id_reference,
+    'path': emit_path_reference,
+    'field': emit_field_clause_references,
+    'serdes_path': emit_serdes_path_references,
+    'click_behavior': emit_click_behavior_reference,
+    'column_settings': emit_column_settings_references,
+    'query': emit_query_references,
+}
+
+REFERENCE_EXTRACTORS = {model: ReferenceExtractor(rules) for model, rules in REFERENCE_RULES.items()}
@@ -0,0 +1,113 @@
+"""Compact storage of entity references for Metabase Serialization Export indexes."""
+from array import array
+
+
+class ReferenceStore:
+    """Column-oriented store of references like (entity_model, relationship, serdes_meta_id, member_name,).
+        - Every value is interned once and each reference is stored as four integer codes.
+    """
+
+    __slots__ = ('values', 'codes', 'entity_models', 'relationships', 'serdes_meta_ids', 'member_names', )
+
+    def __init__(self):
+        self.values = []
+        self.codes = {}
+        self.entity_models = array('I')
+        self.relationships = array('I')
+        self.serdes_meta_ids = array('I')
+        self.member_names = array('I')
+
+    def __len__(self):
+        return len(self.entity_models)
+
+    def intern(self, value):
+        """Returns integer code of value, adding it to the store if it is new."""
+
+        code = self.codes.get(value, None)
+
+        if code is None:
+            code = len(self.values)
+            self.values.append(value)
+            self.codes[value] = code
+
+        return code
+
+    def add(self, entity_model, relationship, serdes_meta_id, member_name):
+        """Adds a reference and returns its row number."""
+
+        self.entity_models.append(self.intern(entity_model))
+        self.relationships.append(self.intern(relationship))
+        self.serdes_meta_ids.append(self.intern(serdes_meta_id))
+        self.member_names.append(self.intern(member_name))
+
+        return len(self.entity_models) - 1
+
+    def compact(self, reference_lists):
+        """Drops rows not used by any of reference_lists, renumbering the rows of each list in order."""
+
+        columns = (self.entity_models, self.relationships, self.serdes_meta_ids, self.member_names, )
+        compacted_columns = tuple(array('I') for _ in columns)
+
+        for reference_list in reference_lists:
+            rows = reference_list.rows
+            start = len(compacted_columns[0])
+
+            for column, compacted_column in zip(columns, compacted_columns):
+                compacted_column.extend([column[row] for row in rows])
+
+            reference_list.rows = array('I', range(start, start + len(rows)))
+
+        self.entity_models, self.relationships, self.serdes_meta_ids, self.member_names = compacted_columns
+
+    def get(self, row):
+        """Returns reference at row as (entity_model, relationship, serdes_meta_id, member_name,)."""
+
+        values = self.values
+
+        return (
+            values[self.entity_models[row]],
+            values[self.relationships[row]],
+            values[self.serdes_meta_ids[row]],
+            values[self.member_names[row]],
+        )
+
+
+class ReferenceList:
+    """List of references to a single entity id or data path, stored as rows of a ReferenceStore.
+        - Behaves like the list of reference tuples it replaces.
+    """
+
+    __slots__ = ('store', 'rows', )
+
+    def __init__(self, store):
+        self.store = store
+        self.rows = array('I')
+
+    def __len__(self):
+        return len(self.rows)
+
+    def __iter__(self):
+        get = self.store.get
+
+        for row in self.rows:
+            yield get(row)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self.store.get(row) for row in self.rows[i]]
+
+        return self.store.get(self.rows[i])
+
+    def __eq__(self, other):
+        if isinstance(other, (ReferenceList, list, )):
+            return list(self) == list(other)
+
+        return NotImplemented
+
+    def __repr__(self):
+        return repr(list(self))
+
+    def append(self, reference):
+        """Appends a reference tuple like (entity_model, relationship, serdes_meta_id, member_name,)."""
+
+        self.rows.append(self.store.add(*reference))
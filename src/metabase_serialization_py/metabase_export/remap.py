@@ -0,0 +1,180 @@
+"""Bulk remapping of database, schema, and table references in Metabase Serialization Export documents."""
+import json
+import logging
+
+from metabase_serialization_py.metabase_export.edit_plans import get_copied_container
+from metabase_serialization_py.metabase_export.reference_rules import REFERENCE_EXTRACTORS, parse_relationship
+
+LOGGER = logging.getLogger(__name__)
+
+
+# Models defining data paths; their own files are not rewritten when the data paths they define are remapped.
+DATA_MODEL_MODELS = ('Database', 'Table', 'Field', )
+
+
+def build_data_path_rewrite_map(data_path_trie, source_prefix, target_prefix):
+    """Returns dict of new data path by referenced data path for every data path under source_prefix.
+        - Prefixes are data paths of the same length, e.g. (database,) for a database, (database, schema,) for a schema,
+          or (database, schema, table,) for a table.
+    """
+
+    source_prefix = tuple(source_prefix)
+    target_prefix = tuple(target_prefix)
+
+    if not source_prefix or len(source_prefix) != len(target_prefix):
+        raise ValueError(f'Cannot remap {source_prefix} to {target_prefix}: data path prefixes must have the same length.')
+
+    return {data_path: target_prefix + data_path[len(source_prefix):] for data_path in data_path_trie.iter_prefix(source_prefix)}
+
+
+def group_remapped_references(data_index_by_path, rewrite_map, member_names=None):
+    """Returns dict of [(relationship_tokens, data_path, new_data_path,), ...] by member_name for the references to the
+        data paths in rewrite_map, optionally only of members in member_names.
+    """
+
+    relationship_tokens = {}
+    member_rewrites = {}
+
+    for data_path, new_data_path in rewrite_map.items():
+        index_entry = data_index_by_path.get(data_path, None)
+
+        if index_entry is None or data_path == new_data_path:
+            continue
+
+        for entity_model, relationship, serdes_meta_id, member_name in index_entry['references']:
+            if entity_model in DATA_MODEL_MODELS or (member_names is not None and member_name not in member_names):
+                continue
+
+            tokens = relationship_tokens.get(relationship, None)
+
+            if tokens is None:
+                tokens = relationship_tokens[relationship] = parse_relationship(relationship)
+
+            member_rewrites.setdefault(member_name, []).append((tokens, data_path, new_data_path, ))
+
+    return member_rewrites
+
+
+def get_document_rewrites(document, rewrite_map):
+    """Returns list of (relationship_tokens, data_path, new_data_path,) for the references of a document to the data
+        paths in rewrite_map, extracted from the document itself rather than the indexes.
+    """
+
+    model = document['serdes/meta'][-1]['model']
+    reference_extractor = REFERENCE_EXTRACTORS.get(model, None)
+
+    if reference_extractor is None or model in DATA_MODEL_MODELS:
+        return []
+
+    return [
+        (parse_relationship(relationship), data_path, rewrite_map[data_path], )
+        for index, data_path, relationship in reference_extractor.extract(document)
+        if index != 'id' and data_path in rewrite_map and data_path != rewrite_map[data_path]
+    ]
+
+
+def rewrite_column_settings_key(column_settings, key, data_path, new_data_path):
+    """Renames a column_settings key like '["ref",["field",[...],null]]' referencing data_path, keeping key order."""
+
+    try:
+        column_reference = json.loads(key)
+    except ValueError:
+        return False
+
+    if not (isinstance(column_reference, list) and len(column_reference) > 1 and isinstance(column_reference[1], list) and len(column_reference[1]) > 1 and column_reference[1][1] == list(data_path)):
+        return False
+
+    column_reference[1][1] = list(new_data_path)
+    new_key = json.dumps(column_reference, separators=(',', ':', ))
+    items = list(column_settings.items())
+
+    column_settings.clear()
+    column_settings.update((new_key if item_key == key else item_key, value, ) for item_key, value in items)
+
+    return True
+
+
+def remap_document(document, rewrites):
+    """Returns (new_document, rewritten, skipped,) with the data path references of document rewritten.
+        - `rewrites` is a list of (relationship_tokens, data_path, new_data_path,) for the references of the document.
+        - Only the referencing values are visited, deepest first so renamed column_settings keys do not break the paths
+          of references inside them.
+        - document is not changed: only the dicts and lists along rewritten paths are copied and the rest of
+          new_document is shared with it.
+        - Entity ids are rewritten the same way as database names, as data paths of a single element.
+        - References whose value no longer matches data_path, e.g. already changed, are skipped.
+    """
+
+    document = dict(document)
+    copies = {id(document): document}
+    rewritten = 0
+    skipped = 0
+
+    for tokens, data_path, new_data_path in sorted(rewrites, key=lambda rewrite: len(rewrite[0]), reverse=True):
+        try:
+            container = get_copied_container(document, tokens, copies)
+            value = container[tokens[-1]]
+        except (KeyError, IndexError, TypeError):
+            skipped += 1
+
+            continue
+
+        if isinstance(value, (list, tuple, )) and tuple(value) == data_path:
+            container[tokens[-1]] = list(new_data_path)
+        elif isinstance(value, str) and value == data_path[-1]:
+            # Database names and serdes/meta ids reference the last element of their data path.
+            container[tokens[-1]] = new_data_path[-1]
+        elif isinstance(container, dict) and isinstance(tokens[-1], str) and tokens[-1].startswith('[') and rewrite_column_settings_key(container, tokens[-1], data_path, new_data_path):
+            pass
+        else:
+            skipped += 1
+
+            continue
+
+        rewritten += 1
+
+    return (document, rewritten, skipped, )
+
+
+def remap_data_paths(metabase_export, export_overlay, source_prefix, target_prefix, member_names=None):
+    """Points every reference to data paths under source_prefix at target_prefix, writing changed documents to
+        export_overlay, and returns counts of remapped data paths, members, references, and skipped references.
+        - The rewrite map is built once from the export's data path trie and each affected document is walked once,
+          along the relationships of its references only, copying only the values along them.
+        - `member_names` limits the rewrite to these members, e.g. the files of a copied collection.
+        - Database, Table, and Field files are not rewritten, only the content referencing them.
+        - Documents already in export_overlay, e.g. replaced by an earlier change, are rewritten along their own
+          references since the indexes only know the references of the export's documents.
+    """
+
+    rewrite_map = build_data_path_rewrite_map(metabase_export.get_data_path_trie(), source_prefix, target_prefix)
+    member_rewrites = group_remapped_references(metabase_export.data_index_by_path, rewrite_map, member_names)
+
+    for overlay_documents in (export_overlay.updated, export_overlay.created, ):
+        for member_name, document in overlay_documents.items():
+            if member_names is not None and member_name not in member_names:
+                continue
+
+            rewrites = get_document_rewrites(document, rewrite_map)
+
+            if rewrites:
+                member_rewrites[member_name] = rewrites
+            else:
+                member_rewrites.pop(member_name, None)
+
+    counts = {'data_paths': len(rewrite_map), 'members': 0, 'references': 0, 'skipped': 0}
+
+    for member_name, rewrites in member_rewrites.items():
+        document, rewritten, skipped = remap_document(export_overlay.get_file_data(member_name), rewrites)
+
+        counts['references'] += rewritten
+        counts['skipped'] += skipped
+
+        if rewritten:
+            export_overlay.update(member_name, document)
+            counts['members'] += 1
+
+    if counts['skipped']:
+        LOGGER.warning(f'Skipped {counts["skipped"]} references to {tuple(source_prefix)} that no longer match their documents.')
+
+    return counts
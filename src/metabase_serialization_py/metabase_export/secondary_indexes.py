@@ -0,0 +1,153 @@
+"""Lazily built secondary indexes of Metabase Serialization Export members by their metadata."""
+
+
+# Collection key of members in the root collection and of top level collections.
+ROOT_COLLECTION_ID = 'root'
+# Models of members kept in collections, by the attribute holding their collection's entity_id.
+COLLECTION_ATTRIBUTES = {
+    'Action': None,
+    'Card': 'collection_id',
+    'Collection': 'parent_id',
+    'Dashboard': 'collection_id',
+    'NativeQuerySnippet': 'collection_id',
+    'Timeline': 'collection_id',
+}
+
+
+def get_member_collection_id(metadata):
+    """Returns entity_id of the collection a member is in, ROOT_COLLECTION_ID, or None for models not in collections."""
+
+    attribute = COLLECTION_ATTRIBUTES.get(metadata['serdes/meta.model'], None)
+
+    if attribute is None:
+        return None
+
+    collection_id = metadata.get(attribute, None)
+
+    return ROOT_COLLECTION_ID if collection_id is None else collection_id
+
+
+def get_member_database(metadata):
+    """Returns the name of the database a member queries or belongs to, or None."""
+
+    model = metadata['serdes/meta.model']
+    serdes_meta_id = metadata['serdes/meta.id']
+
+    if model == 'Database':
+        return serdes_meta_id
+
+    if model in ('Table', 'Field', ) and isinstance(serdes_meta_id, tuple):
+        return serdes_meta_id[0]
+
+    if model == 'Card':
+        return metadata.get('database_id', None)
+
+    table_id = metadata.get('table_id', None)
+
+    return table_id[0] if isinstance(table_id, (list, tuple, )) and table_id else None
+
+
+def get_member_model(metadata):
+    return metadata['serdes/meta.model']
+
+
+def get_member_name(metadata):
+    return metadata.get('name', None)
+
+
+def get_member_slug(metadata):
+    return metadata.get('slug', None)
+
+
+def get_member_archived(metadata):
+    return bool(metadata.get('archived', None))
+
+
+# Functions returning each secondary index's key from a member's metadata; members with a None key are not indexed.
+SECONDARY_INDEX_KEYS = {
+    'model': get_member_model,
+    'collection': get_member_collection_id,
+    'database': get_member_database,
+    'name': get_member_name,
+    'slug': get_member_slug,
+    'archived': get_member_archived,
+}
+
+
+class SecondaryIndexes:
+    """Export data positions of members by model, collection, database, name, slug, and archived flag.
+        - Each index is built on first use with one pass over export_data entries, without parsing any documents,
+          and cached; indexes are not updated if export_data changes afterwards.
+        - Only members with metadata are indexed, i.e. not directories or files that could not be parsed.
+    """
+
+    def __init__(self, export_data):
+        self.export_data = export_data
+        self.indexes = {}
+        self.member_positions = None
+
+    def get_index(self, index_name):
+        """Returns dict of positions by key for a secondary index in SECONDARY_INDEX_KEYS, building it if needed."""
+
+        index = self.indexes.get(index_name, None)
+
+        if index is None:
+            get_key = SECONDARY_INDEX_KEYS[index_name]
+            index = {}
+
+            for i, (member_name, parsing_message, file_type, metadata) in enumerate(self.export_data.entries):
+                if metadata is None:
+                    continue
+
+                key = get_key(metadata)
+
+                if key is not None:
+                    positions = index.get(key, None)
+
+                    if positions is None:
+                        positions = index[key] = []
+
+                    positions.append(i)
+
+            self.indexes[index_name] = index
+
+        return index
+
+    def get_key(self, index_name, metadata):
+        """Returns a member's key in a secondary index."""
+
+        return SECONDARY_INDEX_KEYS[index_name](metadata)
+
+    def lookup(self, index_name, key):
+        """Returns list of export data positions with key in a secondary index, in archive order."""
+
+        return self.get_index(index_name).get(key, [])
+
+    def get_member_position(self, member_name):
+        """Returns the export data position of member_name or None."""
+
+        if self.member_positions is None:
+            self.member_positions = {entry[0]: i for i, entry in enumerate(self.export_data.entries)}
+
+        return self.member_positions.get(member_name, None)
+
+    def find(self, **keys):
+        """Returns list of positions of members matching every secondary index key given, e.g. model='Card'.
+            - Starts from the shortest matching index list and checks the other keys on each candidate's metadata.
+        """
+
+        keys = {index_name: key for index_name, key in keys.items() if key is not None}
+
+        if not keys:
+            return [i for i, entry in enumerate(self.export_data.entries) if entry[3] is not None]
+
+        candidate_lists = sorted(((self.lookup(index_name, key), index_name, ) for index_name, key in keys.items()), key=lambda candidate_list: len(candidate_list[0]))
+        positions, first_index_name = candidate_lists[0]
+        checks = [(SECONDARY_INDEX_KEYS[index_name], keys[index_name], ) for index_name in keys if index_name != first_index_name]
+
+        if not checks:
+            return list(positions)
+
+        entries = self.export_data.entries
+
+        return [i for i in positions if all(get_key(entries[i][3]) == key for get_key, key in checks)]
@@ -0,0 +1,310 @@
+"""SQLite store of the indexes and parsed documents of a Metabase Serialization Export over its memory budget."""
+from collections.abc import Mapping
+import itertools
+import json
+import os
+import pickle
+import shutil
+import sqlite3
+import tempfile
+import threading
+import weakref
+
+
+# Rows buffered by a SpillStore before they are inserted in one batch.
+SPILL_BATCH_SIZE = 10000
+# Bytes of pickled documents buffered by a SpillStore before they are inserted in one batch.
+SPILL_BATCH_BYTES = 4 * 1024 * 1024
+# Size of the SQLite page cache of a SpillStore, in KiB.
+SPILL_PAGE_CACHE_KB = 4 * 1024
+
+# Index kinds of a SpillStore: entity_ids (index_by_id) and data path tuples (data_index_by_path).
+ID_INDEX = 0
+PATH_INDEX = 1
+
+SPILL_STORE_SCHEMA = (
+    # Keys in insertion order by rowid, like the dicts they replace; `i` and `filename` are set for exported entities.
+    'CREATE TABLE index_keys (kind INTEGER NOT NULL, key TEXT NOT NULL, i INTEGER, filename TEXT, PRIMARY KEY (kind, key))',
+    'CREATE TABLE refs (kind INTEGER NOT NULL, key TEXT NOT NULL, entity_model TEXT, relationship TEXT, serdes_meta_id TEXT, member_name TEXT)',
+    'CREATE INDEX refs_by_key ON refs (kind, key)',
+    'CREATE TABLE documents (i INTEGER PRIMARY KEY, data BLOB NOT NULL)',
+)
+
+
+def encode_index_key(key):
+    """Returns the TEXT key of an entity_id, or of a data path tuple as a JSON list.
+        - Serdes/meta ids of database members, in index_by_id keys and references, are data paths too.
+    """
+
+    return json.dumps(key) if isinstance(key, tuple) else key
+
+
+def decode_index_key(key):
+    # Entity ids never start with '['.
+    return tuple(json.loads(key)) if key is not None and key.startswith('[') else key
+
+
+def decode_reference(entity_model, relationship, serdes_meta_id, member_name):
+    return (entity_model, relationship, decode_index_key(serdes_meta_id), member_name, )
+
+
+def remove_spill_store(connection, directory):
+    connection.close()
+    shutil.rmtree(directory, ignore_errors=True)
+
+
+class SpillStore:
+    """Temporary SQLite database of index entries, references, and pickled documents.
+        - Writes are buffered and inserted in batches of SPILL_BATCH_SIZE rows, or SPILL_BATCH_BYTES of documents;
+          reads insert pending rows first.
+        - References are looked up by index kind and key through an index, in the order they were added.
+        - Safe to use from several threads. The database is removed on close or once the store is garbage collected.
+    """
+
+    def __init__(self, directory=None):
+        self.directory = tempfile.mkdtemp(prefix='metabase-serialization-spill-', dir=directory)
+        self.path = os.path.join(self.directory, 'export.sqlite')
+        self.connection = sqlite3.connect(self.path, check_same_thread=False)
+        self.lock = threading.RLock()
+        self.pending_keys = []
+        self.pending_references = []
+        self.pending_documents = []
+        self.pending_document_bytes = 0
+        self.finalizer = weakref.finalize(self, remove_spill_store, self.connection, self.directory)
+
+        # The database is private and temporary: nothing to recover after a crash.
+        self.connection.execute('PRAGMA journal_mode = OFF')
+        self.connection.execute('PRAGMA synchronous = OFF')
+        self.connection.execute(f'PRAGMA cache_size = -{SPILL_PAGE_CACHE_KB}')
+
+        for statement in SPILL_STORE_SCHEMA:
+            self.connection.execute(statement)
+
+    def add_entity(self, kind, key, i=None, filename=None):
+        """Adds key to the index of kind, setting the export position and member name of an exported entity."""
+
+        self.pending_keys.append((kind, encode_index_key(key), i, filename, ))
+
+        if len(self.pending_keys) >= SPILL_BATCH_SIZE:
+            self.flush()
+
+    def add_reference(self, kind, key, reference):
+        """Adds a reference like (entity_model, relationship, serdes_meta_id, member_name,) to key."""
+
+        entity_model, relationship, serdes_meta_id, member_name = reference
+        encoded_key = encode_index_key(key)
+
+        self.pending_keys.append((kind, encoded_key, None, None, ))
+        self.pending_references.append((kind, encoded_key, entity_model, relationship, encode_index_key(serdes_meta_id), member_name, ))
+
+        if len(self.pending_references) >= SPILL_BATCH_SIZE:
+            self.flush()
+
+    def add_document(self, i, file_data):
+        """Adds the parsed document of the member at export_data index i."""
+
+        data = pickle.dumps(file_data, pickle.HIGHEST_PROTOCOL)
+
+        self.pending_documents.append((i, data, ))
+        self.pending_document_bytes += len(data)
+
+        if self.pending_document_bytes >= SPILL_BATCH_BYTES:
+            self.flush()
+
+    def flush(self):
+        """Inserts pending rows in a single transaction."""
+
+        with self.lock:
+            if not (self.pending_keys or self.pending_references or self.pending_documents):
+                return
+
+            with self.connection:
+                # Keys keep the rowid of their first insert, and the entity fields of their last.
+                self.connection.executemany(
+                    'INSERT INTO index_keys (kind, key, i, filename) VALUES (?, ?, ?, ?) '
+                    'ON CONFLICT (kind, key) DO UPDATE SET i = coalesce(excluded.i, i), filename = coalesce(excluded.filename, filename)',
+                    self.pending_keys,
+                )
+                self.connection.executemany('INSERT INTO refs VALUES (?, ?, ?, ?, ?, ?)', self.pending_references)
+                self.connection.executemany('INSERT OR REPLACE INTO documents VALUES (?, ?)', self.pending_documents)
+
+            self.pending_keys = []
+            self.pending_references = []
+            self.pending_documents = []
+            self.pending_document_bytes = 0
+
+    def execute(self, query, parameters=()):
+        """Returns all rows of query, after inserting pending rows."""
+
+        with self.lock:
+            self.flush()
+
+            return self.connection.execute(query, parameters).fetchall()
+
+    def iter_rows(self, query, parameters=()):
+        """Yields rows of query, fetched SPILL_BATCH_SIZE at a time."""
+
+        with self.lock:
+            self.flush()
+            cursor = self.connection.execute(query, parameters)
+
+        while True:
+            with self.lock:
+                rows = cursor.fetchmany(SPILL_BATCH_SIZE)
+
+            if not rows:
+                return
+
+            yield from rows
+
+    def get_entity(self, kind, key):
+        """Returns (i, filename,) of key in the index of kind, None for either if it is only referenced, or None."""
+
+        rows = self.execute('SELECT i, filename FROM index_keys WHERE kind = ? AND key = ?', (kind, encode_index_key(key), ))
+
+        return rows[0] if rows else None
+
+    def get_references(self, kind, key):
+        """Returns list of references to key in the index of kind, in the order they were added."""
+
+        rows = self.execute(
+            'SELECT entity_model, relationship, serdes_meta_id, member_name FROM refs WHERE kind = ? AND key = ? ORDER BY rowid',
+            (kind, encode_index_key(key), ),
+        )
+
+        return [decode_reference(*row) for row in rows]
+
+    def count(self, kind):
+        return self.execute('SELECT count(*) FROM index_keys WHERE kind = ?', (kind, ))[0][0]
+
+    def iter_keys(self, kind):
+        # Scanned in rowid order rather than through the primary key index, so the rows need no sorting.
+        for (key, ) in self.iter_rows('SELECT key FROM index_keys NOT INDEXED WHERE kind = ? ORDER BY rowid', (kind, )):
+            yield decode_index_key(key)
+
+    def iter_entries(self, kind):
+        """Yields (key, i, filename, references,) of every key in the index of kind in a single query.
+            - Keys are scanned in rowid order and their references read through refs_by_key, already in rowid order.
+        """
+
+        rows = self.iter_rows(
+            'SELECT k.rowid, k.key, k.i, k.filename, r.rowid, r.entity_model, r.relationship, r.serdes_meta_id, r.member_name '
+            'FROM index_keys k NOT INDEXED LEFT JOIN refs r ON r.kind = k.kind AND r.key = k.key '
+            'WHERE k.kind = ? ORDER BY k.rowid, r.rowid',
+            (kind, ),
+        )
+
+        for rowid, key_rows in itertools.groupby(rows, key=lambda row: row[0]):
+            first_row = next(key_rows)
+            # Keys without references have a single row of NULL references.
+            references = [] if first_row[4] is None else [decode_reference(*first_row[5:])]
+            references.extend(decode_reference(*row[5:]) for row in key_rows)
+
+            yield (decode_index_key(first_row[1]), first_row[2], first_row[3], references, )
+
+    def get_document(self, i):
+        """Returns (file_data, size,) of the document at export_data index i, size being its pickled size, or None."""
+
+        rows = self.execute('SELECT data FROM documents WHERE i = ?', (i, ))
+
+        return (pickle.loads(rows[0][0]), len(rows[0][0]), ) if rows else None
+
+    def close(self):
+        """Closes and removes the database."""
+
+        with self.lock:
+            self.finalizer()
+
+
+class SpilledIndexEntry(Mapping):
+    """Index entry of a SpilledIndex, like {'i': ..., 'filename': ..., 'references': [...]}.
+        - References are read from the store on first use.
+    """
+
+    __slots__ = ('store', 'kind', 'key', 'fields', )
+
+    def __init__(self, store, kind, key, i, filename, references=None):
+        self.store = store
+        self.kind = kind
+        self.key = key
+        self.fields = {}
+
+        if i is not None:
+            self.fields['i'] = i
+
+        if filename is not None:
+            self.fields['filename'] = filename
+
+        if references is not None:
+            self.fields['references'] = references
+
+    def __getitem__(self, name):
+        if name == 'references' and name not in self.fields:
+            self.fields['references'] = self.store.get_references(self.kind, self.key)
+
+        return self.fields[name]
+
+    def __contains__(self, name):
+        return name == 'references' or name in self.fields
+
+    def __iter__(self):
+        yield from (name for name in self.fields if name != 'references')
+        yield 'references'
+
+    def __len__(self):
+        return len(self.fields) + ('references' not in self.fields)
+
+
+class SpilledIndex(Mapping):
+    """Mapping over the index of kind in a SpillStore, replacing index_by_id or data_index_by_path.
+        - Entries are SpilledIndexEntry mappings read from the store on each lookup, and added with add_entity and
+          add_reference rather than by changing them.
+        - `items` and `values` read every entry and its references in a single query.
+    """
+
+    def __init__(self, store, kind):
+        self.store = store
+        self.kind = kind
+
+    def __getitem__(self, key):
+        entry = self.get(key, None)
+
+        if entry is None:
+            raise KeyError(key)
+
+        return entry
+
+    def get(self, key, default=None):
+        entity = self.store.get_entity(self.kind, key)
+
+        if entity is None:
+            return default
+
+        return SpilledIndexEntry(self.store, self.kind, key, *entity)
+
+    def __contains__(self, key):
+        return self.store.get_entity(self.kind, key) is not None
+
+    def __iter__(self):
+        return self.store.iter_keys(self.kind)
+
+    def __len__(self):
+        return self.store.count(self.kind)
+
+    def items(self):
+        for key, i, filename, references in self.store.iter_entries(self.kind):
+            yield (key, SpilledIndexEntry(self.store, self.kind, key, i, filename, references), )
+
+    def values(self):
+        for key, entry in self.items():
+            yield entry
+
+    def add_entity(self, key, i, filename):
+        """Sets the export position and member name of an exported entity."""
+
+        self.store.add_entity(self.kind, key, i, filename)
+
+    def add_reference(self, key, reference):
+        """Adds a reference like (entity_model, relationship, serdes_meta_id, member_name,) to key."""
+
+        self.store.add_reference(self.kind, key, reference)
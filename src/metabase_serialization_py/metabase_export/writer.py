@@ -0,0 +1,270 @@
+"""Writer for modified Metabase Serialization Exports."""
+import copy
+import gzip
+import logging
+import os
+import shutil
+import tarfile
+import time
+
+from metabase_serialization_py.metabase_export.archive import get_export_format, get_member_file_type, open_serialization_tar_stream, open_serialization_tgz
+from metabase_serialization_py.metabase_export.directory import get_directory_member_info, iter_directory_members, read_directory_file
+from metabase_serialization_py.metabase_export.parallel_gzip import ParallelGzipWriter
+from metabase_serialization_py.yaml import DUMP_BYTES_PER_SECOND, dump_yaml
+
+LOGGER = logging.getLogger(__name__)
+
+
+# Throughput of copying unchanged members to output exports, in bytes per second: per compression thread at gzip level
+# 9 for tgz files, which compress every member, and of file copies for directories.
+TGZ_COPY_BYTES_PER_SECOND = 45_000_000
+DIRECTORY_COPY_BYTES_PER_SECOND = 50_000_000
+
+
+class RawTarReader:
+    """File object over an uncompressed tar stream that keeps the raw bytes read since `buffer_start`.
+        - tarfile reads the stream through `read`; the writer copies raw member blocks with `get`.
+    """
+
+    def __init__(self, fileobj):
+        self.fileobj = fileobj
+        self.buffer = bytearray()
+        self.buffer_start = 0
+        self.position = 0
+
+    def fill(self, end):
+        """Reads from the stream until the buffer holds bytes up to position `end`."""
+
+        while self.buffer_start + len(self.buffer) < end:
+            chunk = self.fileobj.read(max(end - self.buffer_start - len(self.buffer), 1024 * 1024))
+
+            if not chunk:
+                raise tarfile.ReadError('unexpected end of data')
+
+            self.buffer += chunk
+
+    def read(self, size=-1):
+        buffer_end = self.buffer_start + len(self.buffer)
+
+        if self.position >= buffer_end:
+            data = self.fileobj.read(size)
+            self.buffer += data
+        else:
+            offset = self.position - self.buffer_start
+            data = bytes(self.buffer[offset:] if size < 0 else self.buffer[offset:offset + size])
+
+        self.position += len(data)
+
+        return data
+
+    def get(self, start, end):
+        """Returns raw bytes between stream positions start and end."""
+
+        self.fill(end)
+
+        return self.buffer[start - self.buffer_start:end - self.buffer_start]
+
+    def discard(self, end):
+        """Drops buffered bytes before position `end` that tarfile has already read."""
+
+        end = min(end, self.position)
+
+        if end > self.buffer_start:
+            del self.buffer[:end - self.buffer_start]
+            self.buffer_start = end
+
+
+def get_member_block_end(member):
+    """Returns the position after a tar member's data, padded to whole tar blocks."""
+
+    blocks, remainder = divmod(member.size, tarfile.BLOCKSIZE)
+
+    return member.offset_data + (blocks + (1 if remainder else 0)) * tarfile.BLOCKSIZE
+
+
+def get_member_blocks(member, data):
+    """Returns tar header and data blocks for member with its data replaced by `data`."""
+
+    member = copy.copy(member)
+    member.size = len(data)
+    # A pax size header of the original member would override the new size.
+    member.pax_headers = {key: value for key, value in member.pax_headers.items() if key != 'size'}
+
+    header = member.tobuf(tarfile.PAX_FORMAT, 'utf-8', 'surrogateescape')
+    padding = b'\0' * (-len(data) % tarfile.BLOCKSIZE)
+
+    return header + data + padding
+
+
+def create_member_info(member_name):
+    """Returns TarInfo for a new regular file member."""
+
+    member = tarfile.TarInfo(member_name)
+    member.mode = 0o644
+    member.mtime = int(time.time())
+
+    return member
+
+
+def write_tar_members(export_path, write, export_overlay, counts):
+    """Writes the members of the export tarball at export_path, copying members not in export_overlay as their raw
+        header and data blocks, byte for byte.
+    """
+
+    with open_serialization_tar_stream(export_path) as tar_stream:
+        raw_tar_reader = RawTarReader(tar_stream)
+
+        with tarfile.open(fileobj=raw_tar_reader, mode='r|') as tar_file:
+            for member in tar_file:
+                member_end = get_member_block_end(member)
+
+                if member.name in export_overlay.updated:
+                    write(get_member_blocks(member, dump_yaml(export_overlay.updated[member.name])))
+                    counts['updated'] += 1
+                else:
+                    # `member.offset` starts at the member's first header, including pax and GNU long name headers.
+                    write(raw_tar_reader.get(member.offset, member_end))
+                    counts['copied'] += 1
+
+                raw_tar_reader.discard(member_end)
+
+
+def write_directory_members(export_path, write, export_overlay, counts):
+    """Writes the members of the export directory at export_path, with the mode and modification time of their files."""
+
+    for member_name, file_type, path in iter_directory_members(export_path):
+        member = get_directory_member_info(member_name, file_type, path)
+
+        if member_name in export_overlay.updated and file_type == 'file':
+            write(get_member_blocks(member, dump_yaml(export_overlay.updated[member_name])))
+            counts['updated'] += 1
+        else:
+            write(get_member_blocks(member, read_directory_file(path) if file_type == 'file' else b''))
+            counts['copied'] += 1
+
+
+def write_serialization_tar(export_path, output_file, export_overlay):
+    """Writes the export at export_path with the documents of export_overlay to output_file as an uncompressed tar.
+        - Members of export tarballs not in export_overlay are copied as their raw header and data blocks, byte for
+          byte, and members of export directories are archived from their files.
+        - Changed members are re-serialized as YAML and created members are appended at the end of the archive.
+        - Returns dict of counts of copied, updated, and created members and bytes written.
+    """
+
+    counts = {'copied': 0, 'updated': 0, 'created': 0, 'bytes': 0}
+
+    def write(data):
+        output_file.write(data)
+        counts['bytes'] += len(data)
+
+    if get_export_format(export_path) == 'directory':
+        write_directory_members(export_path, write, export_overlay, counts)
+    else:
+        write_tar_members(export_path, write, export_overlay, counts)
+
+    for member_name, file_data in export_overlay.created.items():
+        write(get_member_blocks(create_member_info(member_name), dump_yaml(file_data)))
+        counts['created'] += 1
+
+    # End of archive marker, padded to a whole tar record like tarfile.
+    end_of_archive = b'\0' * (tarfile.BLOCKSIZE * 2)
+    write(end_of_archive + b'\0' * (-(counts['bytes'] + len(end_of_archive)) % tarfile.RECORDSIZE))
+
+    return counts
+
+
+def write_serialization_tgz(export_path, output_tgz_path, export_overlay, compresslevel=9, threads=1):
+    """Writes the export with the documents of export_overlay to a new tgz file, see write_serialization_tar.
+        - `threads` greater than 1 compresses blocks of the output in parallel on that many threads.
+    """
+
+    if threads > 1:
+        output_file = ParallelGzipWriter(output_tgz_path, compresslevel, threads)
+    else:
+        output_file = gzip.open(output_tgz_path, 'wb', compresslevel=compresslevel)
+
+    with output_file:
+        counts = write_serialization_tar(export_path, output_file, export_overlay)
+
+    LOGGER.info(f'Wrote {output_tgz_path}: {counts['copied']} members copied, {counts['updated']} updated, {counts['created']} created.')
+
+    return counts
+
+
+def estimate_write_seconds(serialized_bytes, copied_bytes, output_directory=False, compression_threads=1):
+    """Returns the estimated seconds to write an output export, re-serializing serialized_bytes of documents as YAML
+        and copying copied_bytes of unchanged members.
+        - Estimates are for the slowest compression level; lower levels compress faster.
+    """
+
+    seconds = serialized_bytes / DUMP_BYTES_PER_SECOND
+
+    if output_directory:
+        return seconds + copied_bytes / DIRECTORY_COPY_BYTES_PER_SECOND
+
+    return seconds + (serialized_bytes + copied_bytes) / (TGZ_COPY_BYTES_PER_SECOND * compression_threads)
+
+
+def get_output_member_path(output_directory, member_name):
+    """Returns the path of member_name in output_directory, refusing absolute paths or paths outside of it."""
+
+    output_directory = os.path.realpath(output_directory)
+    member_path = os.path.realpath(os.path.join(output_directory, member_name))
+
+    if os.path.isabs(member_name) or os.path.commonpath((output_directory, member_path, )) != output_directory:
+        raise ValueError(f'Member path is outside of the output directory: {member_name}')
+
+    return member_path
+
+
+def write_member_file(output_directory, member_name, data):
+    """Writes data to member_name in output_directory, creating parent directories."""
+
+    member_path = get_output_member_path(output_directory, member_name)
+
+    os.makedirs(os.path.dirname(member_path), exist_ok=True)
+
+    with open(member_path, 'wb') as member_file:
+        member_file.write(data)
+
+
+def write_serialization_directory(export_path, output_directory, export_overlay):
+    """Writes the export with the documents of export_overlay as an uncompressed directory tree, e.g. for local
+        import testing.
+        - Members not in export_overlay are extracted unchanged with tarfile's 'data' extraction filter, or copied
+          from the files of an export directory.
+        - Returns dict of counts of copied, updated, and created members.
+    """
+
+    counts = {'copied': 0, 'updated': 0, 'created': 0}
+
+    os.makedirs(output_directory, exist_ok=True)
+
+    if get_export_format(export_path) == 'directory':
+        for member_name, file_type, path in iter_directory_members(export_path):
+            if file_type == 'dir':
+                os.makedirs(get_output_member_path(output_directory, member_name), exist_ok=True)
+                counts['copied'] += 1
+            elif member_name in export_overlay.updated:
+                write_member_file(output_directory, member_name, dump_yaml(export_overlay.updated[member_name]))
+                counts['updated'] += 1
+            else:
+                shutil.copyfile(path, get_output_member_path(output_directory, member_name))
+                counts['copied'] += 1
+    else:
+        with open_serialization_tgz(export_path, stream=True) as tar_file:
+            for member in tar_file:
+                if member.name in export_overlay.updated and get_member_file_type(member) == 'file':
+                    write_member_file(output_directory, member.name, dump_yaml(export_overlay.updated[member.name]))
+                    counts['updated'] += 1
+                else:
+                    tar_file.extract(member, output_directory, filter='data')
+                    counts['copied'] += 1
+
+    for member_name, file_data in export_overlay.created.items():
+        write_member_file(output_directory, member_name, dump_yaml(file_data))
+        counts['created'] += 1
+
+    LOGGER.info(f'Wrote {output_directory}: {counts['copied']} members copied, {counts['updated']} updated, {counts['created']} created.')
+
+    return counts
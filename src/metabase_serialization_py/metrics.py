@@ -0,0 +1,123 @@
+"""Phase timers, counters, and memory samples reported for a Metabase Serialization run."""
+from contextlib import contextmanager
+import json
+import threading
+import time
+
+from metabase_serialization_py.memory_usage import get_memory_usage
+from metabase_serialization_py.version import __version__
+
+
+class Metrics:
+    """Collects per-phase timers, per-model counters, and RSS samples.
+        - `phase` times a top level phase like 'load' or 'write' and, if `sample_rss` was set by reset, samples RSS at
+          its start and end.
+        - `add_time` accumulates time spent in a step repeated per member, like 'parse', inside phases.
+        - Metrics may be added from several threads, e.g. by tenant writers or server requests.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.rss_sampler = None
+        self.reset()
+
+    def reset(self, sample_rss=False):
+        """Clears all metrics and restarts the run clock.
+            - `sample_rss` records RSS samples, only needed for a metrics report.
+        """
+
+        with self.lock:
+            self.started = time.perf_counter()
+            self.phases = {}
+            self.counters = {}
+            self.rss_samples = []
+            self.sample_rss_enabled = sample_rss
+
+    def add_time(self, phase, seconds, count=1):
+        """Adds seconds spent in `count` runs of phase."""
+
+        with self.lock:
+            timer = self.phases.get(phase, None)
+
+            if timer is None:
+                timer = self.phases[phase] = {'seconds': 0.0, 'count': 0}
+
+            timer['seconds'] += seconds
+            timer['count'] += count
+
+    @contextmanager
+    def phase(self, phase):
+        """Times the enclosed block as phase, sampling RSS at its boundaries if enabled."""
+
+        self.sample_rss(f'{phase}:start')
+        started = time.perf_counter()
+
+        try:
+            yield
+        finally:
+            self.add_time(phase, time.perf_counter() - started)
+            self.sample_rss(f'{phase}:end')
+
+    def count(self, counter, key, n=1):
+        """Adds n to key of counter, e.g. count('members', 'Card')."""
+
+        with self.lock:
+            counts = self.counters.get(counter, None)
+
+            if counts is None:
+                counts = self.counters[counter] = {}
+
+            counts[key] = counts.get(key, 0) + n
+
+    def sample_rss(self, label):
+        """Records current RSS in MB with label and the time since the run started, if RSS sampling is enabled."""
+
+        if not self.sample_rss_enabled:
+            return
+
+        rss_mb = get_memory_usage()
+
+        with self.lock:
+            self.rss_samples.append({'seconds': time.perf_counter() - self.started, 'label': label, 'rss_mb': rss_mb})
+
+    def start_rss_sampler(self, interval):
+        """Samples RSS every `interval` seconds on a background thread until stop_rss_sampler."""
+
+        stopped = threading.Event()
+
+        def sample():
+            while not stopped.wait(interval):
+                self.sample_rss('interval')
+
+        self.rss_sampler = (threading.Thread(target=sample, daemon=True), stopped, )
+        self.rss_sampler[0].start()
+
+    def stop_rss_sampler(self):
+        if self.rss_sampler is not None:
+            thread, stopped = self.rss_sampler
+            stopped.set()
+            thread.join()
+            self.rss_sampler = None
+
+    def report(self):
+        """Returns metrics as a JSON serializable dict."""
+
+        with self.lock:
+            return {
+                'version': __version__,
+                'wall_seconds': time.perf_counter() - self.started,
+                'phases': {phase: dict(timer) for phase, timer in self.phases.items()},
+                'counters': {counter: dict(counts) for counter, counts in self.counters.items()},
+                'peak_rss_mb': max((sample['rss_mb'] for sample in self.rss_samples), default=None),
+                'rss_samples': list(self.rss_samples),
+            }
+
+    def write_report(self, report_path):
+        """Writes the metrics report as JSON to report_path."""
+
+        with open(report_path, 'w') as report_file:
+            json.dump(self.report(), report_file, indent=2)
+
+
+# Metrics of the current run, collected by the loading, indexing, validation, and writing steps.
+METRICS = Metrics()
@@ -0,0 +1,427 @@
+"""Local HTTP server keeping a Metabase Serialization Export loaded and indexed between change list runs."""
+import contextlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import json
+import logging
+import os
+import shutil
+import socket
+import tempfile
+import threading
+import time
+from urllib.parse import parse_qs, urlsplit
+
+from metabase_serialization_py import get_output_export_path, get_timestamp, process_changes
+from metabase_serialization_py.change_requests import ChangeRequests
+from metabase_serialization_py.metabase_export import DEFAULT_DOCUMENT_CACHE_MB, ExportOverlay, MetabaseExport
+from metabase_serialization_py.yaml import parse_yaml
+
+LOGGER = logging.getLogger(__name__)
+
+
+# Query parameters of GET /members, see MetabaseExport.find_members.
+MEMBER_QUERY_PARAMETERS = ('model', 'collection_id', 'database', 'name', 'slug', 'archived', )
+# Hosts the server may be bound to, and the names requests may address it by, see ExportRequestHandler.check_request.
+LOOPBACK_HOSTS = ('127.0.0.1', 'localhost', '::1', )
+
+
+class ExportGeneration:
+    """Export loaded from a single snapshot of the export file, with the number of requests reading it.
+        - A replaced generation is retired and closed, removing its snapshot, once its last reader is done.
+    """
+
+    def __init__(self, number, metabase_export, snapshot_path):
+        self.number = number
+        self.metabase_export = metabase_export
+        self.snapshot_path = snapshot_path
+        self.readers = 0
+        self.retired = False
+
+    def close(self):
+        self.metabase_export.export_data.close()
+        os.unlink(self.snapshot_path)
+
+
+class ExportServer:
+    """Export loaded once and reloaded when its file changes, shared by concurrent requests.
+        - The export is loaded from a private snapshot of the export file, so lazy reads are never affected by the file
+          being replaced; a changed file is loaded incrementally from the previous snapshot's index cache.
+        - Requests use the export generation current when they start until they are done, see use_export: a reload
+          builds the new export before replacing it, and closes the previous one after its last request.
+        - Applies never change the export, see ExportOverlay, and run one at a time; queries and validations run
+          concurrently with them.
+        - The server writes no metrics report, and never resets METRICS while requests add to it. Its timers and
+          counters are keyed by phase and model, so they do not grow with the number of requests.
+    """
+
+    def __init__(self, export_path, output_path, workers=1, lazy=False, cache_size_mb=DEFAULT_DOCUMENT_CACHE_MB, index_cache_dir=None, memory_budget_mb=None, intern=False):
+        self.export_path = export_path
+        self.output_path = output_path
+        self.workers = workers
+        self.lazy = lazy
+        self.cache_size_mb = cache_size_mb
+        self.index_cache_dir = index_cache_dir
+        self.memory_budget_mb = memory_budget_mb
+        self.intern = intern
+        self.snapshot_directory = tempfile.mkdtemp(prefix='metabase-serialization-serve-')
+        self.apply_lock = threading.Lock()
+        # Guards the current generation and the reader counts of every generation.
+        self.generation_lock = threading.Lock()
+        self.generation = 0
+        self.export_generation = None
+        self.export_stat = None
+        self.loaded_at = None
+
+        self.reload()
+
+    def get_export_stat(self):
+        """Returns (size, modification time,) of the export file."""
+
+        export_stat = os.stat(self.export_path)
+
+        return (export_stat.st_size, export_stat.st_mtime_ns, )
+
+    def take_snapshot(self):
+        """Copies the export file to a new snapshot and returns (snapshot_path, export_stat,), or None if the file
+            changed while being copied.
+        """
+
+        export_stat = self.get_export_stat()
+        snapshot_path = os.path.join(self.snapshot_directory, f'export-{self.generation + 1}.tgz')
+
+        shutil.copyfile(self.export_path, snapshot_path)
+
+        if self.get_export_stat() != export_stat:
+            os.unlink(snapshot_path)
+
+            return None
+
+        return (snapshot_path, export_stat, )
+
+    def reload(self):
+        """Loads the export file, incrementally from the current export's index cache if any, and replaces the current
+            export. Returns False if the file changed while being read.
+        """
+
+        snapshot = self.take_snapshot()
+
+        if snapshot is None:
+            return False
+
+        snapshot_path, export_stat = snapshot
+        previous_generation = self.export_generation
+        previous_export_hash = None if previous_generation is None or self.index_cache_dir is None else previous_generation.metabase_export.export_hash
+        started = time.perf_counter()
+
+        metabase_export = None
+
+        try:
+            metabase_export = MetabaseExport(snapshot_path, self.workers, False, self.lazy, self.cache_size_mb, self.index_cache_dir, previous_export_hash=previous_export_hash, memory_budget_mb=self.memory_budget_mb, intern=self.intern)
+            # Built before serving so the first validation does not pay for them.
+            metabase_export.get_dependency_graph()
+            metabase_export.get_data_path_trie()
+        except BaseException:
+            # The current generation keeps serving from its own snapshot.
+            if metabase_export is not None:
+                metabase_export.export_data.close()
+
+            os.unlink(snapshot_path)
+
+            raise
+
+        with self.generation_lock:
+            self.generation += 1
+            self.export_generation = ExportGeneration(self.generation, metabase_export, snapshot_path)
+            self.export_stat = export_stat
+            self.loaded_at = time.time()
+            closing = previous_generation is not None and self.retire(previous_generation)
+
+        if closing:
+            previous_generation.close()
+
+        LOGGER.info(f'Loaded export generation {self.generation} in {time.perf_counter() - started:.2f}s: {len(metabase_export.export_data)} members.')
+
+        return True
+
+    def watch(self, poll_interval, stopped):
+        """Reloads the export whenever its file changes, until stopped is set.
+            - A change is loaded once the file's size and modification time are the same on two polls in a row.
+        """
+
+        pending_stat = None
+
+        while not stopped.wait(poll_interval):
+            try:
+                export_stat = self.get_export_stat()
+            except OSError:
+                continue
+
+            if export_stat == self.export_stat:
+                pending_stat = None
+            elif export_stat != pending_stat:
+                pending_stat = export_stat
+            else:
+                LOGGER.info(f'Export changed: {self.export_path}')
+
+                try:
+                    self.reload()
+                except Exception:
+                    LOGGER.exception(f'.. Could not reload export: {self.export_path}')
+
+                pending_stat = None
+
+    def retire(self, export_generation):
+        """Marks a replaced generation as retired and returns True if it has no readers left and must be closed.
+            - Called with generation_lock held.
+        """
+
+        export_generation.retired = True
+
+        return export_generation.readers == 0
+
+    @contextlib.contextmanager
+    def use_export(self):
+        """Returns a context manager of the current ExportGeneration, which is not closed by a reload until the
+            block ends.
+        """
+
+        with self.generation_lock:
+            export_generation = self.export_generation
+            export_generation.readers += 1
+
+        try:
+            yield export_generation
+        finally:
+            with self.generation_lock:
+                export_generation.readers -= 1
+                closing = export_generation.retired and export_generation.readers == 0
+
+            if closing:
+                export_generation.close()
+
+    def close(self):
+        with self.generation_lock:
+            export_generation = self.export_generation
+            closing = export_generation is not None and self.retire(export_generation)
+
+        if closing:
+            export_generation.close()
+
+        shutil.rmtree(self.snapshot_directory, ignore_errors=True)
+
+    def get_status(self):
+        with self.use_export() as export_generation:
+            metabase_export = export_generation.metabase_export
+
+            return {
+                'export_path': self.export_path,
+                'generation': export_generation.number,
+                'loaded_at': self.loaded_at,
+                'members': len(metabase_export.export_data),
+                'entities': len(metabase_export.index_by_id),
+                'data_paths': len(metabase_export.data_index_by_path),
+            }
+
+    def find_members(self, query):
+        """Returns list of {member_name, entity_id, model, name,} for GET /members query parameters."""
+
+        keys = {key: query[key] for key in MEMBER_QUERY_PARAMETERS if key in query}
+
+        if 'archived' in keys:
+            keys['archived'] = keys['archived'].lower() == 'true'
+
+        with self.use_export() as export_generation:
+            return [
+                {'member_name': member_name, 'entity_id': metadata['entity_id'], 'model': metadata['serdes/meta.model'], 'name': metadata['name']}
+                for i, member_name, metadata in export_generation.metabase_export.find_members(**keys)
+            ]
+
+    def find_referencing_members(self, query):
+        """Returns list of member names referencing GET /references `entity_id`, optionally of `model`."""
+
+        if 'entity_id' not in query:
+            raise ValueError('Missing entity_id query parameter.')
+
+        with self.use_export() as export_generation:
+            return [member_name for i, member_name, metadata in export_generation.metabase_export.find_referencing_members(query['entity_id'], query.get('model', None))]
+
+    def validate(self, change_list, plan=False):
+        """Validates change_list against the current export, raising ChangeListError, and returns its number of changes
+            and, if `plan`, its changes in order of application and their impact, see ChangeRequests.get_plan and
+            ChangeRequests.get_impact.
+        """
+
+        with self.use_export() as export_generation:
+            metabase_export = export_generation.metabase_export
+            change_requests = ChangeRequests(None, metabase_export, change_list=change_list)
+            result = {'generation': export_generation.number, 'changes': len(change_requests.change_requests)}
+
+            if plan:
+                result['plan'] = change_requests.get_plan(metabase_export)
+                result['impact'] = change_requests.get_impact(metabase_export)
+
+        return result
+
+    def get_output_path(self, output_subdirectory=None):
+        """Returns the directory an apply writes to: the server's output_path, or output_subdirectory inside it.
+            - Raises ValueError for a directory that does not exist or is outside output_path, e.g. through `..`, an
+              absolute path, or a symlink.
+        """
+
+        output_root = os.path.realpath(self.output_path)
+
+        if output_subdirectory is None:
+            return output_root
+
+        output_path = os.path.realpath(os.path.join(output_root, output_subdirectory))
+
+        if os.path.commonpath([output_root, output_path]) != output_root:
+            raise ValueError(f'Output path must be a directory inside the server output path "{self.output_path}", found: "{output_subdirectory}".')
+
+        if not os.path.isdir(output_path):
+            raise ValueError(f'Specified output path not found: "{output_subdirectory}".')
+
+        return output_path
+
+    def apply(self, change_list, query):
+        """Applies change_list to the current export and writes the output export, one apply at a time.
+            - The `output_path` query parameter is a directory inside the server's output_path, see get_output_path.
+        """
+
+        output_path = self.get_output_path(query.get('output_path', None))
+        output_directory = query.get('output_directory', 'false').lower() == 'true'
+
+        with self.apply_lock, self.use_export() as export_generation:
+            metabase_export = export_generation.metabase_export
+            change_requests = ChangeRequests(None, metabase_export, change_list=change_list)
+            export_overlay = ExportOverlay(metabase_export)
+
+            change_requests.apply(metabase_export, export_overlay)
+
+            output_export_path = get_output_export_path(self.export_path, output_path, output_directory, timestamp=get_timestamp())
+            counts = process_changes(metabase_export, export_overlay, output_export_path, output_directory)
+
+        return {'generation': export_generation.number, 'output_export_path': output_export_path, 'counts': counts}
+
+
+class ExportRequestHandler(BaseHTTPRequestHandler):
+    """JSON API of an ExportServer.
+        - GET /status, GET /members?model=..., GET /references?entity_id=...
+        - POST /validate, POST /plan, and POST /apply?output_path=... with a YAML or JSON change list as body.
+        - Invalid requests and change lists answer 400 with `error`, and `errors` for change lists.
+        - Requests from web pages, with an Origin header, and requests addressing another host than the server, like
+          those of a DNS rebinding page, answer 403, see check_request.
+    """
+
+    export_server = None
+    # Host headers of requests to the server, see run_server.
+    allowed_hosts = frozenset()
+
+    def log_message(self, format, *args):
+        LOGGER.info(f'{self.address_string()} {format % args}')
+
+    def send_json(self, status, body):
+        data = json.dumps(body, default=str).encode('utf-8')
+
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def read_change_list(self):
+        length = int(self.headers.get('Content-Length', 0))
+
+        return parse_yaml(self.rfile.read(length).decode('utf-8'))
+
+    def check_request(self):
+        """Returns an error for a request that must be refused, or None."""
+
+        if self.headers.get('Origin', None) is not None:
+            return 'Cross-origin requests are not allowed.'
+
+        if self.headers.get('Host', None) not in self.allowed_hosts:
+            return f'Host not allowed: {self.headers.get("Host", None)}'
+
+        return None
+
+    def handle_request(self, routes):
+        error = self.check_request()
+
+        if error is not None:
+            self.send_json(403, {'error': error})
+
+            return
+
+        url = urlsplit(self.path)
+        query = {key: values[-1] for key, values in parse_qs(url.query).items()}
+        route = routes.get(url.path, None)
+
+        if route is None:
+            self.send_json(404, {'error': f'Not found: {url.path}'})
+
+            return
+
+        try:
+            self.send_json(200, route(query))
+        except ValueError as error:
+            self.send_json(400, {'error': str(error), 'errors': list(getattr(error, 'errors', ()))})
+        except Exception as error:
+            LOGGER.exception(f'.. Could not handle {self.command} {url.path}')
+            self.send_json(500, {'error': str(error)})
+
+    def do_GET(self):
+        export_server = self.export_server
+
+        self.handle_request({
+            '/status': lambda query: export_server.get_status(),
+            '/members': export_server.find_members,
+            '/references': export_server.find_referencing_members,
+        })
+
+    def do_POST(self):
+        export_server = self.export_server
+
+        self.handle_request({
+            '/validate': lambda query: export_server.validate(self.read_change_list()),
+            '/plan': lambda query: export_server.validate(self.read_change_list(), plan=True),
+            '/apply': lambda query: export_server.apply(self.read_change_list(), query),
+        })
+
+
+def get_allowed_hosts(port):
+    """Returns the Host headers of requests to a loopback server on port."""
+
+    names = ('127.0.0.1', 'localhost', '[::1]', )
+
+    return frozenset((*names, *[f'{name}:{port}' for name in names], ) if port == 80 else [f'{name}:{port}' for name in names])
+
+
+def run_server(export_server, host, port, poll_interval):
+    """Serves export_server on host:port until interrupted, reloading the export when its file changes.
+        - Raises ValueError unless host is a loopback host, see LOOPBACK_HOSTS.
+    """
+
+    if host not in LOOPBACK_HOSTS:
+        raise ValueError(f'Serving on {host} is not supported: the API applies change lists and writes files without authentication, serve on one of {", ".join(LOOPBACK_HOSTS)}.')
+
+    server_class = ThreadingHTTPServer if ':' not in host else type('ThreadingHTTPServerV6', (ThreadingHTTPServer, ), {'address_family': socket.AF_INET6})
+    http_server = server_class((host, port), ExportRequestHandler)
+    http_server.RequestHandlerClass = type('BoundExportRequestHandler', (ExportRequestHandler, ), {
+        'export_server': export_server,
+        'allowed_hosts': get_allowed_hosts(http_server.server_address[1]),
+    })
+    stopped = threading.Event()
+    watcher = threading.Thread(target=export_server.watch, args=(poll_interval, stopped, ), daemon=True)
+
+    watcher.start()
+    LOGGER.info(f'Serving {export_server.export_path} on http://{host}:{http_server.server_address[1]}')
+
+    try:
+        http_server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        stopped.set()
+        http_server.server_close()
+        export_server.close()
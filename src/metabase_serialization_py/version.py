@@ -0,0 +1,3 @@
+"""Version of metabase-serialization-py."""
+
+__version__ = '0.1.0'
@@ -1,13 +1,198 @@
 """YAML helper for Metabase Serialization."""
 import yaml
 
+try:
+    from yaml import CSafeDumper, CSafeLoader
+except ImportError:
+    CSafeDumper = None
+    CSafeLoader = None
+
+
+def remove_implicit_resolver(loader_class, first_character):
+    """Removes the implicit resolvers for scalars starting with `first_character` from loader_class only.
+        - Copies the inherited resolver table so yaml.SafeLoader and other loaders are left unchanged.
+    """
+
+    loader_class.yaml_implicit_resolvers = {
+        character: resolvers
+        for character, resolvers in loader_class.yaml_implicit_resolvers.items()
+        if character != first_character
+    }
+
 
 # YAML Loader updates for Metabase YAML
-class Loader(yaml.SafeLoader):
+class PyLoader(yaml.SafeLoader):
     pass
 
 
+# Disables '=' loader
+remove_implicit_resolver(PyLoader, '=')
+
+
+if CSafeLoader is not None:
+    # libyaml scanner/parser with the same SafeConstructor and resolver customizations as PyLoader.
+    class CLoader(CSafeLoader):
+        pass
+
+    remove_implicit_resolver(CLoader, '=')
+else:
+    CLoader = None
+
+
+LIBYAML_AVAILABLE = CLoader is not None
+
+Loader = CLoader if LIBYAML_AVAILABLE else PyLoader
+
+# Throughput of parsing and dumping Metabase YAML documents on one core, in bytes of YAML per second, measured on
+# synthetic exports. Used to estimate the cost of a change list, see ChangeRequests.get_impact.
+PARSE_BYTES_PER_SECOND = 2_400_000 if LIBYAML_AVAILABLE else 330_000
+DUMP_BYTES_PER_SECOND = 2_400_000 if LIBYAML_AVAILABLE else 600_000
+
+
+class StructureInterner:
+    """Table of the strings and sub-structures shared by the documents loaded through it, see get_interning_loader.
+        - Equal strings are shared, and so are sequences of strings and nulls, as tuples, e.g. data paths like
+          `table_id` and `field_ref` paths.
+        - Other sequences and mappings are shared once their contents are, keyed by the identity of their already
+          shared children so each value is hashed once whatever its depth, e.g. identical `result_metadata`.
+        - Shared dicts and lists must not be changed in place, which no document of a MetabaseExport ever is.
+    """
+
+    def __init__(self):
+        self.values = {}
+        self.shared = 0
+
+    def __len__(self):
+        return len(self.values)
+
+    def intern(self, key, value):
+        """Returns the value already interned with key, or interns value."""
+
+        interned = self.values.get(key, None)
+
+        if interned is None:
+            self.values[key] = value
+
+            return value
+
+        self.shared += 1
+
+        return interned
+
+    def get_child_key(self, value):
+        """Returns the key of an interned value inside a sequence or mapping."""
+
+        value_type = type(value)
+
+        if value_type is str or value is None:
+            return value
+
+        if value_type is dict or value_type is list or value_type is tuple:
+            return id(value)
+
+        # Keeps 1, 1.0, and True apart, unlike their equality.
+        return (value_type, value, )
+
+    def intern_sequence(self, items):
+        if all(type(item) is str or item is None for item in items):
+            items = tuple(items)
+
+            return self.intern(items, items)
+
+        try:
+            return self.intern((list, *[self.get_child_key(item) for item in items], ), items)
+        except TypeError:
+            # Unhashable scalars, e.g. sets.
+            return items
+
+    def intern_mapping(self, mapping):
+        try:
+            return self.intern((dict, *[(key, self.get_child_key(value), ) for key, value in mapping.items()], ), mapping)
+        except TypeError:
+            return mapping
+
+    def stats(self):
+        """Returns dict of interning counters."""
+
+        return {'values': len(self.values), 'shared': self.shared}
+
+
+def construct_interned_str(loader, node):
+    value = loader.construct_scalar(node)
+
+    return loader.interner.intern(value, value)
+
+
+def construct_interned_seq(loader, node):
+    # Built in one step rather than through a generator, so the contents are known when the sequence is interned.
+    return loader.interner.intern_sequence(loader.construct_sequence(node))
+
+
+def construct_interned_map(loader, node):
+    mapping = loader.construct_mapping(node)
+
+    if node is loader.root_node:
+        # Documents themselves are not shared.
+        return mapping
+
+    return loader.interner.intern_mapping(mapping)
+
+
+def get_interning_loader(interner, loader_class=Loader):
+    """Returns a subclass of loader_class sharing equal strings and sub-structures of the documents it loads through
+        interner, see StructureInterner.
+        - Sequences of strings and nulls load as tuples; the YAML dumped for the documents is unchanged.
+        - Documents with anchors and aliases are not supported, Metabase YAML has none.
+    """
+
+    class InterningLoader(loader_class):
+        root_node = None
+
+        def construct_document(self, node):
+            self.root_node = node
+
+            return super().construct_document(node)
+
+    InterningLoader.interner = interner
+    InterningLoader.add_constructor('tag:yaml.org,2002:str', construct_interned_str)
+    InterningLoader.add_constructor('tag:yaml.org,2002:seq', construct_interned_seq)
+    InterningLoader.add_constructor('tag:yaml.org,2002:map', construct_interned_map)
+
+    return InterningLoader
+
+
+# YAML Dumper updates for Metabase YAML
+class PyDumper(yaml.SafeDumper):
+    def ignore_aliases(self, data):
+        # Documents may share unchanged objects, Metabase YAML has no anchors or aliases.
+        return True
+
+
+# Tuples of interned documents are dumped as the lists they were loaded from.
+PyDumper.add_representer(tuple, yaml.SafeDumper.represent_list)
+
+
+if CSafeDumper is not None:
+    # libyaml emitter with the same SafeRepresenter customizations as PyDumper.
+    class CDumper(CSafeDumper):
+        def ignore_aliases(self, data):
+            return True
+
+    CDumper.add_representer(tuple, yaml.SafeDumper.represent_list)
+else:
+    CDumper = None
+
+
+Dumper = CDumper if LIBYAML_AVAILABLE else PyDumper
+
+
 def parse_yaml(file_object, Loader=Loader):
     """Return parsed YAML as dict from a file_object."""
 
     return yaml.load(file_object, Loader=Loader)
+
+
+def dump_yaml(data, Dumper=Dumper):
+    """Return YAML as bytes for data, keeping key order like Metabase Serialization exports."""
+
+    return yaml.dump(data, Dumper=Dumper, encoding='utf-8', allow_unicode=True, default_flow_style=False, sort_keys=False)
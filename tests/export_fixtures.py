@@ -0,0 +1,237 @@
+"""Small Metabase Serialization Export written by the tests, with known entity_ids.
+
+The export has two databases with the same tables, three collections, four cards, and a dashboard:
+    - Collection A, with Collection B inside it, and Collection C, all in the root collection
+    - ORDERS_CARD in A and WAREHOUSE_CARD in C query the ORDERS tables of Sample and Warehouse
+    - PRODUCTS_CARD in B joins Sample PRODUCTS to ORDERS, DERIVED_CARD in B is based on ORDERS_CARD
+    - DASHBOARD in B shows PRODUCTS_CARD, linking to DERIVED_CARD
+"""
+import io
+import json
+import os
+import tarfile
+
+from metabase_serialization_py.yaml import dump_yaml
+
+
+EXPORT_ROOT = 'metabase_data'
+SCHEMA = 'PUBLIC'
+DATABASES = ('Sample', 'Warehouse', )
+# Fields of each table, with the table whose ID they are a foreign key to.
+TABLE_FIELDS = {
+    'ORDERS': (('ID', None, ), ('TOTAL', None, ), ('PRODUCT_ID', 'PRODUCTS', ), ),
+    'PRODUCTS': (('ID', None, ), ('TITLE', None, ), ),
+}
+# Modification time of every archive member, so rewritten exports only differ in the members that changed.
+MEMBER_MTIME = 1704067200
+
+
+def get_entity_id(name):
+    """Returns a 21 character entity_id starting with name, like Metabase NanoIDs."""
+
+    return name.ljust(21, '0')
+
+
+def get_slug(entity_id):
+    return entity_id.rstrip('0').lower()
+
+
+COLLECTION_A = get_entity_id('CollectionA')
+COLLECTION_B = get_entity_id('CollectionB')
+COLLECTION_C = get_entity_id('CollectionC')
+ORDERS_CARD = get_entity_id('OrdersCard')
+PRODUCTS_CARD = get_entity_id('ProductsCard')
+DERIVED_CARD = get_entity_id('DerivedCard')
+WAREHOUSE_CARD = get_entity_id('WarehouseCard')
+DASHBOARD = get_entity_id('Dashboard')
+DASHCARD = get_entity_id('Dashcard')
+
+
+def get_table_path(database, table):
+    return [database, SCHEMA, table]
+
+
+def get_field_clause(database, table, field, options=None):
+    return ['field', [*get_table_path(database, table), field], options]
+
+
+def get_collection_directory(*entity_ids):
+    return '/'.join([f'{EXPORT_ROOT}/collections', *[f'{entity_id}_{get_slug(entity_id)}' for entity_id in entity_ids]])
+
+
+def make_collection(entity_id, parent_id):
+    slug = get_slug(entity_id)
+
+    return (f'{get_collection_directory(*([parent_id] if parent_id else []), entity_id)}/{entity_id}_{slug}.yaml', {
+        'name': entity_id.rstrip('0'),
+        'description': None,
+        'entity_id': entity_id,
+        'slug': slug,
+        'archived': False,
+        'parent_id': parent_id,
+        'serdes/meta': [{'model': 'Collection', 'id': entity_id, 'label': slug}],
+    }, )
+
+
+def make_card(entity_id, collection_directory, collection_id, database, query, source_card_id=None, visualization_settings=None):
+    slug = get_slug(entity_id)
+    table_id = query['source-table'] if isinstance(query['source-table'], list) else None
+
+    return (f'{collection_directory}/cards/{entity_id}_{slug}.yaml', {
+        'name': entity_id.rstrip('0'),
+        'description': None,
+        'entity_id': entity_id,
+        'archived': False,
+        'collection_id': collection_id,
+        'database_id': database,
+        'table_id': table_id,
+        'source_card_id': source_card_id,
+        'type': 'question',
+        'dataset_query': {'database': database, 'type': 'query', 'query': query},
+        'visualization_settings': visualization_settings or {},
+        'serdes/meta': [{'model': 'Card', 'id': entity_id, 'label': slug}],
+    }, )
+
+
+def iter_export_members():
+    """Returns an iterator of (member_name, document,) of the export's files in archive order."""
+
+    for database in DATABASES:
+        database_directory = f'{EXPORT_ROOT}/databases/{database}'
+
+        yield (f'{database_directory}/{database}.yaml', {
+            'name': database,
+            'engine': 'postgres',
+            'serdes/meta': [{'model': 'Database', 'id': database}],
+        }, )
+
+        for table, fields in TABLE_FIELDS.items():
+            table_directory = f'{database_directory}/schemas/{SCHEMA}/tables/{table}'
+            table_meta = [{'model': 'Database', 'id': database}, {'model': 'Schema', 'id': SCHEMA}, {'model': 'Table', 'id': table}]
+
+            yield (f'{table_directory}/{table}.yaml', {
+                'name': table,
+                'active': True,
+                'schema': SCHEMA,
+                'db_id': database,
+                'serdes/meta': table_meta,
+            }, )
+
+            for field, target_table in fields:
+                yield (f'{table_directory}/fields/{field}.yaml', {
+                    'name': field,
+                    'active': True,
+                    'table_id': get_table_path(database, table),
+                    'fk_target_field_id': None if target_table is None else [*get_table_path(database, target_table), 'ID'],
+                    'serdes/meta': [*table_meta, {'model': 'Field', 'id': field}],
+                }, )
+
+    yield make_collection(COLLECTION_A, None)
+    yield make_collection(COLLECTION_B, COLLECTION_A)
+    yield make_collection(COLLECTION_C, None)
+
+    total_reference = json.dumps(['ref', get_field_clause('Sample', 'ORDERS', 'TOTAL')], separators=(',', ':', ))
+
+    yield make_card(ORDERS_CARD, get_collection_directory(COLLECTION_A), COLLECTION_A, 'Sample', {
+        'source-table': get_table_path('Sample', 'ORDERS'),
+        'filter': ['>', get_field_clause('Sample', 'ORDERS', 'TOTAL'), 10],
+        'aggregation': [['sum', get_field_clause('Sample', 'ORDERS', 'TOTAL')]],
+    }, visualization_settings={'column_settings': {total_reference: {'column_title': 'Total'}}})
+    yield make_card(PRODUCTS_CARD, get_collection_directory(COLLECTION_A, COLLECTION_B), COLLECTION_B, 'Sample', {
+        'source-table': get_table_path('Sample', 'PRODUCTS'),
+        'joins': [{
+            'alias': 'Orders',
+            'source-table': get_table_path('Sample', 'ORDERS'),
+            'condition': ['=', get_field_clause('Sample', 'PRODUCTS', 'ID'), get_field_clause('Sample', 'ORDERS', 'PRODUCT_ID', {'join-alias': 'Orders'})],
+        }],
+    })
+    yield make_card(DERIVED_CARD, get_collection_directory(COLLECTION_A, COLLECTION_B), COLLECTION_B, 'Sample', {
+        'source-table': ORDERS_CARD,
+    }, source_card_id=ORDERS_CARD)
+    yield make_card(WAREHOUSE_CARD, get_collection_directory(COLLECTION_C), COLLECTION_C, 'Warehouse', {
+        'source-table': get_table_path('Warehouse', 'ORDERS'),
+    })
+
+    yield (f'{get_collection_directory(COLLECTION_A, COLLECTION_B)}/dashboards/{DASHBOARD}_dashboard.yaml', {
+        'name': 'Dashboard',
+        'description': None,
+        'entity_id': DASHBOARD,
+        'archived': False,
+        'collection_id': COLLECTION_B,
+        'parameters': [{'id': 'title', 'name': 'Title', 'slug': 'title', 'type': 'string/='}],
+        'dashcards': [{
+            'entity_id': DASHCARD,
+            'card_id': PRODUCTS_CARD,
+            'parameter_mappings': [{
+                'card_id': PRODUCTS_CARD,
+                'parameter_id': 'title',
+                'target': ['dimension', get_field_clause('Sample', 'PRODUCTS', 'TITLE')],
+            }],
+            'visualization_settings': {
+                'click_behavior': {'type': 'link', 'linkType': 'question', 'targetId': DERIVED_CARD, 'parameterMapping': {}},
+            },
+        }],
+        'serdes/meta': [{'model': 'Dashboard', 'id': DASHBOARD, 'label': 'dashboard'}],
+    }, )
+
+    yield (f'{EXPORT_ROOT}/settings.yaml', {'site-name': 'Tests'}, )
+
+
+def iter_archive_members(members):
+    """Returns an iterator of (member_name, raw_data,) with a None raw_data member before the files of each directory."""
+
+    directories = set()
+
+    for member_name, document in members:
+        parts = member_name.split('/')
+
+        for k in range(1, len(parts)):
+            directory = '/'.join(parts[:k])
+
+            if directory not in directories:
+                directories.add(directory)
+
+                yield (directory, None, )
+
+        yield (member_name, dump_yaml(document), )
+
+
+def write_export_tgz(export_path, members=None):
+    """Writes members, or the members of the test export, to a tgz file like a Metabase export."""
+
+    with tarfile.open(export_path, 'w:gz') as tar_file:
+        for member_name, raw_data in iter_archive_members(iter_export_members() if members is None else members):
+            member = tarfile.TarInfo(member_name)
+            member.mtime = MEMBER_MTIME
+
+            if raw_data is None:
+                member.type = tarfile.DIRTYPE
+                member.mode = 0o755
+                tar_file.addfile(member)
+            else:
+                member.size = len(raw_data)
+                member.mode = 0o644
+                tar_file.addfile(member, io.BytesIO(raw_data))
+
+    return export_path
+
+
+def write_export_directory(directory_path, members=None):
+    """Writes members, or the members of the test export, as files under directory_path."""
+
+    for member_name, raw_data in iter_archive_members(iter_export_members() if members is None else members):
+        path = os.path.join(directory_path, *member_name.split('/'))
+
+        if raw_data is None:
+            os.makedirs(path, exist_ok=True)
+        else:
+            with open(path, 'wb') as member_file:
+                member_file.write(raw_data)
+
+    return directory_path
+
+
+def get_index_entries(index):
+    """Returns dict of (i, filename, references,) by key of an index_by_id or data_index_by_path, for comparisons."""
+
+    return {key: (entry.get('i', None), entry.get('filename', None), list(entry['references']), ) for key, entry in index.items()}
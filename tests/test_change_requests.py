@@ -0,0 +1,240 @@
+"""Tests of validating and applying change lists with metabase_serialization_py.change_requests."""
+import os
+import tempfile
+import unittest
+
+from metabase_serialization_py.change_requests import ChangeListError, ChangeRequests
+from metabase_serialization_py.metabase_export import EditPlan, ExportOverlay, MetabaseExport
+from metabase_serialization_py.metabase_export.clone import get_document_references
+
+from tests.export_fixtures import (
+    COLLECTION_A,
+    COLLECTION_B,
+    COLLECTION_C,
+    DASHBOARD,
+    DASHCARD,
+    DERIVED_CARD,
+    ORDERS_CARD,
+    PRODUCTS_CARD,
+    WAREHOUSE_CARD,
+    write_export_directory,
+    write_export_tgz,
+)
+
+
+def get_data_paths(document):
+    """Returns set of the data paths a document references."""
+
+    return {reference_key for index, reference_key, relationship in get_document_references(document) if index != 'id'}
+
+
+class TestEditPlan(unittest.TestCase):
+    def test_merged_edits(self):
+        edit_plan = EditPlan('card.yaml')
+        edit_plan.add_changes(1, {'name': 'New name', 'visualization_settings': {'graph.metrics': ['sum']}})
+        edit_plan.add_changes(2, {'visualization_settings': {'graph.dimensions': ['CREATED_AT']}, 'name': 'New name'})
+        document = {'name': 'Old name', 'visualization_settings': {'graph.metrics': ['count'], 'table.pivot': False}}
+
+        self.assertEqual(edit_plan.conflicts, [])
+        self.assertEqual(edit_plan.apply(document), {'name': 'New name', 'visualization_settings': {'graph.metrics': ['sum'], 'table.pivot': False, 'graph.dimensions': ['CREATED_AT']}})
+        self.assertEqual(document['name'], 'Old name')
+
+    def test_conflicts(self):
+        """Edits of the same path to different values, or of a path and a path inside it, conflict."""
+
+        edit_plan = EditPlan('card.yaml')
+        edit_plan.add_changes(1, {'name': 'One', 'dataset_query': {'database': 'Sample'}})
+        edit_plan.add_changes(2, {'name': 'Two'})
+        edit_plan.add_changes(3, {'dataset_query': None})
+
+        self.assertEqual([(path, tuple(sorted(changes)), ) for path, changes in edit_plan.conflicts], [('name', (1, 2, ), ), ('dataset_query', (1, 3, ), )])
+
+    def test_replacement_conflicts_with_other_changes(self):
+        edit_plan = EditPlan('card.yaml')
+        edit_plan.add_changes(1, {'name': 'One'})
+        edit_plan.set_replacement(2, 'source.yaml')
+
+        self.assertEqual(edit_plan.conflicts, [('', (1, 2, ), )])
+
+
+class ExportTestCase(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.metabase_export = MetabaseExport(write_export_tgz(os.path.join(self.directory.name, 'export.tgz')))
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def apply(self, changes, metabase_export=None):
+        """Applies a change list of changes and returns the ExportOverlay with its documents."""
+
+        metabase_export = self.metabase_export if metabase_export is None else metabase_export
+        export_overlay = ExportOverlay(metabase_export)
+        ChangeRequests(None, metabase_export, change_list={'changes': changes}).apply(metabase_export, export_overlay)
+
+        return export_overlay
+
+    def get_document(self, export_overlay, entity_id):
+        return export_overlay.get_file_data(self.metabase_export.index_by_id[entity_id]['filename'])
+
+    def assertInvalid(self, changes, message):
+        with self.assertRaises(ChangeListError) as context:
+            ChangeRequests(None, self.metabase_export, change_list={'changes': changes})
+
+        self.assertTrue(any(message in error for error in context.exception.errors), context.exception.errors)
+
+
+class TestScheduling(ExportTestCase):
+    def test_changes_are_sorted_by_precedence(self):
+        """A copy reading a changed entity comes after the change, whatever their order in the change list."""
+
+        change_requests = ChangeRequests(None, self.metabase_export, change_list={'changes': [
+            {'create': {'source': {'entity_id': COLLECTION_B}, 'changes': {'collection_id': COLLECTION_C}}},
+            {'update': {'target': {'entity_id': ORDERS_CARD}, 'changes': {'name': 'Changed'}}},
+        ]})
+
+        self.assertEqual([next(iter(change_request)) for change_request in change_requests.change_requests], ['update', 'create'])
+        self.assertEqual(change_requests.change_numbers, [2, 1])
+
+    def test_dependency_cycle(self):
+        """Replacements of two cards by each other cannot be ordered, and are named by their change numbers."""
+
+        with self.assertRaises(ChangeListError) as context:
+            ChangeRequests(None, self.metabase_export, change_list={'changes': [
+                {'update': {'target': {'entity_id': WAREHOUSE_CARD}, 'changes': {'name': 'Changed'}}},
+                {'replace': {'target': {'entity_id': PRODUCTS_CARD}, 'source': {'entity_id': DERIVED_CARD}}},
+                {'replace': {'target': {'entity_id': DERIVED_CARD}, 'source': {'entity_id': PRODUCTS_CARD}}},
+            ]})
+
+        self.assertEqual(context.exception.errors, ('Changes 2, 3 cannot be ordered: they read entities changed by each other.', ))
+
+
+
+class TestRemap(ExportTestCase):
+    def test_remap(self):
+        export_overlay = self.apply([{'remap': {'source': {'data_path': 'Sample'}, 'target': {'data_path': 'Warehouse'}}}])
+
+        self.assertEqual(set(export_overlay.updated), {self.metabase_export.index_by_id[entity_id]['filename'] for entity_id in (ORDERS_CARD, PRODUCTS_CARD, DERIVED_CARD, DASHBOARD, )})
+
+        for member_name, document in export_overlay.updated.items():
+            self.assertEqual({data_path[0] for data_path in get_data_paths(document)}, {'Warehouse'}, member_name)
+
+        self.assertEqual(self.get_document(export_overlay, ORDERS_CARD)['dataset_query']['database'], 'Warehouse')
+
+    def test_remap_table(self):
+        export_overlay = self.apply([{'remap': {'source': {'data_path': ['Sample', 'PUBLIC', 'PRODUCTS']}, 'target': {'data_path': ['Warehouse', 'PUBLIC', 'PRODUCTS']}}}])
+        document = self.get_document(export_overlay, PRODUCTS_CARD)
+
+        self.assertEqual(document['dataset_query']['query']['source-table'], ['Warehouse', 'PUBLIC', 'PRODUCTS'])
+        # References to other tables of the database are kept.
+        self.assertEqual(document['dataset_query']['query']['joins'][0]['source-table'], ['Sample', 'PUBLIC', 'ORDERS'])
+
+    def test_remap_after_replace(self):
+        """A remap rewrites the references a document was given by an earlier replace of the same change list."""
+
+        export_overlay = self.apply([
+            {'remap': {'source': {'data_path': 'Warehouse'}, 'target': {'data_path': 'Sample'}}},
+            {'replace': {'target': {'entity_id': ORDERS_CARD}, 'source': {'entity_id': WAREHOUSE_CARD}}},
+        ])
+
+        self.assertEqual({data_path[0] for data_path in get_data_paths(self.get_document(export_overlay, ORDERS_CARD))}, {'Sample'})
+        self.assertEqual({data_path[0] for data_path in get_data_paths(self.get_document(export_overlay, WAREHOUSE_CARD))}, {'Sample'})
+
+
+
+class TestValidation(ExportTestCase):
+    def test_invalid_change_requests(self):
+        """Malformed change requests are reported together, none raising another error than ChangeListError."""
+
+        invalid_changes = {
+            'expected replace clauses': [{'replace': 'oops'}],
+            'expected mappings for update clauses: target': [{'update': {'target': ORDERS_CARD}}],
+            'target entity not found in export': [{'update': {'target': {'entity_id': ['a', 'list']}}}],
+            'expected a single action': [{'delete': {'target': {'entity_id': ORDERS_CARD}}}],
+            'unsupported update clauses: source': [{'update': {'target': {'entity_id': ORDERS_CARD}, 'source': {'entity_id': ORDERS_CARD}}}],
+            'remap data paths must have the same length': [{'remap': {'source': {'data_path': 'Sample'}, 'target': {'data_path': ['Warehouse', 'PUBLIC']}}}],
+        }
+
+        for message, changes in invalid_changes.items():
+            with self.subTest(message=message):
+                self.assertInvalid(changes, message)
+
+    def test_replace_needs_the_same_model(self):
+        self.assertInvalid([{'replace': {'target': {'entity_id': ORDERS_CARD}, 'source': {'entity_id': COLLECTION_C}}}], 'is a Collection, not a Card')
+
+    def test_conflicting_edits(self):
+        with self.assertRaisesRegex(ChangeListError, 'conflicting edits'):
+            ChangeRequests(None, self.metabase_export, change_list={'changes': [
+                {'update': {'target': {'entity_id': ORDERS_CARD}, 'changes': {'name': 'One'}}},
+                {'update': {'target': {'entity_id': ORDERS_CARD}, 'changes': {'name': 'Two'}}},
+            ]})
+
+
+class TestReplace(ExportTestCase):
+    def test_replace(self):
+        export_overlay = self.apply([{'replace': {'target': {'entity_id': ORDERS_CARD}, 'source': {'entity_id': WAREHOUSE_CARD}}}])
+        document = self.get_document(export_overlay, ORDERS_CARD)
+
+        self.assertEqual(document['entity_id'], ORDERS_CARD)
+        self.assertEqual(document['collection_id'], COLLECTION_A)
+        self.assertEqual(document['dataset_query']['query']['source-table'], ['Warehouse', 'PUBLIC', 'ORDERS'])
+
+
+
+class TestClone(ExportTestCase):
+    def test_clone_collection(self):
+        """Copies of a collection's contents reference each other's copies and keep their other references."""
+
+        export_overlay = self.apply([{'create': {'source': {'entity_id': COLLECTION_B}, 'changes': {'collection_id': COLLECTION_C, 'name': 'Copy'}}}])
+        created = {document['entity_id']: (member_name, document, ) for member_name, document in export_overlay.created.items()}
+        new_entity_ids = {document['name']: entity_id for entity_id, (member_name, document) in created.items()}
+        collection_copy = created[new_entity_ids['Copy']][1]
+        dashboard_copy = created[new_entity_ids['Dashboard']][1]
+        derived_copy = created[new_entity_ids['DerivedCard']][1]
+
+        self.assertEqual(len(created), 4)
+        self.assertFalse(set(created) & set(self.metabase_export.index_by_id))
+        self.assertEqual(collection_copy['parent_id'], COLLECTION_C)
+        self.assertEqual({document['collection_id'] for entity_id, (member_name, document) in created.items() if entity_id != new_entity_ids['Copy']}, {new_entity_ids['Copy']})
+        self.assertEqual(dashboard_copy['dashcards'][0]['card_id'], new_entity_ids['ProductsCard'])
+        self.assertEqual(dashboard_copy['dashcards'][0]['visualization_settings']['click_behavior']['targetId'], new_entity_ids['DerivedCard'])
+        self.assertNotEqual(dashboard_copy['dashcards'][0]['entity_id'], DASHCARD)
+        # ORDERS_CARD is in collection A and is not copied.
+        self.assertEqual(derived_copy['source_card_id'], ORDERS_CARD)
+
+        for entity_id, (member_name, document) in created.items():
+            self.assertTrue(member_name.startswith(f'metabase_data/collections/{COLLECTION_C}_collectionc/{new_entity_ids["Copy"]}_collectionb/'), member_name)
+            self.assertIn(entity_id, member_name)
+
+        # The source documents are unchanged.
+        self.assertEqual(self.get_document(export_overlay, DASHBOARD)['dashcards'][0]['card_id'], PRODUCTS_CARD)
+
+    def test_clone_to_another_database(self):
+        export_overlay = self.apply([{'create': {'source': {'entity_id': ORDERS_CARD}, 'changes': {'database_id': 'Warehouse', 'collection_id': COLLECTION_C}}}])
+        member_name, document = next(iter(export_overlay.created.items()))
+
+        self.assertEqual(document['database_id'], 'Warehouse')
+        self.assertEqual({data_path[0] for data_path in get_data_paths(document)}, {'Warehouse'})
+        self.assertIn('["Warehouse","PUBLIC","ORDERS","TOTAL"]', next(iter(document['visualization_settings']['column_settings'])))
+
+    def test_clone_into_root_collection(self):
+        """Copies into the root collection go to the collections directory of the export, with or without a root
+            directory in member names.
+        """
+
+        export_directory = write_export_directory(os.path.join(self.directory.name, 'directory'))
+        exports = {
+            'metabase_data/': self.metabase_export,
+            '': MetabaseExport(os.path.join(export_directory, 'metabase_data')),
+        }
+
+        for root_directory, metabase_export in exports.items():
+            with self.subTest(root_directory=root_directory):
+                export_overlay = self.apply([{'create': {'source': {'entity_id': DERIVED_CARD}, 'changes': {'collection_id': None}}}], metabase_export)
+                member_name, document = next(iter(export_overlay.created.items()))
+
+                self.assertEqual(member_name, f'{root_directory}collections/cards/{document["entity_id"]}_derivedcard.yaml')
+                self.assertIsNone(document['collection_id'])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,101 @@
+"""Tests of metabase_serialization_py.metabase_export.dependency_graph."""
+import unittest
+
+from metabase_serialization_py.metabase_export.dependency_graph import CycleError, DependencyGraph, topological_sort
+
+
+def make_index(entities, references):
+    """Returns index_by_id of entities, a dict of member_name by entity_id, with references as (entity_id, relationship,
+        referenced_entity_id,).
+    """
+
+    index_by_id = {entity_id: {'filename': member_name, 'references': []} for entity_id, member_name in entities.items()}
+
+    for entity_id, relationship, referenced_entity_id in references:
+        index_by_id.setdefault(referenced_entity_id, {'references': []})['references'].append(('Card', relationship, entity_id, entities.get(entity_id, None), ))
+
+    return index_by_id
+
+
+class TestTopologicalSort(unittest.TestCase):
+    def test_predecessors_first(self):
+        order = topological_sort(['c', 'b', 'a'], {'c': ['b'], 'b': ['a']})
+
+        self.assertEqual(order, ['a', 'b', 'c'])
+
+    def test_order_key_and_input_order(self):
+        """Ready nodes are taken by order_key, then in input order; predecessors outside nodes are ignored."""
+
+        self.assertEqual(topological_sort(['x', 'y', 'z'], {'x': ['outside']}), ['x', 'y', 'z'])
+        self.assertEqual(topological_sort(['x', 'y', 'z'], {}, {'x': 2, 'y': 1, 'z': 1}.get), ['y', 'z', 'x'])
+        self.assertEqual(topological_sort(['x', 'y', 'z'], {'y': ['z']}, {'x': 0, 'y': 0, 'z': 1}.get), ['x', 'z', 'y'])
+
+    def test_self_reference_is_not_a_cycle(self):
+        self.assertEqual(topological_sort(['a', 'b'], {'a': ['a'], 'b': ['a']}), ['a', 'b'])
+
+    def test_cycle(self):
+        """Nodes in cycles, and the nodes after them, are reported in input order."""
+
+        with self.assertRaisesRegex(CycleError, 'Cycle between: a, b, d') as context:
+            topological_sort(['a', 'b', 'c', 'd'], {'a': ['b'], 'b': ['a'], 'c': [], 'd': ['b']})
+
+        self.assertEqual(context.exception.nodes, ('a', 'b', 'd', ))
+
+
+class TestDependencyGraph(unittest.TestCase):
+    def setUp(self):
+        # a -> b -> c -> b, c -> d; e is in collection f and references a.
+        entities = {node: f'{node}.yaml' for node in 'abcdef'}
+        references = [
+            ('a', 'source_card_id', 'b'),
+            ('b', 'source_card_id', 'c'),
+            ('c', 'source_card_id', 'b'),
+            ('c', 'table_id', 'd'),
+            ('e', 'source_card_id', 'a'),
+            ('e', 'collection_id', 'f'),
+        ]
+
+        self.dependency_graph = DependencyGraph(make_index(entities, references), {})
+
+    def test_strongly_connected_components(self):
+        """Components are found once each, dependencies before their dependents."""
+
+        components = self.dependency_graph.find_strongly_connected_components()
+        positions = {node: position for position, component in enumerate(components) for node in component}
+
+        self.assertEqual(sorted(sorted(component) for component in components), [['a'], ['b', 'c'], ['d'], ['e'], ['f']])
+
+        for node, dependencies in self.dependency_graph.dependencies.items():
+            for dependency in dependencies:
+                self.assertLessEqual(positions[dependency], positions[node])
+
+        self.assertEqual(sorted(sorted(cycle) for cycle in self.dependency_graph.find_cycles()), [['b', 'c']])
+
+    def test_closure(self):
+        self.assertEqual(self.dependency_graph.get_closure('a'), frozenset('abcd'))
+        self.assertEqual(self.dependency_graph.get_closure('c'), frozenset('bcd'))
+        self.assertEqual(self.dependency_graph.get_closure('d'), frozenset('d'))
+        self.assertEqual(self.dependency_graph.get_closure('unknown'), frozenset(('unknown', )))
+
+    def test_containment_is_not_a_dependency(self):
+        """Cards do not depend on their collection, and collections are copied with their contents."""
+
+        self.assertNotIn('f', self.dependency_graph.get_closure('e'))
+        self.assertEqual(self.dependency_graph.get_contents_closure('f'), ['f', 'e'])
+        self.assertEqual(self.dependency_graph.get_copy_closure('f'), frozenset('abcdef'))
+
+    def test_topological_order(self):
+        order = self.dependency_graph.topological_order(list('edcbaf'))
+
+        self.assertLess(order.index('d'), order.index('c'))
+        self.assertLess(order.index('b'), order.index('a'))
+        self.assertLess(order.index('a'), order.index('e'))
+
+    def test_database_data_paths_are_keyed_by_name(self):
+        dependency_graph = DependencyGraph({'a': {'filename': 'a.yaml', 'references': []}}, {('Sample', ): {'references': [('Card', 'database_id', 'a', 'a.yaml', )]}})
+
+        self.assertEqual(dependency_graph.get_dependencies('a'), ('Sample', ))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,252 @@
+"""Tests of loading and indexing exports with metabase_serialization_py.metabase_export.MetabaseExport."""
+import gzip
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+from metabase_serialization_py.metabase_export import MemberFilter, MetabaseExport
+from metabase_serialization_py.metabase_export.member_filter import get_root_directory
+from metabase_serialization_py.yaml import dump_yaml
+
+from tests.export_fixtures import (
+    COLLECTION_B,
+    DERIVED_CARD,
+    ORDERS_CARD,
+    PRODUCTS_CARD,
+    WAREHOUSE_CARD,
+    get_index_entries,
+    iter_export_members,
+    write_export_directory,
+    write_export_tgz,
+)
+
+try:
+    # Only needed for zstd-compressed exports.
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+def get_indexes(metabase_export):
+    return (get_index_entries(metabase_export.index_by_id), get_index_entries(metabase_export.data_index_by_path), )
+
+
+def get_unordered_indexes(metabase_export):
+    """Returns the indexes of metabase_export without member positions or reference order, e.g. for export directories
+        listed in another order than the archive.
+    """
+
+    return tuple(
+        {key: (filename, sorted(references), ) for key, (i, filename, references) in index_entries.items()}
+        for index_entries in get_indexes(metabase_export)
+    )
+
+
+class TestLoaders(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.export_path = write_export_tgz(os.path.join(self.directory.name, 'export.tgz'))
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def assertIndexesLikeEagerLoad(self, metabase_export):
+        """Asserts metabase_export has the indexes and members of a plain eager load, reference order included."""
+
+        eager_export = MetabaseExport(self.export_path)
+
+        self.assertEqual(get_indexes(metabase_export), get_indexes(eager_export))
+        self.assertEqual(metabase_export.export_data.entries, eager_export.export_data.entries)
+
+    def test_workers(self):
+        # Batches small enough for the export to be parsed by the worker processes, not in-process.
+        with mock.patch('metabase_serialization_py.metabase_export.PARALLEL_LOAD_BATCH_SIZE', 4):
+            self.assertIndexesLikeEagerLoad(MetabaseExport(self.export_path, workers=2))
+
+    def test_stream(self):
+        self.assertIndexesLikeEagerLoad(MetabaseExport(self.export_path, stream=True))
+
+    def test_lazy(self):
+        """Lazy exports index like eager ones, and re-read every document even when the cache only keeps one."""
+
+        metabase_export = MetabaseExport(self.export_path, lazy=True, cache_size_mb=0)
+        eager_export = MetabaseExport(self.export_path)
+
+        self.assertIndexesLikeEagerLoad(metabase_export)
+
+        for i in range(len(eager_export.export_data)):
+            self.assertEqual(metabase_export.export_data.get_file_data(i), eager_export.export_data.get_file_data(i))
+
+        self.assertLessEqual(metabase_export.get_document_cache_stats()['documents'], 1)
+
+    def test_index_cache_round_trip(self):
+        """A second load of the same export reads its indexes from the cache, and indexes like an eager load."""
+
+        index_cache_dir = os.path.join(self.directory.name, 'cache')
+        MetabaseExport(self.export_path, index_cache_dir=index_cache_dir)
+
+        with self.assertLogs('metabase_serialization_py.metabase_export', 'INFO') as logs:
+            metabase_export = MetabaseExport(self.export_path, index_cache_dir=index_cache_dir)
+
+        self.assertTrue(any('from cache' in message for message in logs.output), logs.output)
+        self.assertIndexesLikeEagerLoad(metabase_export)
+        self.assertEqual(metabase_export.export_data.get_file_data(0), MetabaseExport(self.export_path).export_data.get_file_data(0))
+
+    def test_member_digests(self):
+        """Member locations have a content hash only in exports saved to the index cache, for incremental loads."""
+
+        metabase_export = MetabaseExport(self.export_path)
+        cached_export = MetabaseExport(self.export_path, index_cache_dir=os.path.join(self.directory.name, 'cache'))
+        locations = [location for location in metabase_export.export_data.locations if location is not None]
+        cached_locations = [location for location in cached_export.export_data.locations if location is not None]
+
+        self.assertTrue(locations)
+        self.assertEqual([location[2] for location in locations], [None] * len(locations))
+        self.assertEqual([location[:2] for location in cached_locations], [location[:2] for location in locations])
+        self.assertNotIn(None, [location[2] for location in cached_locations])
+
+    def test_intern(self):
+        """Interned loads index like eager ones, and their members, with tuples for sequences of strings, dump the same
+            YAML.
+        """
+
+        metabase_export = MetabaseExport(self.export_path, intern=True)
+        eager_export = MetabaseExport(self.export_path)
+
+        self.assertEqual(get_indexes(metabase_export), get_indexes(eager_export))
+        self.assertEqual(len(metabase_export.export_data), len(eager_export.export_data))
+
+        for member, eager_member in zip(metabase_export.export_data, eager_export.export_data):
+            self.assertEqual(dump_yaml(list(member)), dump_yaml(list(eager_member)), member[0])
+
+    def write_export_tar(self):
+        tar_path = os.path.join(self.directory.name, 'export.tar')
+
+        with gzip.open(self.export_path, 'rb') as export_file, open(tar_path, 'wb') as tar_file:
+            shutil.copyfileobj(export_file, tar_file)
+
+        return tar_path
+
+    def test_tar(self):
+        self.export_path = self.write_export_tar()
+
+        self.assertIndexesLikeEagerLoad(MetabaseExport(self.export_path, lazy=True))
+
+    @unittest.skipIf(zstandard is None, 'zstandard is not available')
+    def test_zstd(self):
+        tar_path = self.write_export_tar()
+        self.export_path = os.path.join(self.directory.name, 'export.tar.zst')
+
+        with open(tar_path, 'rb') as tar_file, open(self.export_path, 'wb') as export_file:
+            zstandard.ZstdCompressor().copy_stream(tar_file, export_file)
+
+        self.assertIndexesLikeEagerLoad(MetabaseExport(self.export_path, lazy=True))
+
+    def test_directory(self):
+        """Export directories index like the archive they were extracted from, whatever the order of their listing."""
+
+        export_directory = write_export_directory(os.path.join(self.directory.name, 'directory'))
+        file_export = MetabaseExport(self.export_path)
+
+        for mode, options in {'eager': {}, 'lazy': {'lazy': True}, 'workers': {'workers': 2}}.items():
+            with self.subTest(mode=mode):
+                metabase_export = MetabaseExport(export_directory, **options)
+
+                self.assertEqual(get_unordered_indexes(metabase_export), get_unordered_indexes(file_export))
+                self.assertEqual(sorted(metabase_export.export_data.entries), sorted(file_export.export_data.entries))
+                self.assertEqual(metabase_export.export_data.get_file_data(metabase_export.index_by_id[ORDERS_CARD]['i']), file_export.export_data.get_file_data(file_export.index_by_id[ORDERS_CARD]['i']))
+
+    def test_incremental_load_matches_full_load(self):
+        """Re-indexing only the changed members of an export gives the indexes of loading it from scratch."""
+
+        index_cache_dir = os.path.join(self.directory.name, 'cache')
+        MetabaseExport(self.export_path, index_cache_dir=index_cache_dir)
+
+        members = []
+
+        for member_name, document in iter_export_members():
+            if document.get('entity_id', None) == WAREHOUSE_CARD:
+                # Removed member.
+                continue
+
+            if document.get('entity_id', None) == DERIVED_CARD:
+                # Changed member, now based on another card.
+                document = {**document, 'source_card_id': PRODUCTS_CARD, 'dataset_query': {**document['dataset_query'], 'query': {'source-table': PRODUCTS_CARD}}}
+
+            members.append((member_name, document, ))
+
+        # Added member.
+        added_member_name, added_document = next((member_name, document, ) for member_name, document in iter_export_members() if document.get('entity_id', None) == ORDERS_CARD)
+        members.append((added_member_name.replace(ORDERS_CARD, 'AddedCard000000000000'), {**added_document, 'entity_id': 'AddedCard000000000000', 'serdes/meta': [{'model': 'Card', 'id': 'AddedCard000000000000'}]}, ))
+
+        new_export_path = write_export_tgz(os.path.join(self.directory.name, 'new_export.tgz'), members)
+
+        # A missing previous index cache would fall back to a full load with a warning.
+        with self.assertNoLogs('metabase_serialization_py.metabase_export', 'WARNING'):
+            incremental_export = MetabaseExport(new_export_path, index_cache_dir=index_cache_dir, previous_export_path=self.export_path)
+
+        full_export = MetabaseExport(new_export_path)
+
+        self.assertEqual(get_indexes(incremental_export), get_indexes(full_export))
+        self.assertEqual(incremental_export.export_data.entries, full_export.export_data.entries)
+        self.assertNotIn('filename', incremental_export.index_by_id.get(WAREHOUSE_CARD, {}))
+
+    def test_member_without_id_is_indexed_by_generated_id(self):
+        """A member without serdes/meta.id is indexed, and references others, by an id generated from its name."""
+
+        member_name = 'metabase_data/collections/cards/no_id.yaml'
+        members = [*iter_export_members(), (member_name, {'name': 'No id', 'source_card_id': ORDERS_CARD, 'serdes/meta': [{'model': 'Card'}]}, )]
+        metabase_export = MetabaseExport(write_export_tgz(os.path.join(self.directory.name, 'no_id.tgz'), members))
+        generated_ids = [entity_id for entity_id, entry in metabase_export.index_by_id.items() if entry.get('filename', None) == member_name]
+
+        self.assertEqual(len(generated_ids), 1)
+        self.assertTrue(generated_ids[0].startswith('mb_'))
+        self.assertIn(('Card', 'source_card_id', generated_ids[0], member_name, ), list(metabase_export.index_by_id[ORDERS_CARD]['references']))
+
+
+class TestMemberFilter(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.export_path = write_export_tgz(os.path.join(self.directory.name, 'export.tgz'))
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_collection_filter_loads_referenced_database_members(self):
+        """A collection filter loads the collection's subtree and the tables and fields it references, and nothing else."""
+
+        metabase_export = MetabaseExport(self.export_path, member_filter=MemberFilter(collections=[COLLECTION_B]))
+        member_names = {entry[0] for entry in metabase_export.export_data.entries if entry[2] == 'file'}
+
+        for entity_id in (COLLECTION_B, PRODUCTS_CARD, DERIVED_CARD, ):
+            self.assertIn('filename', metabase_export.index_by_id[entity_id])
+
+        for entity_id in (ORDERS_CARD, WAREHOUSE_CARD, ):
+            self.assertNotIn('filename', metabase_export.index_by_id.get(entity_id, {}))
+
+        self.assertIn('metabase_data/databases/Sample/schemas/PUBLIC/tables/PRODUCTS/fields/TITLE.yaml', member_names)
+        self.assertIn('metabase_data/databases/Sample/schemas/PUBLIC/tables/ORDERS/fields/PRODUCT_ID.yaml', member_names)
+        self.assertFalse([member_name for member_name in member_names if '/Warehouse/' in member_name])
+
+    def test_filtered_indexes_are_a_subset(self):
+        full_references = get_index_entries(MetabaseExport(self.export_path).index_by_id)
+        filtered_export = MetabaseExport(self.export_path, member_filter=MemberFilter(models=['Card']))
+
+        for entity_id, (i, filename, references) in get_index_entries(filtered_export.index_by_id).items():
+            self.assertTrue(set(references) <= set(full_references[entity_id][2]))
+
+    def test_unknown_model(self):
+        with self.assertRaises(ValueError):
+            MemberFilter(models=['Question'])
+
+    def test_root_directory(self):
+        self.assertEqual(get_root_directory('metabase_data/collections/cards/card.yaml'), 'metabase_data/')
+        self.assertEqual(get_root_directory('collections/cards/card.yaml'), '')
+        self.assertEqual(get_root_directory('export/metabase_data/databases/Sample/Sample.yaml'), 'export/metabase_data/')
+        self.assertIsNone(get_root_directory('settings.yaml'))
+
+
+if __name__ == '__main__':
+    unittest.main()
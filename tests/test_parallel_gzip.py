@@ -0,0 +1,57 @@
+"""Tests of metabase_serialization_py.metabase_export.parallel_gzip."""
+import gzip
+import os
+import random
+import tempfile
+import unittest
+
+from metabase_serialization_py.metabase_export.parallel_gzip import PARALLEL_GZIP_DICTIONARY_SIZE, ParallelGzipWriter
+
+
+class TestParallelGzipWriter(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def write(self, chunks, threads, block_size):
+        """Writes chunks with a ParallelGzipWriter and returns the path of the gzip file."""
+
+        path = os.path.join(self.directory.name, f'output-{threads}-{block_size}.gz')
+
+        with ParallelGzipWriter(path, compresslevel=6, threads=threads, block_size=block_size) as output_file:
+            for chunk in chunks:
+                output_file.write(chunk)
+
+        return path
+
+    def test_round_trip(self):
+        """Any gzip reader reads back the data written, whatever the number of threads and blocks."""
+
+        generator = random.Random(0)
+        # Repetitive text, like YAML, compresses with references back into the previous block.
+        text = b''.join(f'- name: Card {generator.randrange(100)}\n  collection_id: {generator.randrange(10)}\n'.encode() for k in range(20000))
+        noise = generator.randbytes(3 * PARALLEL_GZIP_DICTIONARY_SIZE)
+        data = text + noise + text[:1000]
+        chunks = [data[start:start + 7919] for start in range(0, len(data), 7919)]
+
+        for threads in (1, 4, ):
+            for block_size in (1024, 64 * 1024, len(data), ):
+                with self.subTest(threads=threads, block_size=block_size):
+                    with gzip.open(self.write(chunks, threads, block_size), 'rb') as input_file:
+                        self.assertEqual(input_file.read(), data)
+
+    def test_empty(self):
+        with gzip.open(self.write([], 4, 1024), 'rb') as input_file:
+            self.assertEqual(input_file.read(), b'')
+
+    def test_blocks_of_exactly_block_size(self):
+        data = bytes(range(256)) * 16
+
+        with gzip.open(self.write([data], 4, 1024), 'rb') as input_file:
+            self.assertEqual(input_file.read(), data)
+
+
+if __name__ == '__main__':
+    unittest.main()
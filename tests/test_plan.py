@@ -0,0 +1,97 @@
+"""Tests of planning change lists with ChangeRequests.get_plan, ChangeRequests.get_impact and metabase_serialization_py.plan."""
+import json
+import os
+import tempfile
+import unittest
+
+from metabase_serialization_py import plan
+from metabase_serialization_py.change_requests import ChangeRequests
+from metabase_serialization_py.metabase_export import MetabaseExport
+from metabase_serialization_py.yaml import dump_yaml
+
+from tests.export_fixtures import COLLECTION_B, COLLECTION_C, ORDERS_CARD, PRODUCTS_CARD, WAREHOUSE_CARD, write_export_tgz
+
+# Listed out of order: the copy of COLLECTION_B reads the cards updated, replaced, and remapped by the later changes.
+PLAN_CHANGE_LIST = {'changes': [
+    {'create': {'source': {'entity_id': COLLECTION_B}, 'changes': {'collection_id': COLLECTION_C}}},
+    {'update': {'target': {'entity_id': ORDERS_CARD}, 'changes': {'archived': True}}},
+    {'replace': {'target': {'entity_id': PRODUCTS_CARD}, 'source': {'entity_id': WAREHOUSE_CARD}, 'changes': {'name': 'DerivedCard'}}},
+    {'remap': {'source': {'data_path': 'Warehouse'}, 'target': {'data_path': 'Sample'}}},
+]}
+
+PLAN_STEPS = [
+    {'change': 2, 'action': 'update', 'target': ORDERS_CARD, 'files': 1, 'depends_on': 1},
+    {'change': 3, 'action': 'replace', 'target': PRODUCTS_CARD, 'source': WAREHOUSE_CARD, 'files': 1, 'depends_on': 3},
+    {'change': 4, 'action': 'remap', 'source': ['Warehouse'], 'target': ['Sample'], 'files': 2, 'depends_on': 0},
+    {'change': 1, 'action': 'create', 'source': COLLECTION_B, 'files': 4, 'depends_on': 12},
+]
+
+PLAN_MEMBERS = {
+    'rewritten': {'Card': 2},
+    'archived': {'Card': 1},
+    'created': {'Collection': 1, 'Card': 2, 'Dashboard': 1},
+    'referencing': {'Card': 1, 'Dashboard': 1},
+}
+
+PLAN_COLLISIONS = [
+    {'change': 3, 'action': 'replace', 'model': 'Card', 'collection_id': COLLECTION_B, 'name': 'DerivedCard'},
+]
+
+
+class TestPlan(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.export_path = write_export_tgz(os.path.join(self.directory.name, 'export.tgz'))
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_plan_and_impact(self):
+        """Changes are planned in order of application, and planning reads no documents."""
+
+        metabase_export = MetabaseExport(self.export_path, lazy=True)
+
+        try:
+            change_requests = ChangeRequests(None, metabase_export, change_list=PLAN_CHANGE_LIST)
+
+            self.assertEqual(change_requests.get_plan(metabase_export), PLAN_STEPS)
+
+            impact = change_requests.get_impact(metabase_export)
+
+            self.assertEqual(impact['changes'], 4)
+            self.assertEqual(impact['members'], PLAN_MEMBERS)
+            self.assertEqual(impact['collisions'], PLAN_COLLISIONS)
+            self.assertGreater(impact['bytes']['read'], 0)
+            self.assertGreater(impact['bytes']['passed_through'], 0)
+            self.assertEqual(metabase_export.export_data.document_cache.stats()['misses'], 0)
+        finally:
+            metabase_export.export_data.close()
+
+    def test_plan_report(self):
+        change_list_path = os.path.join(self.directory.name, 'change_list.yaml')
+        report_path = os.path.join(self.directory.name, 'plan.json')
+
+        with open(change_list_path, 'wb') as change_list_file:
+            change_list_file.write(dump_yaml(PLAN_CHANGE_LIST))
+
+        plan(self.export_path, change_list_path, index_cache=False, report=report_path)
+
+        with open(report_path) as report_file:
+            report = json.load(report_file)
+
+        self.assertEqual(report['plan'], PLAN_STEPS)
+        self.assertEqual(report['impact']['members'], PLAN_MEMBERS)
+        self.assertEqual(report['impact']['collisions'], PLAN_COLLISIONS)
+
+    def test_invalid_change_list_exits(self):
+        change_list_path = os.path.join(self.directory.name, 'change_list.yaml')
+
+        with open(change_list_path, 'wb') as change_list_file:
+            change_list_file.write(dump_yaml({'changes': [{'update': {'target': {'entity_id': 'missing'}}}]}))
+
+        with self.assertRaises(SystemExit):
+            plan(self.export_path, change_list_path, index_cache=False)
+
+
+if __name__ == '__main__':
+    unittest.main()
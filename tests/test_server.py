@@ -0,0 +1,162 @@
+"""Tests of the export server API with metabase_serialization_py.server."""
+from http.client import HTTPConnection
+from http.server import ThreadingHTTPServer
+import json
+import os
+import tempfile
+import threading
+import unittest
+from unittest import mock
+
+from metabase_serialization_py.metabase_export import MetabaseExport
+from metabase_serialization_py.metrics import METRICS
+from metabase_serialization_py.server import ExportRequestHandler, ExportServer, get_allowed_hosts, run_server
+
+from tests.export_fixtures import ORDERS_CARD, WAREHOUSE_CARD, write_export_tgz
+
+
+class TestExportServer(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.output_path = os.path.join(self.directory.name, 'output')
+        os.makedirs(os.path.join(self.output_path, 'subdirectory'))
+        self.export_server = ExportServer(write_export_tgz(os.path.join(self.directory.name, 'export.tgz')), self.output_path)
+
+    def tearDown(self):
+        self.export_server.close()
+        self.directory.cleanup()
+
+    def test_output_path(self):
+        """Applies write inside the server output path only."""
+
+        output_root = os.path.realpath(self.output_path)
+        os.symlink(self.directory.name, os.path.join(self.output_path, 'link'))
+
+        self.assertEqual(self.export_server.get_output_path(), output_root)
+        self.assertEqual(self.export_server.get_output_path('subdirectory'), os.path.join(output_root, 'subdirectory'))
+
+        for output_subdirectory in ('..', 'subdirectory/../..', self.directory.name, 'link', 'missing', ):
+            with self.subTest(output_subdirectory=output_subdirectory):
+                with self.assertRaises(ValueError):
+                    self.export_server.get_output_path(output_subdirectory)
+
+    def test_reload(self):
+        generation = self.export_server.get_status()['generation']
+
+        with self.export_server.use_export() as export_generation:
+            write_export_tgz(self.export_server.export_path)
+            self.export_server.reload()
+
+            # The replaced generation is kept until its last reader is done.
+            self.assertTrue(export_generation.retired)
+            self.assertTrue(os.path.exists(export_generation.snapshot_path))
+
+        self.assertFalse(os.path.exists(export_generation.snapshot_path))
+        self.assertEqual(self.export_server.get_status()['generation'], generation + 1)
+
+    def test_failed_reload(self):
+        """A reload that fails keeps the current generation and removes the snapshot it took."""
+
+        snapshot_paths = os.listdir(self.export_server.snapshot_directory)
+        write_export_tgz(self.export_server.export_path)
+
+        with mock.patch.object(MetabaseExport, 'get_data_path_trie', side_effect=RuntimeError('failed')):
+            with self.assertRaises(RuntimeError):
+                self.export_server.reload()
+
+        self.assertEqual(os.listdir(self.export_server.snapshot_directory), snapshot_paths)
+        self.assertEqual(self.export_server.get_status()['generation'], 1)
+
+    def test_run_server_refuses_other_hosts(self):
+        for host in ('0.0.0.0', '192.168.1.2', '::', ):
+            with self.subTest(host=host):
+                with self.assertRaises(ValueError):
+                    run_server(self.export_server, host, 0, 1)
+
+
+class TestExportRequestHandler(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.export_server = ExportServer(write_export_tgz(os.path.join(self.directory.name, 'export.tgz')), self.directory.name)
+        self.http_server = ThreadingHTTPServer(('127.0.0.1', 0), ExportRequestHandler)
+        self.port = self.http_server.server_address[1]
+        self.http_server.RequestHandlerClass = type('BoundExportRequestHandler', (ExportRequestHandler, ), {
+            'export_server': self.export_server,
+            'allowed_hosts': get_allowed_hosts(self.port),
+        })
+        self.thread = threading.Thread(target=self.http_server.serve_forever, daemon=True)
+        self.thread.start()
+
+    def tearDown(self):
+        self.http_server.shutdown()
+        self.http_server.server_close()
+        self.thread.join()
+        self.export_server.close()
+        self.directory.cleanup()
+
+    def request(self, method, path, body=None, headers=None):
+        """Returns (status, decoded JSON body,) of a request to the server."""
+
+        connection = HTTPConnection('127.0.0.1', self.port, timeout=10)
+
+        try:
+            connection.request(method, path, body=None if body is None else json.dumps(body), headers=headers or {})
+            response = connection.getresponse()
+
+            return (response.status, json.loads(response.read()), )
+        finally:
+            connection.close()
+
+    def test_queries(self):
+        status, body = self.request('GET', '/status')
+
+        self.assertEqual(status, 200)
+        self.assertEqual(body['generation'], 1)
+
+        status, body = self.request('GET', '/members?model=Card&database=Warehouse')
+
+        self.assertEqual(status, 200)
+        self.assertEqual([member['entity_id'] for member in body], [WAREHOUSE_CARD])
+
+        self.assertEqual(self.request('GET', '/references')[0], 400)
+        self.assertEqual(self.request('GET', '/missing')[0], 404)
+
+    def test_requests_keep_metrics(self):
+        """Requests never reset the process-wide metrics, which other requests and reloads add to concurrently."""
+
+        METRICS.count('test_server', 'before')
+        self.request('GET', '/status')
+
+        self.assertEqual(METRICS.report()['counters']['test_server'], {'before': 1})
+
+    def test_validate_and_apply(self):
+        change_list = {'changes': [{'update': {'target': {'entity_id': ORDERS_CARD}, 'changes': {'name': 'Renamed'}}}]}
+
+        status, body = self.request('POST', '/validate', change_list)
+
+        self.assertEqual((status, body['changes'], ), (200, 1, ))
+
+        status, body = self.request('POST', '/validate', {'changes': [{'update': {'target': {'entity_id': 'missing'}}}]})
+
+        self.assertEqual(status, 400)
+        self.assertTrue(body['errors'])
+
+        status, body = self.request('POST', '/apply', change_list)
+
+        self.assertEqual(status, 200)
+        self.assertEqual(body['counts']['updated'], 1)
+        self.assertTrue(os.path.exists(body['output_export_path']))
+
+        self.assertEqual(self.request('POST', '/apply?output_path=..', change_list)[0], 400)
+
+    def test_foreign_requests_are_refused(self):
+        """Requests from web pages and requests to other host names, e.g. after DNS rebinding, answer 403."""
+
+        self.assertEqual(self.request('GET', '/status', headers={'Origin': 'http://example.com'})[0], 403)
+        self.assertEqual(self.request('GET', '/status', headers={'Host': f'example.com:{self.port}'})[0], 403)
+        self.assertEqual(self.request('POST', '/apply', {'changes': []}, headers={'Host': 'example.com'})[0], 403)
+        self.assertEqual(self.request('GET', '/status', headers={'Host': f'localhost:{self.port}'})[0], 200)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,85 @@
+"""Tests of metabase_serialization_py.metabase_export.spill_store."""
+import os
+import tempfile
+import unittest
+
+from metabase_serialization_py.metabase_export import MetabaseExport
+from metabase_serialization_py.metabase_export.spill_store import ID_INDEX, PATH_INDEX, SpilledIndex, SpillStore
+
+from tests.export_fixtures import ORDERS_CARD, get_index_entries, write_export_tgz
+
+
+class TestSpillStore(unittest.TestCase):
+    def setUp(self):
+        self.spill_store = SpillStore()
+
+    def tearDown(self):
+        self.spill_store.close()
+
+    def test_index_round_trip(self):
+        """Spilled indexes read back like the dicts they replace: keys in insertion order, references in order."""
+
+        index_by_id = SpilledIndex(self.spill_store, ID_INDEX)
+        data_index_by_path = SpilledIndex(self.spill_store, PATH_INDEX)
+
+        index_by_id.add_reference('card', ('Card', 'source_card_id', 'other', 'other.yaml', ))
+        index_by_id.add_entity('card', 3, 'card.yaml')
+        index_by_id.add_entity('other', 4, 'other.yaml')
+        data_index_by_path.add_reference(('Sample', 'PUBLIC', 'ORDERS', ), ('Card', 'table_id', 'card', 'card.yaml', ))
+        data_index_by_path.add_reference(('Sample', ), ('Table', 'db_id', ('Sample', 'PUBLIC', 'ORDERS', ), 'ORDERS.yaml', ))
+        data_index_by_path.add_reference(('Sample', 'PUBLIC', 'ORDERS', ), ('Card', 'table_id', 'other', 'other.yaml', ))
+
+        self.assertEqual(list(index_by_id), ['card', 'other'])
+        self.assertEqual(dict(index_by_id['card']), {'i': 3, 'filename': 'card.yaml', 'references': [('Card', 'source_card_id', 'other', 'other.yaml', )]})
+        self.assertEqual(list(data_index_by_path), [('Sample', 'PUBLIC', 'ORDERS', ), ('Sample', )])
+        self.assertEqual(data_index_by_path[('Sample', 'PUBLIC', 'ORDERS', )]['references'], [('Card', 'table_id', 'card', 'card.yaml', ), ('Card', 'table_id', 'other', 'other.yaml', )])
+        # Serdes/meta ids of database members are data paths in references too.
+        self.assertEqual(data_index_by_path[('Sample', )]['references'], [('Table', 'db_id', ('Sample', 'PUBLIC', 'ORDERS', ), 'ORDERS.yaml', )])
+        self.assertEqual(get_index_entries(dict(data_index_by_path.items())), get_index_entries({key: data_index_by_path[key] for key in data_index_by_path}))
+        self.assertNotIn('missing', index_by_id)
+        self.assertIsNone(index_by_id.get('missing', None))
+        self.assertEqual(len(data_index_by_path), 2)
+
+    def test_documents(self):
+        document = {'name': 'Card', 'dataset_query': {'query': {'source-table': ['Sample', 'PUBLIC', 'ORDERS']}}}
+
+        self.spill_store.add_document(7, document)
+
+        self.assertEqual(self.spill_store.get_document(7)[0], document)
+        self.assertIsNone(self.spill_store.get_document(8))
+
+    def test_close_removes_database(self):
+        spill_store = SpillStore()
+        spill_store.add_document(0, {})
+        spill_store.flush()
+
+        self.assertTrue(os.path.exists(spill_store.path))
+
+        spill_store.close()
+
+        self.assertFalse(os.path.exists(spill_store.directory))
+
+
+class TestSpilledExport(unittest.TestCase):
+    def test_spilled_export_indexes_like_eager_load(self):
+        """An export spilled over its memory budget has the indexes and documents of one kept in memory."""
+
+        with tempfile.TemporaryDirectory() as directory:
+            export_path = write_export_tgz(os.path.join(directory, 'export.tgz'))
+            metabase_export = MetabaseExport(export_path, memory_budget_mb=0)
+            eager_export = MetabaseExport(export_path)
+
+            self.assertIsNotNone(metabase_export.spill_store)
+            self.assertIsInstance(metabase_export.index_by_id, SpilledIndex)
+            self.assertEqual(get_index_entries(metabase_export.index_by_id), get_index_entries(eager_export.index_by_id))
+            self.assertEqual(get_index_entries(metabase_export.data_index_by_path), get_index_entries(eager_export.data_index_by_path))
+            self.assertEqual(metabase_export.export_data.get_file_data(metabase_export.index_by_id[ORDERS_CARD]['i'])['entity_id'], ORDERS_CARD)
+
+            for i in range(len(eager_export.export_data)):
+                self.assertEqual(metabase_export.export_data.get_file_data(i), eager_export.export_data.get_file_data(i))
+
+            metabase_export.export_data.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
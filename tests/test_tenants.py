@@ -0,0 +1,99 @@
+"""Tests of tenant fan-out with metabase_serialization_py.process_tenant_changes."""
+import os
+import tempfile
+import unittest
+
+from metabase_serialization_py import load_tenant_bindings, process_tenant_changes
+from metabase_serialization_py.change_requests import bind_parameters
+from metabase_serialization_py.metabase_export import MetabaseExport
+from metabase_serialization_py.yaml import dump_yaml
+
+from tests.export_fixtures import COLLECTION_C, ORDERS_CARD, get_index_entries, write_export_tgz
+
+# Copy of ORDERS_CARD for each tenant, in the tenant's database.
+TENANT_CHANGE_LIST = {'changes': [
+    {'create': {'source': {'entity_id': ORDERS_CARD}, 'changes': {'name': 'Orders of ${name}', 'database_id': '${database}', 'collection_id': COLLECTION_C}}},
+]}
+
+
+class TestTenants(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.export_path = write_export_tgz(os.path.join(self.directory.name, 'export.tgz'))
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def write_file(self, name, document):
+        path = os.path.join(self.directory.name, name)
+
+        with open(path, 'wb') as output_file:
+            output_file.write(dump_yaml(document))
+
+        return path
+
+    def test_fan_out(self):
+        """Each tenant's output export has its own copy, and the shared export is left unchanged."""
+
+        metabase_export = MetabaseExport(self.export_path)
+        indexes = (get_index_entries(metabase_export.index_by_id), get_index_entries(metabase_export.data_index_by_path), )
+        documents = [metabase_export.export_data.get_file_data(i) for i in range(len(metabase_export.export_data))]
+        tenant_bindings = load_tenant_bindings(self.write_file('tenants.yaml', {'tenants': [
+            {'name': 'acme', 'database': 'Warehouse'},
+            {'name': 'globex', 'database': 'Sample'},
+        ]}))
+        output_path = os.path.join(self.directory.name, 'output')
+        os.makedirs(output_path)
+
+        process_tenant_changes(metabase_export, self.write_file('change_list.yaml', TENANT_CHANGE_LIST), tenant_bindings, self.export_path, output_path, tenant_workers=2, timestamp='20240101000000')
+
+        self.assertEqual(sorted(os.listdir(output_path)), ['export-acme-20240101000000.tgz', 'export-globex-20240101000000.tgz'])
+
+        for tenant_name, database in (('acme', 'Warehouse', ), ('globex', 'Sample', ), ):
+            with self.subTest(tenant_name=tenant_name):
+                output_export = MetabaseExport(os.path.join(output_path, f'export-{tenant_name}-20240101000000.tgz'))
+                copies = [metadata for member_name, parsing_message, file_type, metadata, file_data in output_export.export_data if metadata is not None and metadata['name'].startswith('Orders of ')]
+
+                self.assertEqual(len(output_export.export_data), len(metabase_export.export_data) + 1)
+                self.assertEqual([metadata['name'] for metadata in copies], [f'Orders of {tenant_name}'])
+                self.assertEqual(output_export.export_data.get_file_data(output_export.index_by_id[copies[0]['entity_id']]['i'])['database_id'], database)
+
+        self.assertEqual((get_index_entries(metabase_export.index_by_id), get_index_entries(metabase_export.data_index_by_path), ), indexes)
+        self.assertEqual([metabase_export.export_data.get_file_data(i) for i in range(len(metabase_export.export_data))], documents)
+
+    def test_invalid_tenant_change_list(self):
+        """Tenant change lists are all validated before any output export is written."""
+
+        metabase_export = MetabaseExport(self.export_path)
+        output_path = os.path.join(self.directory.name, 'output')
+        os.makedirs(output_path)
+        tenant_bindings = [{'name': 'acme', 'database': 'Warehouse'}, {'name': 'initech'}]
+
+        with self.assertRaisesRegex(ValueError, 'Tenant "initech"'):
+            process_tenant_changes(metabase_export, self.write_file('change_list.yaml', TENANT_CHANGE_LIST), tenant_bindings, self.export_path, output_path)
+
+        self.assertEqual(os.listdir(output_path), [])
+
+    def test_tenant_bindings(self):
+        invalid_tenants = {
+            'No tenants found': {'tenants': []},
+            'needs a name': {'tenants': [{'name': '../acme'}]},
+            'Duplicate tenant name: acme': {'tenants': [{'name': 'acme'}, {'name': 'acme'}]},
+        }
+
+        for message, tenants in invalid_tenants.items():
+            with self.subTest(message=message):
+                with self.assertRaisesRegex(ValueError, message):
+                    load_tenant_bindings(self.write_file('tenants.yaml', tenants))
+
+    def test_bind_parameters(self):
+        parameters = {'database': 'Warehouse', 'table': ['Warehouse', 'PUBLIC', 'ORDERS']}
+
+        self.assertEqual(bind_parameters({'table_id': '${table}', 'name': '${database} orders for $$5'}, parameters), {'table_id': ['Warehouse', 'PUBLIC', 'ORDERS'], 'name': 'Warehouse orders for $5'})
+
+        with self.assertRaisesRegex(ValueError, 'No parameter'):
+            bind_parameters(['${schema}'], parameters)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,105 @@
+"""Tests of writing output exports with metabase_serialization_py.metabase_export.writer."""
+import gzip
+import io
+import os
+import tarfile
+import tempfile
+import unittest
+
+from metabase_serialization_py.metabase_export import ExportOverlay, MetabaseExport, write_serialization_directory, write_serialization_tgz
+from metabase_serialization_py.yaml import parse_yaml
+
+from tests.export_fixtures import ORDERS_CARD, iter_export_members, write_export_tgz
+
+
+def get_raw_members(tar_data):
+    """Returns dict of the raw header and data blocks of each member of an uncompressed tar by member name."""
+
+    raw_members = {}
+
+    with tarfile.open(fileobj=io.BytesIO(tar_data), mode='r:') as tar_file:
+        for member in tar_file:
+            end = member.offset_data + -(-member.size // tarfile.BLOCKSIZE) * tarfile.BLOCKSIZE
+            raw_members[member.name] = tar_data[member.offset:end]
+
+    return raw_members
+
+
+class TestWriter(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        # Long member names get pax headers, which are copied with their member.
+        members = [*iter_export_members(), (f'metabase_data/collections/cards/{"long_name_" * 12}.yaml', {'name': 'Long', 'serdes/meta': [{'model': 'Card', 'id': 'LongName0000000000000'}]}, )]
+        self.export_path = write_export_tgz(os.path.join(self.directory.name, 'export.tgz'), members)
+        self.metabase_export = MetabaseExport(self.export_path)
+        self.member_name = self.metabase_export.index_by_id[ORDERS_CARD]['filename']
+
+        with gzip.open(self.export_path, 'rb') as export_file:
+            self.tar_data = export_file.read()
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def write_tgz(self, export_overlay, threads=1):
+        output_path = os.path.join(self.directory.name, 'output.tgz')
+        counts = write_serialization_tgz(self.export_path, output_path, export_overlay, compresslevel=1, threads=threads)
+
+        with gzip.open(output_path, 'rb') as output_file:
+            return (counts, output_file.read(), )
+
+    def test_unchanged_export_is_copied_byte_for_byte(self):
+        counts, output_data = self.write_tgz(ExportOverlay(self.metabase_export))
+
+        self.assertEqual(output_data, self.tar_data)
+        self.assertEqual(counts['updated'] + counts['created'], 0)
+
+    def test_only_changed_members_are_rewritten(self):
+        export_overlay = ExportOverlay(self.metabase_export)
+        document = {**export_overlay.get_file_data(self.member_name), 'name': 'Renamed'}
+        export_overlay.update(self.member_name, document)
+        export_overlay.create('metabase_data/collections/cards/Created00000000000000_created.yaml', {**document, 'entity_id': 'Created00000000000000'})
+
+        counts, output_data = self.write_tgz(export_overlay)
+        input_members = get_raw_members(self.tar_data)
+        output_members = get_raw_members(output_data)
+
+        self.assertEqual({'updated': counts['updated'], 'created': counts['created']}, {'updated': 1, 'created': 1})
+        self.assertEqual(list(output_members)[:len(input_members)], list(input_members))
+
+        for member_name, raw_member in input_members.items():
+            if member_name != self.member_name:
+                self.assertEqual(output_members[member_name], raw_member, member_name)
+
+        with tarfile.open(fileobj=io.BytesIO(output_data), mode='r:') as tar_file:
+            self.assertEqual(parse_yaml(tar_file.extractfile(self.member_name).read()), document)
+            self.assertEqual(parse_yaml(tar_file.extractfile('metabase_data/collections/cards/Created00000000000000_created.yaml').read())['entity_id'], 'Created00000000000000')
+
+
+    def test_parallel_compression(self):
+        """Output compressed on several threads is the same tar as output compressed on one."""
+
+        export_overlay = ExportOverlay(self.metabase_export)
+        export_overlay.update(self.member_name, {**export_overlay.get_file_data(self.member_name), 'name': 'Renamed'})
+
+        self.assertEqual(self.write_tgz(export_overlay, threads=4), self.write_tgz(export_overlay))
+
+    def test_directory_output(self):
+        export_overlay = ExportOverlay(self.metabase_export)
+        document = {**export_overlay.get_file_data(self.member_name), 'name': 'Renamed'}
+        export_overlay.update(self.member_name, document)
+        output_directory = os.path.join(self.directory.name, 'output')
+
+        write_serialization_directory(self.export_path, output_directory, export_overlay)
+
+        with tarfile.open(fileobj=io.BytesIO(self.tar_data), mode='r:') as tar_file:
+            for member in tar_file:
+                if member.isfile() and member.name != self.member_name:
+                    with open(os.path.join(output_directory, member.name), 'rb') as output_file:
+                        self.assertEqual(output_file.read(), tar_file.extractfile(member).read())
+
+        with open(os.path.join(output_directory, self.member_name), 'rb') as output_file:
+            self.assertEqual(parse_yaml(output_file.read()), document)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,141 @@
+"""Tests of the YAML loaders of metabase_serialization_py.yaml."""
+import unittest
+
+import yaml
+
+from metabase_serialization_py.yaml import CLoader, PyLoader, dump_yaml, parse_yaml
+
+
+# Metabase-style documents: '=' filter operators, column_settings keys holding JSON, timestamps, and nulls.
+METABASE_DOCUMENTS = (
+    """\
+name: Orders by month
+description: null
+entity_id: YEy4vY6tJFF_gDbdL1nOS
+created_at: '2024-01-01T00:00:00Z'
+archived: false
+collection_id: nWJmzqm1NM98rrP9O-2Em
+collection_position: null
+database_id: Sample Database
+table_id:
+- Sample Database
+- PUBLIC
+- ORDERS
+dataset_query:
+  database: Sample Database
+  type: query
+  query:
+    source-table:
+    - Sample Database
+    - PUBLIC
+    - ORDERS
+    filter:
+    - and
+    - - =
+      - - field
+        - - Sample Database
+          - PUBLIC
+          - ORDERS
+          - STATUS
+        - base-type: type/Text
+      - shipped
+    - - '!='
+      - - field
+        - - Sample Database
+          - PUBLIC
+          - ORDERS
+          - TOTAL
+        - null
+      - 0
+    aggregation:
+    - - sum
+      - - field
+        - - Sample Database
+          - PUBLIC
+          - ORDERS
+          - TOTAL
+        - null
+    limit: 2000
+result_metadata:
+- name: TOTAL
+  base_type: type/Float
+  fingerprint:
+    type:
+      type/Number:
+        min: 0.0
+        max: 159.35
+        avg: 56.66
+visualization_settings:
+  column_settings:
+    '["ref",["field",["Sample Database","PUBLIC","ORDERS","TOTAL"],null]]':
+      column_title: Total
+  graph.dimensions:
+  - CREATED_AT
+serdes/meta:
+- model: Card
+  id: YEy4vY6tJFF_gDbdL1nOS
+  label: orders_by_month
+""",
+    """\
+name: Operators
+created_at: 2024-01-01 00:00:00
+operators:
+- =
+- '='
+- ==
+- =~
+- '!='
+values:
+- 1
+- 1.5
+- true
+- ~
+- 0x1F
+- .inf
+""",
+)
+
+
+class TestLoaders(unittest.TestCase):
+    def test_equals_is_a_string(self):
+        """'=' scalars load as strings instead of failing on the YAML value tag."""
+
+        self.assertEqual(parse_yaml('operator: =', PyLoader), {'operator': '='})
+
+    @unittest.skipIf(CLoader is None, 'libyaml is not available')
+    def test_equals_is_a_string_with_libyaml(self):
+        self.assertEqual(parse_yaml('operator: =', CLoader), {'operator': '='})
+
+    @unittest.skipIf(CLoader is None, 'libyaml is not available')
+    def test_loaders_parse_documents_alike(self):
+        """PyLoader and the libyaml CLoader give equal documents for Metabase-style YAML."""
+
+        for document in METABASE_DOCUMENTS:
+            with self.subTest(document=document.splitlines()[0]):
+                self.assertEqual(parse_yaml(document, PyLoader), parse_yaml(document, CLoader))
+
+    def test_dumped_documents_parse_back(self):
+        for document in METABASE_DOCUMENTS:
+            data = parse_yaml(document, PyLoader)
+
+            self.assertEqual(parse_yaml(dump_yaml(data), PyLoader), data)
+
+    def test_safe_loader_keeps_equals_resolver(self):
+        """Removing the '=' resolver from the export loaders leaves yaml.SafeLoader and yaml.CSafeLoader unchanged."""
+
+        loader_classes = [yaml.SafeLoader] + ([yaml.CSafeLoader] if CLoader is not None else [])
+
+        for loader_class in loader_classes:
+            with self.subTest(loader_class=loader_class.__name__):
+                self.assertIn('=', loader_class.yaml_implicit_resolvers)
+
+                with self.assertRaises(yaml.constructor.ConstructorError):
+                    yaml.load('operator: =', Loader=loader_class)
+
+        for loader_class in (PyLoader, CLoader, ):
+            if loader_class is not None:
+                self.assertNotIn('=', loader_class.yaml_implicit_resolvers)
+
+
+if __name__ == '__main__':
+    unittest.main()